@@ -0,0 +1,64 @@
+"""Login throughput vs. bcrypt cost, to pick BCRYPT_ROUNDS / AUTH_HASH_WORKERS for the shift-start burst.
+
+Simulates --sessions users logging in at once, each verifying one password through auth.verify_password
+(the bounded bcrypt pool), and reports logins/sec and per-login latency for each cost.
+
+    python benchmarks/bench_login.py --rounds 10 11 12 13 --sessions 32
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "website"))
+
+import auth  # noqa: E402
+
+
+def login_burst(rounds: int, sessions: int, logins: int) -> dict[str, float]:
+    stored = auth.hash_password("correct horse battery staple", rounds=rounds)
+
+    def login(_: int) -> float:
+        started = time.perf_counter()
+        assert auth.verify_password("correct horse battery staple", stored)
+        return time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=sessions) as sessions_pool:
+        latencies = np.array(list(sessions_pool.map(login, range(logins))))
+    elapsed = time.perf_counter() - started
+    return {"rounds": rounds, "logins": logins, "logins_per_s": logins / elapsed,
+            "p50_ms": float(np.median(latencies) * 1000), "p95_ms": float(np.quantile(latencies, 0.95) * 1000)}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rounds", type=int, nargs="+", default=[10, 11, 12, 13])
+    parser.add_argument("--sessions", type=int, default=32, help="concurrent logins (Streamlit script threads)")
+    parser.add_argument("--logins", type=int, default=64)
+    parser.add_argument("--workers", type=int, help="AUTH_HASH_WORKERS (default: one per core)")
+    parser.add_argument("--output", type=Path, help="write results JSON here")
+    args = parser.parse_args()
+
+    if args.workers:
+        os.environ["AUTH_HASH_WORKERS"] = str(args.workers)
+    workers = auth._hash_executor()._max_workers
+    results = []
+    print(f"{os.cpu_count()} cores, {workers} hash workers, {args.sessions} concurrent sessions")
+    print(f"{'rounds':>6} {'logins/s':>10} {'p50':>10} {'p95':>10}")
+    for rounds in args.rounds:
+        r = login_burst(rounds, args.sessions, args.logins)
+        results.append(r)
+        print(f"{rounds:>6} {r['logins_per_s']:>10.1f} {r['p50_ms']:>8.0f}ms {r['p95_ms']:>8.0f}ms")
+    if args.output:
+        args.output.write_text(json.dumps({"cores": os.cpu_count(), "workers": workers,
+                                           "sessions": args.sessions, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
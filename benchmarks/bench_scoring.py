@@ -0,0 +1,69 @@
+"""Scalar _fit_score loop vs. the vectorized fit_score_matrix.
+
+    python benchmarks/bench_scoring.py --clients 200 --listings 500
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "website"))
+
+from agent import _fit_score  # noqa: E402
+from scoring import fit_score_matrix, top_k  # noqa: E402
+
+
+def synthetic_profiles(n: int, rng: np.random.Generator) -> list[dict]:
+    return [
+        {
+            "income": float(rng.uniform(0, 400_000)),
+            "monthly_debt": float(rng.uniform(0, 4_000)),
+            "savings": float(rng.uniform(0, 250_000)),
+            "credit_score": int(rng.integers(300, 851)),
+        }
+        for _ in range(n)
+    ]
+
+
+def synthetic_listings(n: int, rng: np.random.Generator) -> list[dict]:
+    return [
+        {
+            "price": float(rng.choice([0.0, *rng.uniform(80_000, 2_000_000, 9)])),
+            "hoa_monthly": float(rng.choice([0.0, 0.0, 150.0, 425.0])),
+        }
+        for _ in range(n)
+    ]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--listings", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    profiles = synthetic_profiles(args.clients, rng)
+    listings = synthetic_listings(args.listings, rng)
+
+    start = time.perf_counter()
+    scalar = np.array([[_fit_score(p, l) for l in listings] for p in profiles])
+    scalar_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    matrix = fit_score_matrix(profiles, listings)
+    top_k(matrix, 10)
+    vector_s = time.perf_counter() - start
+
+    mismatches = int((scalar != matrix).sum())
+    print(f"pairs:       {scalar.size:,}")
+    print(f"scalar loop: {scalar_s * 1000:9.1f} ms")
+    print(f"vectorized:  {vector_s * 1000:9.1f} ms  ({scalar_s / vector_s:,.0f}x)")
+    print(f"mismatches:  {mismatches}")
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
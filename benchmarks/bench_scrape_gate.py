@@ -0,0 +1,107 @@
+"""Upstream scrape load under concurrent analyses, to tune SCRAPE_MAX_CONCURRENCY / SCRAPE_RATE_PER_MINUTE.
+
+Simulates --sessions users analyzing listings at once, drawn from --urls distinct listings in --cities cities
+(so many of them overlap), against a fake homeharvest that takes --latency seconds per call. Reports how many
+calls reached "upstream", the most that ran at once, and the wall time.
+
+    python benchmarks/bench_scrape_gate.py --sessions 32 --urls 8 --cities 2 --rate 120
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "website"))
+os.environ.setdefault("CLOSERAI_CACHE_DIR", tempfile.mkdtemp(prefix="closerai-bench-"))
+
+from fixtures import synthetic_property_frame  # noqa: E402
+
+STREETS = ["Maple Ave", "Oak St", "Cedar Ln", "Pine Dr", "Elm St", "Birch Rd", "Willow Way", "Aspen Ct"]
+CITIES = [("Austin", "TX"), ("Denver", "CO"), ("Raleigh", "NC"), ("Tampa", "FL")]
+
+
+class FakeUpstream:
+    """Stands in for homeharvest.scrape_property; counts calls and peak concurrency."""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.calls = 0
+        self.active = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, location: str, listing_type=None, **kwargs):
+        with self._lock:
+            self.calls += 1
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        try:
+            time.sleep(self.latency)
+            if "," in location:
+                return synthetic_property_frame(location, 200)
+            # A listing address ("100 Maple Ave Austin TX 78701"): one row, in the URL's city
+            city, state = location.split()[-3:-1]
+            return synthetic_property_frame(location, 1).assign(city=city, state=state)
+        finally:
+            with self._lock:
+                self.active -= 1
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=32, help="concurrent analyses")
+    parser.add_argument("--urls", type=int, default=8, help="distinct listings the sessions pick from")
+    parser.add_argument("--cities", type=int, default=2, choices=range(1, len(CITIES) + 1))
+    parser.add_argument("--latency", type=float, default=0.5, help="seconds per upstream call")
+    parser.add_argument("--concurrency", type=int, help="SCRAPE_MAX_CONCURRENCY")
+    parser.add_argument("--rate", type=float, help="SCRAPE_RATE_PER_MINUTE")
+    parser.add_argument("--burst", type=int, help="SCRAPE_BURST")
+    args = parser.parse_args()
+
+    for name, value in (("SCRAPE_MAX_CONCURRENCY", args.concurrency), ("SCRAPE_RATE_PER_MINUTE", args.rate),
+                        ("SCRAPE_BURST", args.burst)):
+        if value is not None:
+            os.environ[name] = str(value)
+
+    import ZillowScraper
+    from scrape_gate import get_scrape_gate
+
+    upstream = FakeUpstream(args.latency)
+    ZillowScraper.scrape_property = upstream
+    gate = get_scrape_gate()
+
+    urls = []
+    for i in range(args.urls):
+        city, state = CITIES[i % args.cities]
+        urls.append(f"https://www.zillow.com/homedetails/{100 + i}-{STREETS[i % len(STREETS)].replace(' ', '-')}-"
+                    f"{city}-{state}-78701/{40_000_000 + i}_zpid/")
+    picks = np.random.default_rng(0).integers(0, len(urls), args.sessions)
+
+    def analyze(i: int) -> float:
+        started = time.perf_counter()
+        listing = ZillowScraper.scrape_listing(urls[picks[i]], force_refresh=True)
+        ZillowScraper.get_area_comps(listing["city"], listing["state"], max_results=5, subject=listing)
+        return time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.sessions) as sessions:
+        latencies = np.array(list(sessions.map(analyze, range(args.sessions))))
+    elapsed = time.perf_counter() - started
+
+    # Without coalescing every session makes a listing call and, for a cold city, a market call
+    print(f"{args.sessions} sessions over {args.urls} listings in {args.cities} cities "
+          f"(gate: {gate.max_concurrency} concurrent, {gate.rate_per_minute:g}/min, burst {gate.burst})")
+    print(f"upstream calls   {upstream.calls} (up to {2 * args.sessions} uncoalesced)")
+    print(f"peak concurrent  {upstream.peak}")
+    print(f"wall time        {elapsed:.2f}s  (per-analysis p50 {np.median(latencies):.2f}s, "
+          f"p95 {np.quantile(latencies, 0.95):.2f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+"""Record/replay fixtures for the two network dependencies: homeharvest.scrape_property and OpenAI.
+
+In "record" mode the real calls go through and their results are saved under the fixture directory.
+In "replay" mode the saved results are served instead. A call with no recording gets a deterministic
+synthetic result, so the suite also runs on a fresh checkout, with no network and no API key.
+"""
+import hashlib
+import json
+import time
+import zlib
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Callable
+
+import numpy as np
+import pandas as pd
+
+FIXTURE_DIR = Path(__file__).parent / "fixtures"
+
+
+def _key(payload: dict[str, Any]) -> str:
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:24]
+
+
+def _seed(text: str) -> int:
+    return zlib.crc32(text.encode("utf-8"))
+
+
+# --- homeharvest ---
+
+_STREETS = ("Oak St", "Maple Ave", "Cedar Ln", "Pine Dr", "Elm St", "Lakeview Rd", "Hillcrest Blvd", "Sunset Way")
+_STATUSES = ("FOR_SALE", "FOR_SALE", "FOR_SALE", "PENDING", "SOLD")
+
+
+def synthetic_property_frame(location: str, rows: int | None = None) -> pd.DataFrame:
+    """A homeharvest-shaped frame: a few rows for a street address, a full market for "City, ST"."""
+    rng = np.random.default_rng(_seed(location))
+    parts = [p.strip() for p in location.split(",")]
+    is_market = len(parts) == 2 and len(parts[1]) == 2
+    city, state = (parts[0], parts[1]) if is_market else ("Austin", "TX")
+    n = rows or (800 if is_market else 3)
+
+    numbers = rng.integers(100, 9999, n)
+    if not is_market and location[:1].isdigit():
+        numbers[0] = int(location.split()[0].split("-")[0])
+    streets = [f"{num} {_STREETS[i % len(_STREETS)]}" for i, num in enumerate(numbers)]
+    zpids = rng.integers(10_000_000, 99_999_999, n)
+    sqft = rng.integers(600, 4500, n)
+    return pd.DataFrame({
+        "property_url": [f"https://www.zillow.com/homedetails/{s.replace(' ', '-')}/{z}_zpid/"
+                         for s, z in zip(streets, zpids)],
+        "status": rng.choice(_STATUSES, n),
+        "street": streets,
+        "city": city,
+        "state": state,
+        "zip_code": rng.integers(10000, 99999, n).astype(str),
+        "list_price": np.where(rng.random(n) < 0.03, np.nan, (sqft * rng.uniform(150, 450, n)).round(-3)),
+        "beds": rng.integers(1, 6, n),
+        "full_baths": rng.integers(1, 4, n),
+        "sqft": sqft,
+        "year_built": rng.integers(1920, 2024, n),
+        "hoa_fee": np.where(rng.random(n) < 0.6, 0.0, rng.uniform(50, 600, n).round()),
+        "lot_sqft": rng.integers(2000, 20000, n),
+        "days_on_mls": rng.integers(0, 180, n),
+        "text": ["Bright home with updated kitchen, open floor plan and a large backyard. " * 6] * n,
+    })
+
+
+class ScrapeFixtures:
+    """Stands in for homeharvest.scrape_property."""
+
+    def __init__(self, mode: str = "replay", directory: Path = FIXTURE_DIR, real: Callable | None = None):
+        self.mode = mode
+        self.directory = directory / "scrape"
+        self.real = real
+        self.recorded = 0
+        self.synthetic = 0
+
+    def __call__(self, location: str, listing_type: list[str] | str | None = None, **kwargs: Any) -> pd.DataFrame:
+        types = sorted(listing_type) if isinstance(listing_type, list) else listing_type
+        path = self.directory / f"{_key({'location': location, 'listing_type': types, **kwargs})}.pkl.gz"
+        if self.mode == "record":
+            data = self.real(location=location, listing_type=listing_type, **kwargs)
+            self.directory.mkdir(parents=True, exist_ok=True)
+            data.to_pickle(path)
+            self.recorded += 1
+            return data
+        if path.exists():
+            self.recorded += 1
+            return pd.read_pickle(path)
+        self.synthetic += 1
+        return synthetic_property_frame(location)
+
+
+# --- OpenAI ---
+
+def _chunk(content: str | None = None, usage: dict[str, int] | None = None) -> SimpleNamespace:
+    choices = [] if content is None else [SimpleNamespace(delta=SimpleNamespace(content=content))]
+    return SimpleNamespace(choices=choices, usage=SimpleNamespace(**usage) if usage else None)
+
+
+def synthetic_report_chunks(prompt: str, words: int = 650) -> list[str]:
+    """~650 words of report markdown, split into ~4-word deltas like a streamed completion."""
+    rng = np.random.default_rng(_seed(prompt))
+    vocab = ("the property", "monthly carry", "HOA", "credit score", "comps", "budget", "financing",
+             "neighborhood", "inspection", "roof", "verdict", "CONSIDER", "price per sqft", "risk")
+    text = []
+    for section in ("EXECUTIVE SUMMARY", "FINANCIAL FEASIBILITY", "LIFESTYLE & SPECS MATCH", "MARKET ANALYSIS",
+                    "PROPERTY RISK WATCHLIST"):
+        text.append(f"\n\n## {section}\n\n")
+        text.extend(f"{w} " for w in rng.choice(vocab, words // 5))
+    words_out = "".join(text).split(" ")
+    return [" ".join(words_out[i:i + 4]) + " " for i in range(0, len(words_out), 4)]
+
+
+class _Completions:
+    def __init__(self, fixtures: "LLMFixtures"):
+        self.fixtures = fixtures
+
+    def create(self, **kwargs: Any):
+        return self.fixtures.complete(kwargs)
+
+
+class LLMFixtures:
+    """Stands in for the OpenAI client returned by llm_client.get_openai_client().
+
+    Recordings are keyed by model + prompt. Prompts change whenever the prompt code does, so a missing key
+    falls back to the other recordings in turn, then to a synthetic report of similar size.
+    latency="recorded" sleeps the recorded time-to-first-token and generation time; "none" replays instantly.
+    """
+
+    def __init__(self, mode: str = "replay", directory: Path = FIXTURE_DIR, real: Callable | None = None,
+                 latency: str = "none"):
+        self.mode = mode
+        self.directory = directory / "llm"
+        self.real = real
+        self.latency = latency
+        self.chat = SimpleNamespace(completions=_Completions(self))
+        self.exact = 0
+        self.fallback = 0
+        self.synthetic = 0
+        self._others = sorted(self.directory.glob("*.json")) if self.directory.exists() else []
+
+    def complete(self, request: dict[str, Any]):
+        prompt = request["messages"][-1]["content"]
+        path = self.directory / f"{_key({'model': request['model'], 'prompt': prompt})}.json"
+        if self.mode == "record":
+            return self._record(request, path)
+        if path.exists():
+            self.exact += 1
+            recording = json.loads(path.read_text())
+        elif self._others:
+            self.fallback += 1
+            recording = json.loads(self._others[self.fallback % len(self._others)].read_text())
+        else:
+            self.synthetic += 1
+            chunks = synthetic_report_chunks(prompt)
+            recording = {"chunks": chunks, "ttft_s": 0.8, "total_s": 12.0,
+                         "usage": {"prompt_tokens": len(prompt) // 4,
+                                   "completion_tokens": sum(len(c) for c in chunks) // 4}}
+        return self._replay(recording)
+
+    def _replay(self, recording: dict[str, Any]):
+        chunks = recording["chunks"]
+        delay = self.latency == "recorded"
+        per_chunk = max(recording["total_s"] - recording["ttft_s"], 0) / max(len(chunks), 1)
+        if delay:
+            time.sleep(recording["ttft_s"])
+        for content in chunks:
+            yield _chunk(content)
+            if delay:
+                time.sleep(per_chunk)
+        yield _chunk(usage=recording.get("usage"))
+
+    def _record(self, request: dict[str, Any], path: Path):
+        started = time.perf_counter()
+        chunks: list[str] = []
+        ttft = None
+        usage = None
+        for chunk in self.real().chat.completions.create(**request):
+            if getattr(chunk, "usage", None):
+                usage = {"prompt_tokens": chunk.usage.prompt_tokens,
+                         "completion_tokens": chunk.usage.completion_tokens}
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                ttft = ttft if ttft is not None else time.perf_counter() - started
+                chunks.append(delta)
+            yield chunk
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps({"model": request["model"], "chunks": chunks, "usage": usage,
+                                    "ttft_s": ttft or 0.0, "total_s": time.perf_counter() - started}, indent=1))
+        self.exact += 1
+
+    def stats(self) -> dict[str, int]:
+        return {"exact": self.exact, "fallback": self.fallback, "synthetic": self.synthetic}
@@ -0,0 +1,338 @@
+"""Offline benchmark suite for the analysis pipeline and the history queries.
+
+Scraper and OpenAI calls are replayed from benchmarks/fixtures (see fixtures.py), and Mongo is mongomock
+seeded at a realistic scale (or a throwaway database on a local mongod with --mongo-uri).
+The results are written as JSON, and can be compared against an earlier run:
+
+    pip install mongomock
+    python benchmarks/run_benchmarks.py --output bench-main.json
+    python benchmarks/run_benchmarks.py --compare bench-main.json
+    python benchmarks/run_benchmarks.py --record --only scrape   # refresh fixtures (network + OPENAI_API_KEY)
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Callable
+
+import numpy as np
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR.parent / "website"))
+
+# The on-disk caches must not touch (or be warmed by) the developer's real cache, so this is set before any import
+os.environ.setdefault("CLOSERAI_CACHE_DIR", tempfile.mkdtemp(prefix="closerai-bench-"))
+
+from bench_scoring import synthetic_listings, synthetic_profiles  # noqa: E402
+from fixtures import FIXTURE_DIR, LLMFixtures, ScrapeFixtures  # noqa: E402
+
+CITIES = [("Austin", "TX"), ("Denver", "CO"), ("Raleigh", "NC"), ("Tampa", "FL"), ("Boise", "ID"),
+          ("Columbus", "OH"), ("Phoenix", "AZ"), ("Nashville", "TN"), ("Portland", "OR"), ("Madison", "WI"),
+          ("Richmond", "VA"), ("Omaha", "NE")]
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BENCH_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def measure(fn: Callable[[int], Any], repeat: int, warmup: int = 1,
+            setup: Callable[[int], Any] | None = None) -> dict[str, float]:
+    """Calls fn(i) repeat times (after warmup untimed calls). setup(i) runs before each call, untimed."""
+    for i in range(warmup):
+        if setup:
+            setup(i)
+        fn(i)
+    samples = []
+    for i in range(repeat):
+        if setup:
+            setup(i)
+        started = time.perf_counter()
+        fn(i)
+        samples.append((time.perf_counter() - started) * 1000)
+    values = np.array(samples)
+    return {"n": repeat, "mean_ms": float(values.mean()), "p50_ms": float(np.median(values)),
+            "p95_ms": float(np.quantile(values, 0.95)), "min_ms": float(values.min()), "max_ms": float(values.max())}
+
+
+# --- backend ---
+
+def open_database(uri: str | None):
+    if uri:
+        from pymongo import MongoClient
+        client = MongoClient(uri)
+        client.drop_database("closerai_bench")
+        return client["closerai_bench"]
+    try:
+        import mongomock
+    except ImportError:
+        sys.exit("mongomock is required for the default backend: pip install mongomock (or pass --mongo-uri)")
+    return mongomock.MongoClient()["closerai_bench"]
+
+
+def seed(db, clients: int, analyses: int, hot_share: float, rng: np.random.Generator,
+         legacy_format: bool = False) -> dict[str, Any]:
+    """One realtor with `clients` clients and `analyses` saved analyses; the first client holds hot_share of them.
+
+    Analyses are stored the way save_analysis stores them (report_store.py), or in the original single-document
+    format with legacy_format.
+    """
+    from bson import ObjectId
+    from report_store import report_document, report_hash, slim_analysis
+
+    realtor_id = ObjectId()
+    now = datetime.now(timezone.utc)
+    profiles = synthetic_profiles(clients, rng)
+    client_docs = [{
+        "_id": ObjectId(), "realtor_id": realtor_id, "name": f"Client {i}", "email": f"client{i}@example.com",
+        "phone": "555-0100", "profile": profile, "preferences": "Quiet street, good schools, home office.",
+        "notes": "Pre-approved; flexible on closing date.",
+        "created_at": now - timedelta(minutes=i), "updated_at": now - timedelta(minutes=i),
+    } for i, profile in enumerate(profiles)]
+    db["clients"].insert_many(client_docs)
+
+    hot = int(analyses * hot_share)
+    owners = np.concatenate([np.zeros(hot, dtype=int), rng.integers(1, clients, analyses - hot)])
+    body = "The property is a reasonable fit for the budget. " * 80
+    batch, reports = [], []
+    for i, owner in enumerate(owners):
+        created = now - timedelta(seconds=int(i) * 37)
+        url = f"https://www.zillow.com/homedetails/{1000 + i}-Oak-St-Austin-TX-78701/{20_000_000 + i}_zpid/"
+        listing = {"street": f"{1000 + i} Oak St", "city": "Austin", "state": "TX", "price": 450_000.0,
+                   "beds": 3, "baths": 2.0, "sqft": 1800, "year_built": 1998, "hoa_monthly": 0.0,
+                   "status": "FOR_SALE", "property_url": "", "description": "Bright home with updated kitchen. " * 8}
+        report = f"## EXECUTIVE SUMMARY\n\n**{listing['street']}**\n\n{body}"
+        result = {"fit_score": int(rng.integers(1, 101)), "estimated_monthly_cost": 3100.0,
+                  "max_recommended_monthly": 4200.0, "report_markdown": report, "model_used": "gpt-4o",
+                  "created_at": created}
+        if legacy_format:
+            batch.append({"realtor_id": realtor_id, "client_id": client_docs[owner]["_id"], "url": url,
+                          "listing": listing, "result": result, "created_at": created, "updated_at": created})
+        else:
+            report_id = report_hash(report)
+            reports.append({"_id": report_id, **report_document(report), "refs": 1})
+            batch.append(slim_analysis(realtor_id, client_docs[owner]["_id"], url, listing, result, report_id,
+                                       created))
+        if len(batch) == 1000:
+            db["analyses"].insert_many(batch)
+            if reports:
+                db["reports"].insert_many(reports)
+            batch, reports = [], []
+    if batch:
+        db["analyses"].insert_many(batch)
+    if reports:
+        db["reports"].insert_many(reports)
+    return {"realtor_id": realtor_id, "hot_client": client_docs[0], "clients": client_docs}
+
+
+# --- suites ---
+
+def bench_scrape(r: dict, args) -> None:
+    from ZillowScraper import get_area_comps, get_comps_store, scrape_listing
+
+    urls = [f"https://www.zillow.com/homedetails/{2000 + i}-Maple-Ave-Austin-TX-78701/{30_000_000 + i}_zpid/"
+            for i in range(args.repeat)]
+    r["scrape_listing.uncached"] = measure(lambda i: scrape_listing(urls[i], force_refresh=True), args.repeat)
+    r["scrape_listing.cached"] = measure(lambda i: scrape_listing(urls[i]), args.repeat)
+
+    subject = scrape_listing(urls[0])
+    # Each cold call is a city the comps store has never loaded: fetch + normalize + store + rank
+    cold = min(args.repeat, len(CITIES) - 1)
+    r["get_area_comps.cold_market"] = measure(
+        lambda i: get_area_comps(*CITIES[i + 1], max_results=5, subject={**subject, "city": CITIES[i + 1][0]}),
+        cold, warmup=0)
+    get_comps_store().ensure_market(*CITIES[0])
+    r["get_area_comps.warm"] = measure(lambda i: get_area_comps(*CITIES[0], max_results=5, subject=subject),
+                                       args.repeat)
+
+
+def bench_scoring(r: dict, args, seeded: dict) -> None:
+    from agent import _build_prompt, _fit_score
+    from scoring import fit_score_matrix, top_k
+
+    rng = np.random.default_rng(args.seed)
+    profiles = [c["profile"] for c in seeded["clients"]]
+    listings = synthetic_listings(500, rng)
+    r["fit_score.scalar_clients_x_1"] = measure(lambda i: [_fit_score(p, listings[i]) for p in profiles],
+                                                args.repeat)
+    r["fit_score.matrix_clients_x_500"] = measure(lambda i: top_k(fit_score_matrix(profiles, listings), 10),
+                                                  args.repeat)
+
+    from ZillowScraper import get_area_comps
+    listing = {"street": "123 Oak St", "city": "Austin", "state": "TX", "price": 525_000.0, "beds": 3,
+               "baths": 2.0, "sqft": 1900, "year_built": 1994, "hoa_monthly": 85.0}
+    comps = get_area_comps("Austin", "TX", max_results=5, subject=listing)
+    r["build_prompt"] = measure(lambda i: _build_prompt(seeded["clients"][i], listing, comps), args.repeat)
+
+
+def bench_report(r: dict, args, seeded: dict) -> None:
+    from agent import generate_listing_report
+    from ZillowScraper import get_area_comps
+
+    listing = {"street": "77 Cedar Ln", "city": "Austin", "state": "TX", "price": 610_000.0, "beds": 4,
+               "baths": 3.0, "sqft": 2400, "year_built": 2006, "hoa_monthly": 40.0}
+    comps = get_area_comps("Austin", "TX", max_results=5, subject=listing)
+    clients = seeded["clients"]
+    r["generate_listing_report.llm"] = measure(
+        lambda i: generate_listing_report(clients[i], listing, comps, regenerate=True), args.repeat)
+    r["generate_listing_report.cached"] = measure(
+        lambda i: generate_listing_report(clients[i], listing, comps), args.repeat)
+
+    # The same five homes as one comparison call vs. five single-listing reports
+    from agent import stream_comparison_report
+    shortlist = [{**listing, "street": f"{n} Cedar Ln", "price": listing["price"] + n * 1000} for n in range(5)]
+    r["comparison_report.5_listings"] = measure(
+        lambda i: list(stream_comparison_report(clients[i], shortlist, [comps] * 5, regenerate=True)), args.repeat)
+    r["listing_reports.5_listings"] = measure(
+        lambda i: [generate_listing_report(clients[i], home, comps, regenerate=True) for home in shortlist],
+        args.repeat)
+
+
+def bench_history(r: dict, args, seeded: dict) -> None:
+    from data_access import get_analysis_page, get_analysis_report, get_clients, get_data_cache
+
+    cache = get_data_cache()
+    realtor_id = seeded["realtor_id"]
+    client_id = seeded["hot_client"]["_id"]
+    cold = lambda i: cache.clear()  # noqa: E731
+
+    r["history.get_clients"] = measure(lambda i: get_clients(realtor_id), args.repeat, setup=cold)
+    r["history.first_page"] = measure(lambda i: get_analysis_page(realtor_id, client_id), args.repeat, setup=cold)
+
+    # A cursor deep into the hot client's history, as if the realtor paged back a long way
+    items, after = [], None
+    for _ in range(args.deep_pages):
+        items, more = get_analysis_page(realtor_id, client_id, after=after)
+        if not more:
+            break
+        after = (items[-1]["created_at"], items[-1]["_id"])
+    r["history.deep_page"] = measure(lambda i: get_analysis_page(realtor_id, client_id, after=after), args.repeat,
+                                     setup=cold)
+    r["history.open_report"] = measure(lambda i: get_analysis_report(items[i % len(items)]["_id"]), args.repeat,
+                                       setup=cold)
+    r["history.first_page.cached"] = measure(lambda i: get_analysis_page(realtor_id, client_id), args.repeat)
+
+
+SUITES = ("scrape", "scoring", "report", "history")
+
+
+def compare(output: dict[str, Any], baseline_path: Path, threshold: float) -> int:
+    base = json.loads(baseline_path.read_text())
+    for field in ("backend", "mode", "llm_latency", "scale", "analysis_format"):
+        if base["meta"].get(field) != output["meta"][field]:
+            print(f"\nnote: {field} differs from the baseline ({base['meta'].get(field)} vs {output['meta'][field]})")
+    baseline, results = base["results"], output["results"]
+    regressions = 0
+    print(f"\n{'benchmark':38} {'base p50':>11} {'p50':>11} {'change':>8}")
+    for name, stats in results.items():
+        old = baseline.get(name)
+        if not old:
+            print(f"{name:38} {'-':>11} {stats['p50_ms']:>9.2f}ms {'new':>8}")
+            continue
+        change = stats["p50_ms"] / old["p50_ms"] - 1 if old["p50_ms"] else 0.0
+        flag = " !" if change > threshold else ""
+        regressions += bool(flag)
+        print(f"{name:38} {old['p50_ms']:>9.2f}ms {stats['p50_ms']:>9.2f}ms {change:>+7.0%}{flag}")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Offline benchmarks with replayed scraper/LLM fixtures.")
+    parser.add_argument("--only", nargs="*", choices=SUITES, default=list(SUITES))
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--analyses", type=int, default=10_000)
+    parser.add_argument("--hot-share", type=float, default=0.2, help="share of analyses owned by one client")
+    parser.add_argument("--legacy-format", action="store_true",
+                        help="seed analyses in the original single-document format (to compare against)")
+    parser.add_argument("--deep-pages", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--mongo-uri", help="local mongod to use instead of mongomock (database closerai_bench)")
+    parser.add_argument("--fixtures", type=Path, default=FIXTURE_DIR)
+    parser.add_argument("--record", action="store_true", help="call the real scraper/OpenAI and save fixtures")
+    parser.add_argument("--llm-latency", choices=("none", "recorded"), default="none")
+    parser.add_argument("--output", type=Path, help="write results JSON here")
+    parser.add_argument("--compare", type=Path, help="baseline results JSON to diff against")
+    parser.add_argument("--threshold", type=float, default=0.25, help="p50 slowdown that counts as a regression")
+    args = parser.parse_args()
+
+    mode = "record" if args.record else "replay"
+    if mode == "replay":
+        os.environ.setdefault("OPENAI_API_KEY", "replay")  # only has to be truthy; requests never leave the process
+        # Replayed scrapes never reach realtor.com, so the scrape gate's rate limit would only measure itself
+        os.environ.setdefault("SCRAPE_RATE_PER_MINUTE", "1000000")
+
+    import agent
+    import database
+    import ZillowScraper
+    from db_indexes import ensure_indexes
+    from llm_client import get_openai_client
+
+    scrape = ScrapeFixtures(mode, args.fixtures, real=ZillowScraper.scrape_property)
+    llm = LLMFixtures(mode, args.fixtures, real=get_openai_client, latency=args.llm_latency)
+    ZillowScraper.scrape_property = scrape
+    agent.get_openai_client = lambda: llm
+
+    db = open_database(args.mongo_uri)
+    ensure_indexes(db)
+    database.get_database = lambda: db
+    rng = np.random.default_rng(args.seed)
+    started = time.perf_counter()
+    seeded = seed(db, args.clients, args.analyses, args.hot_share, rng, legacy_format=args.legacy_format)
+    seed_s = time.perf_counter() - started
+
+    results: dict[str, Any] = {}
+    if "scrape" in args.only:
+        bench_scrape(results, args)
+    if "scoring" in args.only:
+        bench_scoring(results, args, seeded)
+    if "report" in args.only:
+        bench_report(results, args, seeded)
+    if "history" in args.only:
+        bench_history(results, args, seeded)
+
+    output = {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "backend": "mongod" if args.mongo_uri else "mongomock",
+            "mode": mode,
+            "llm_latency": args.llm_latency,
+            "scale": {"clients": args.clients, "analyses": args.analyses, "hot_share": args.hot_share,
+                      "seed": args.seed},
+            "analysis_format": "legacy" if args.legacy_format else "compact",
+            "repeat": args.repeat,
+            "seed_s": round(seed_s, 3),
+            "fixtures": {"scrape": {"recorded": scrape.recorded, "synthetic": scrape.synthetic}, "llm": llm.stats()},
+        },
+        "results": results,
+    }
+
+    print(f"{'benchmark':38} {'p50':>11} {'p95':>11} {'n':>4}")
+    for name, stats in results.items():
+        print(f"{name:38} {stats['p50_ms']:>9.2f}ms {stats['p95_ms']:>9.2f}ms {stats['n']:>4}")
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(json.dumps(output, indent=2))
+        print(f"\nwrote {args.output}")
+    if args.compare:
+        regressions = compare(output, args.compare, args.threshold)
+        if regressions:
+            print(f"\n{regressions} benchmark(s) slower than the baseline by more than {args.threshold:.0%}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
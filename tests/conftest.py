@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# The app's modules are flat files in website/, imported by bare name as when Streamlit runs app.py
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "website"))
@@ -0,0 +1,44 @@
+from datetime import datetime, timezone
+
+import mongomock
+import pytest
+from bson import ObjectId
+
+import database
+from db_indexes import check_query_plans, ensure_indexes
+
+
+@pytest.fixture
+def db(monkeypatch):
+    db = mongomock.MongoClient()["realtor_db"]
+    monkeypatch.setattr(database, "get_database", lambda: db)
+    assert ensure_indexes(db) == []
+    return db
+
+
+def test_seeding_after_ensure_indexes(db):
+    # Documents without the partial unique indexes' fields (job_id, active_key) must not collide
+    now = datetime.now(timezone.utc)
+    realtor_id, client_id = ObjectId(), ObjectId()
+    db["analyses"].insert_many([{"realtor_id": realtor_id, "client_id": client_id, "url": f"https://example.com/{i}",
+                                 "created_at": now, "updated_at": now} for i in range(3)])
+    db["jobs"].insert_many([{"realtor_id": realtor_id, "client_id": client_id, "status": "done",
+                             "created_at": now} for _ in range(3)])
+    assert db["analyses"].count_documents({}) == 3
+    assert db["jobs"].count_documents({}) == 3
+
+
+def test_save_analysis_after_ensure_indexes(db):
+    from data_access import save_analysis
+
+    realtor_id, client_id, job_id = ObjectId(), ObjectId(), ObjectId()
+    report = {"report_markdown": "# Report", "fit_score": 80}
+    save_analysis(realtor_id, client_id, "https://example.com/a", {"street": "1 Main St"}, report)
+    save_analysis(realtor_id, client_id, "https://example.com/b", {"street": "2 Main St"}, report)
+    first = save_analysis(realtor_id, client_id, "https://example.com/c", {}, report, job_id=job_id)
+    assert save_analysis(realtor_id, client_id, "https://example.com/c", {}, report, job_id=job_id) == first
+    assert db["analyses"].count_documents({}) == 3
+
+
+def test_hot_queries_have_indexes(db):
+    assert all(r["uses_index"] for r in check_query_plans(db))
@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+from bson import ObjectId
+
+from matcher import ClientBudgetIndex, match_listings
+from text_index import build_index
+
+FEATURES = ["open floor plan", "quiet cul-de-sac", "pool and spa", "granite kitchen", "big backyard", "new roof",
+            "walk to park", "two car garage", "mountain views", "hardwood floors"]
+
+
+def _market(rows: int = 40) -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    return pd.DataFrame({
+        "property_url": [f"https://example.com/{i}" for i in range(rows)],
+        "status": "for_sale",
+        "price": rng.integers(250_000, 600_000, rows).astype(float),
+        "hoa_monthly": 0.0,
+        "description": [" and ".join(rng.choice(FEATURES, 3, replace=False)) for _ in range(rows)],
+    })
+
+
+def _clients() -> ClientBudgetIndex:
+    # Mid-range scores, so the lifestyle points show instead of being clipped at 100
+    profile = {"income": 250_000, "monthly_debt": 500, "savings": 10_000, "credit_score": 700}
+    return ClientBudgetIndex([
+        {"_id": ObjectId(), "realtor_id": ObjectId(), "profile": profile,
+         "preferences": "quiet cul-de-sac with a pool, open floor plan, hardwood floors"},
+        {"_id": ObjectId(), "realtor_id": ObjectId(), "profile": profile, "preferences": "mountain views"},
+    ])
+
+
+def _scores(matches: list[tuple[int, int, int]]) -> dict[tuple[int, int], int]:
+    return {(pos, client): score for pos, client, score in matches}
+
+
+def test_single_row_batch_matches_like_the_full_market():
+    market = _market()
+    clients = _clients()
+    market_text_index = build_index(market["description"].tolist())
+    full = _scores(match_listings(market, clients, threshold=0, market_text_index=market_text_index)[0])
+    for pos in range(len(market)):
+        batch = market.iloc[[pos]].reset_index(drop=True)
+        single = _scores(match_listings(batch, clients, threshold=0, market_text_index=market_text_index)[0])
+        assert single == {(0, client): full[(pos, client)] for client in range(len(clients.clients))}
+
+
+def test_without_a_market_index_the_batch_is_its_own_index():
+    market = _market()
+    clients = _clients()
+    assert match_listings(market, clients, threshold=0)[0] == \
+        match_listings(market, clients, threshold=0, market_text_index=build_index(market["description"].tolist()))[0]
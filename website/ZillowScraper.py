@@ -1,8 +1,18 @@
 import re
+import time
 from typing import Any
 import pandas as pd
 from homeharvest import scrape_property
 
+from comps_engine import rank_comps
+from comps_store import CompsStore
+from listing_cache import get_listing_cache, make_cache_key
+from listing_store import get_listing_store
+from metrics import record_cache, timed
+from scrape_gate import SingleFlight, get_scrape_gate
+from settings import get_setting
+from text_index import market_index, preference_text, to_match, top_matches
+
 def extract_address_from_url(url: str) -> str | None:
     match = re.search(r"/(?:homedetails|realestateandhomes-detail)/([^/]+)", url)
     if not match: return None
@@ -13,33 +23,96 @@ def extract_zpid_from_url(url: str) -> str | None:
     match = re.search(r"/(\d+)_zpid/?", url)
     return match.group(1) if match else None
 
-def _safe_float(value: Any, default: float = 0.0) -> float:
-    try:
-        return float(value) if value is not None and not pd.isna(value) else default
-    except: return default
+# Output field -> (source column, default when the column is missing)
+_TEXT_FIELDS = {
+    "street": ("street", "Unknown"),
+    "city": ("city", "Unknown"),
+    "state": ("state", "Unknown"),
+}
+_FLOAT_FIELDS = {"price": "list_price", "baths": "full_baths", "hoa_monthly": "hoa_fee"}
+_INT_FIELDS = {"beds": "beds", "sqft": "sqft", "year_built": "year_built"}
+LISTING_FIELDS = ["street", "city", "state", "price", "beds", "baths", "sqft",
+                  "year_built", "hoa_monthly", "status", "property_url", "description"]
+
+
+def _text_column(data: pd.DataFrame, column: str, default: str) -> pd.Series:
+    if column not in data:
+        return pd.Series(default, index=data.index, dtype=object)
+    return data[column].astype(str)
+
+
+def _numeric_column(data: pd.DataFrame, column: str) -> pd.Series:
+    if column not in data:
+        return pd.Series(0.0, index=data.index)
+    return pd.to_numeric(data[column], errors="coerce").fillna(0.0).astype(float)
+
+
+def normalize_frame(data: pd.DataFrame, as_dicts: bool = True) -> list[dict[str, Any]] | pd.DataFrame:
+    """Normalizes a whole scrape result in one vectorized pass.
+
+    Returns listing dicts (same shape as normalize_property_row), or the normalized DataFrame when as_dicts=False.
+    """
+    out = pd.DataFrame(index=data.index)
+    for field, (column, default) in _TEXT_FIELDS.items():
+        out[field] = _text_column(data, column, default)
+    for field, column in _FLOAT_FIELDS.items():
+        out[field] = _numeric_column(data, column)
+    for field, column in _INT_FIELDS.items():
+        out[field] = _numeric_column(data, column).astype(int)
+    out["status"] = _text_column(data, "status", "Unknown")
+    out["property_url"] = _text_column(data, "property_url", "")
+    out["description"] = data["text"].fillna("").astype(str) if "text" in data else ""
+    out = out[LISTING_FIELDS]
+    return out.to_dict("records") if as_dicts else out
 
-def _safe_int(value: Any, default: int = 0) -> int:
-    try:
-        return int(value) if value is not None and not pd.isna(value) else default
-    except: return default
 
 def normalize_property_row(row: pd.Series) -> dict[str, Any]:
-    return {
-        "street": str(row.get("street", "Unknown")),
-        "city": str(row.get("city", "Unknown")),
-        "state": str(row.get("state", "Unknown")),
-        "price": _safe_float(row.get("list_price")),
-        "beds": _safe_int(row.get("beds")),
-        "baths": _safe_float(row.get("full_baths")),
-        "sqft": _safe_int(row.get("sqft")),
-        "year_built": _safe_int(row.get("year_built")),
-        "hoa_monthly": _safe_float(row.get("hoa_fee")), # Added HOA
-        "property_url": str(row.get("property_url", ""))
-    }
-
-
-def scrape_listing(url: str) -> dict[str, Any]:
-    """Scrapes specific property with strict house-number matching."""
+    return normalize_frame(row.to_frame().T)[0]
+
+
+def _match_position(data: pd.DataFrame, target_zpid: str | None, house_num: str | None) -> int:
+    """Row position of the best match: first ZPID match, else last street-number match, else the first row."""
+    if target_zpid and "property_url" in data:
+        zpid_mask = data["property_url"].astype(str).str.contains(target_zpid, regex=False).to_numpy()
+        if zpid_mask.any():
+            return int(zpid_mask.argmax())
+    if house_num and "street" in data:
+        # The old row loop kept overwriting on each street-number hit, so the last one wins
+        house_mask = data["street"].astype(str).str.startswith(house_num).to_numpy()
+        if house_mask.any():
+            return int(len(house_mask) - 1 - house_mask[::-1].argmax())
+    return 0
+
+
+# Listings ingested by ingest.py are served locally while the market's last run is younger than this
+LOCAL_LISTINGS_MAX_AGE_HOURS = 24
+
+
+def _local_max_age() -> float:
+    return float(get_setting("LOCAL_LISTINGS_MAX_AGE_HOURS", LOCAL_LISTINGS_MAX_AGE_HOURS)) * 3600
+
+
+def _local_only() -> bool:
+    """LOCAL_LISTINGS_ONLY keeps homeharvest out of the request path entirely (ingest.py does all scraping)."""
+    return str(get_setting("LOCAL_LISTINGS_ONLY", "")).lower() in ("1", "true", "yes")
+
+
+# Concurrent analyses of the same listing share one lookup/scrape
+_listing_flight = SingleFlight()
+
+
+def scrape_listing(url: str, force_refresh: bool = False) -> dict[str, Any]:
+    """Scrapes specific property with strict house-number matching.
+
+    Results are served from the local listing cache when fresh; pass force_refresh=True to re-scrape.
+    """
+    with timed("scrape_listing"):
+        key = (make_cache_key(extract_zpid_from_url(url), extract_address_from_url(url) or url), force_refresh)
+        listing, shared = _listing_flight.do(key, lambda: _scrape_listing(url, force_refresh))
+        return dict(listing) if shared else listing
+
+
+def _scrape_listing(url: str, force_refresh: bool) -> dict[str, Any]:
     address_str = extract_address_from_url(url)
     target_zpid = extract_zpid_from_url(url)
 
@@ -50,34 +123,93 @@ def scrape_listing(url: str) -> dict[str, Any]:
     if not address_str:
         raise ValueError("Could not parse address from URL.")
 
+    cache = get_listing_cache()
+    cache_key = make_cache_key(target_zpid, address_str)
+    if not force_refresh:
+        cached = cache.get(cache_key)
+        record_cache("listing", cached is not None)
+        if cached:
+            return cached
+
+    if not force_refresh:
+        with timed("listing_store_lookup"):
+            stored = get_listing_store().find_listing(target_zpid, address_str, max_age=_local_max_age())
+        record_cache("listing_store", stored is not None)
+        if stored:
+            cache.put(cache_key, stored)
+            return stored
+    if _local_only():
+        raise ValueError(f"{address_str} is not in the local listing store; add its market to the ingestion run.")
+
     # Fetch data - we include multiple statuses to ensure we find the listing
-    data = scrape_property(location=address_str, listing_type=["for_sale", "pending", "sold", "off_market"])
+    with timed("scrape_property"):
+        data = get_scrape_gate().call(scrape_property, location=address_str,
+                                      listing_type=["for_sale", "pending", "sold", "off_market"])
 
     if data.empty:
         raise ValueError(f"No listing data found for: {address_str}")
 
-    # MATCHING LOGIC
-    best_row = data.iloc[0]  # Default to first
-
-    for _, row in data.iterrows():
-        row_url = str(row.get("property_url", ""))
-        row_street = str(row.get("street", ""))
-
-        # 1. Best case: ZPID match
-        if target_zpid and target_zpid in row_url:
-            best_row = row
-            break
-
-        # 2. Secondary case: Street number match (Fixes the "Wrong House" issue)
-        if house_num and row_street.startswith(house_num):
-            best_row = row
-            # Continue loop in case a ZPID match is found further down
-            continue
-
-    return normalize_property_row(best_row)
-
-def get_area_comps(city: str, state: str, max_results: int = 5) -> list[dict[str, Any]]:
-    try:
-        data = scrape_property(location=f"{city}, {state}", listing_type=["for_sale"])
-        return [normalize_property_row(row) for _, row in data.head(max_results).iterrows()]
-    except: return []
\ No newline at end of file
+    # MATCHING LOGIC: ZPID match beats street-number match (fixes the "Wrong House" issue)
+    best = _match_position(data, target_zpid, house_num)
+    listing = normalize_frame(data.iloc[[best]])[0]
+    cache.put(cache_key, listing)
+    return listing
+
+def _fetch_market_rows(city: str, state: str) -> list[dict[str, Any]]:
+    """A whole city for the comps store: the ingested snapshot when there is one, else a full for-sale scrape."""
+    store = get_listing_store()
+    ingested_at = store.ingested_at(city, state)
+    if ingested_at is not None and (_local_only() or time.time() - ingested_at <= _local_max_age()):
+        # Snapshots ingested before a field was added just lack it
+        frame = store.market_frame(city, state).reindex(columns=LISTING_FIELDS)
+        return frame.fillna({"description": ""}).to_dict("records")
+    if _local_only():
+        raise ValueError(f"{city}, {state} has not been ingested.")
+    with timed("scrape_market"):
+        data = get_scrape_gate().call(scrape_property, location=f"{city}, {state}", listing_type=["for_sale"])
+    return normalize_frame(data)
+
+
+_comps_store: CompsStore | None = None
+
+
+def get_comps_store() -> CompsStore:
+    global _comps_store
+    if _comps_store is None:
+        _comps_store = CompsStore(fetch_market=_fetch_market_rows)
+    return _comps_store
+
+
+def get_area_comps(city: str, state: str, max_results: int = 5,
+                   subject: dict[str, Any] | None = None, preferences: str = "") -> list[dict[str, Any]]:
+    """Comps from the local per-city store, ranked by similarity to the subject listing when given.
+
+    Descriptions count towards the similarity too: matched against the client's preferences when given,
+    else against the subject's own description.
+    """
+    with timed("get_area_comps"):
+        try:
+            store = get_comps_store()
+            if not subject:
+                return store.lookup(city, state, max_results=max_results)
+            frame = store.market_frame(city, state)
+            query = preferences or subject.get("description") or ""
+            text_match = None
+            if query.strip() and not frame.empty:
+                index = market_index(city, state, frame)
+                text_match = to_match(index, index.similarity([query])[0])
+            ranked = rank_comps(subject, frame, k=max_results, text_match=text_match)
+            return ranked.drop(columns="comp_distance").to_dict("records")
+        except: return []
+
+
+def preference_listings(city: str, state: str, client: dict[str, Any], k: int = 5) -> list[dict[str, Any]]:
+    """The k listings in a market whose descriptions best match the client's preferences, with their match."""
+    query = preference_text(client)
+    if not query:
+        return []
+    frame = get_comps_store().market_frame(city, state)
+    if frame.empty:
+        return []
+    positions, matches = top_matches(market_index(city, state, frame), query, k)
+    return frame.iloc[positions].assign(preference_match=matches).to_dict("records")
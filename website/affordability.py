@@ -0,0 +1,100 @@
+from dataclasses import asdict, dataclass
+from functools import lru_cache
+from typing import Any
+
+import numpy as np
+import pandas as pd
+
+from settings import get_setting
+
+
+@dataclass(frozen=True)
+class MortgageAssumptions:
+    """Inputs for the PITI estimate. Tax and insurance are annual rates on the purchase price."""
+    annual_rate: float = 0.0675
+    term_years: int = 30
+    down_payment_pct: float = 0.20
+    property_tax_rate: float = 0.011
+    insurance_rate: float = 0.0035
+
+
+@lru_cache(maxsize=1)
+def current_assumptions() -> MortgageAssumptions:
+    """Defaults, overridable via MORTGAGE_RATE, MORTGAGE_TERM_YEARS, DOWN_PAYMENT_PCT, PROPERTY_TAX_RATE, INSURANCE_RATE.
+
+    Read once per process, like the rest of the secrets.
+    """
+    d = MortgageAssumptions()
+    return MortgageAssumptions(
+        annual_rate=float(get_setting("MORTGAGE_RATE", d.annual_rate)),
+        term_years=int(get_setting("MORTGAGE_TERM_YEARS", d.term_years)),
+        down_payment_pct=float(get_setting("DOWN_PAYMENT_PCT", d.down_payment_pct)),
+        property_tax_rate=float(get_setting("PROPERTY_TAX_RATE", d.property_tax_rate)),
+        insurance_rate=float(get_setting("INSURANCE_RATE", d.insurance_rate)),
+    )
+
+
+def payment_factor(annual_rate, term_years):
+    """Monthly principal+interest per dollar borrowed (standard amortization). Broadcasts over arrays."""
+    r = np.asarray(annual_rate, dtype=float) / 12
+    n = np.asarray(term_years, dtype=float) * 12
+    with np.errstate(divide="ignore", invalid="ignore"):
+        amortized = r / (1 - (1 + r) ** -n)
+    return np.where(r == 0, 1 / n, amortized)
+
+
+def monthly_piti(price, assumptions: MortgageAssumptions | None = None, annual_rate=None, down_payment_pct=None):
+    """Monthly principal, interest, tax and insurance.
+
+    Everything broadcasts, so price can be an array of listings and annual_rate/down_payment_pct can be
+    grids (e.g. rates[:, None] and downs[None, :]) to sweep a whole sensitivity table in one call.
+    """
+    a = assumptions or current_assumptions()
+    rate = a.annual_rate if annual_rate is None else annual_rate
+    down = a.down_payment_pct if down_payment_pct is None else down_payment_pct
+    price = np.asarray(price, dtype=float)
+    loan = price * (1 - np.asarray(down, dtype=float))
+    return loan * payment_factor(rate, a.term_years) + price * (a.property_tax_rate / 12) + price * (a.insurance_rate / 12)
+
+
+@lru_cache(maxsize=4096)
+def _carrying_cost(price: float, hoa: float, assumptions: MortgageAssumptions) -> float:
+    return float(monthly_piti(price, assumptions)) + hoa
+
+
+def monthly_carrying_cost(price: float, hoa: float = 0.0, assumptions: MortgageAssumptions | None = None) -> float:
+    """PITI + HOA for one listing; memoized per (price, hoa, assumptions)."""
+    return _carrying_cost(float(price), float(hoa), assumptions or current_assumptions())
+
+
+def carrying_costs(prices, hoas, assumptions: MortgageAssumptions | None = None) -> np.ndarray:
+    """Vectorized monthly_carrying_cost over arrays of listings (same arithmetic, so identical results)."""
+    return monthly_piti(prices, assumptions) + np.asarray(hoas, dtype=float)
+
+
+SWEEP_RATES = (0.055, 0.0625, 0.07, 0.0775)
+SWEEP_DOWN_PAYMENTS = (0.05, 0.10, 0.20)
+
+
+def sensitivity_grid(price: float, hoa: float = 0.0, rates=SWEEP_RATES, down_payments=SWEEP_DOWN_PAYMENTS,
+                     assumptions: MortgageAssumptions | None = None) -> pd.DataFrame:
+    """Monthly PITI + HOA for every (rate, down payment) pair, computed as one broadcast."""
+    rates = np.asarray(rates, dtype=float)
+    downs = np.asarray(down_payments, dtype=float)
+    grid = monthly_piti(price, assumptions, annual_rate=rates[:, None], down_payment_pct=downs[None, :]) + hoa
+    return pd.DataFrame(grid, index=pd.Index(rates, name="rate"), columns=pd.Index(downs, name="down_payment"))
+
+
+def sensitivity_table_markdown(price: float, hoa: float = 0.0, **kwargs: Any) -> str:
+    if not price:
+        return "_No list price available for a rate sensitivity table._"
+    grid = sensitivity_grid(price, hoa, **kwargs)
+    header = "| Rate | " + " | ".join(f"{d:.0%} down" for d in grid.columns) + " |"
+    divider = "|---|" + "---|" * len(grid.columns)
+    # Escaped: two bare "$" on one line render as LaTeX in st.markdown
+    rows = [f"| {rate:.2%} | " + " | ".join(f"\\${v:,.0f}" for v in grid.loc[rate]) + " |" for rate in grid.index]
+    return "\n".join([header, divider, *rows])
+
+
+def assumptions_dict(assumptions: MortgageAssumptions | None = None) -> dict[str, Any]:
+    return asdict(assumptions or current_assumptions())
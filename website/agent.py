@@ -1,9 +1,26 @@
 from __future__ import annotations
 from datetime import datetime, timezone
 from typing import Any
+import abc
+import logging
 import re
+import time
+import numpy as np
 import streamlit as st
 
+from affordability import assumptions_dict, carrying_costs, monthly_carrying_cost, sensitivity_table_markdown
+from llm_client import get_api_key, get_openai_client
+from metrics import increment, observe, record_cache, record_stage
+from prompt_budget import (FREE_TEXT_TOKEN_CAP, MIN_PROMPT_COMPS, comps_brief, comps_summary, comps_table,
+                           count_tokens, prompt_token_budget, truncate_tokens)
+from report_cache import get_report_cache, report_cache_key
+from scoring import PREFERENCE_POINTS, client_profile, fit_score_matrix
+from text_index import preference_matches
+
+REPORT_MODEL = "gpt-4o"
+
+logger = logging.getLogger(__name__)
+
 
 def _monthly_budget(client_profile: dict[str, Any]) -> float:
     """Calculates the max monthly budget based on a 45% DTI rule."""
@@ -13,15 +30,15 @@ def _monthly_budget(client_profile: dict[str, Any]) -> float:
     return max((income / 12 * 0.45) - monthly_debt, 0)
 
 
-def _fit_score(client_profile: dict[str, Any], listing: dict[str, Any]) -> int:
-    """Calculates a numerical fit score (1-100) considering HOA and Credit Score."""
+def _fit_score(client_profile: dict[str, Any], listing: dict[str, Any], preference_match: float | None = None) -> int:
+    """Calculates a numerical fit score (1-100) considering HOA, Credit Score and (when known) lifestyle match."""
     score = 50
     price = float(listing.get("price", 0))
     hoa = float(listing.get("hoa_monthly", 0))
     budget = _monthly_budget(client_profile)
 
-    # Estimate PITI (0.65% of price) + HOA fees
-    est_monthly = (price * 0.0065) + hoa if price else 0
+    # Amortized PITI + HOA fees
+    est_monthly = monthly_carrying_cost(price, hoa) if price else 0
 
     # Budget Fit logic
     if est_monthly > 0 and budget > 0:
@@ -49,10 +66,53 @@ def _fit_score(client_profile: dict[str, Any], listing: dict[str, Any]) -> int:
     if price > 0 and savings >= (price * 0.1):
         score += 15
 
+    # Lifestyle: how well the description matches the client's preferences (0-1, see text_index.py)
+    if preference_match is not None:
+        score += int(round(PREFERENCE_POINTS * min(max(preference_match, 0.0), 1.0)))
+
     return max(min(score, 100), 1)
 
 
 def _build_prompt(client: dict[str, Any], listing: dict[str, Any], comps: list[dict[str, Any]]) -> str:
+    """The report prompt, trimmed to PROMPT_TOKEN_BUDGET.
+
+    Over budget, the free-text preferences/notes are capped first, then the least similar comps
+    (comps arrive ranked) are folded into a one-line summary, keeping at least MIN_PROMPT_COMPS rows.
+    """
+    budget = prompt_token_budget()
+    prefs = client.get("preferences", "No specific lifestyle preferences provided.")
+    notes = client.get("notes", "No additional realtor notes.")
+    kept = len(comps)
+
+    def render() -> str:
+        comps_text = comps_table(comps[:kept])
+        if kept < len(comps):
+            comps_text += "\n" + comps_summary(comps[kept:])
+        return _render_prompt(client, listing, comps_text, prefs, notes)
+
+    prompt = render()
+    tokens = count_tokens(prompt, REPORT_MODEL)
+    if tokens > budget:
+        prefs = truncate_tokens(str(prefs), FREE_TEXT_TOKEN_CAP, REPORT_MODEL)
+        notes = truncate_tokens(str(notes), FREE_TEXT_TOKEN_CAP, REPORT_MODEL)
+        prompt = render()
+        tokens = count_tokens(prompt, REPORT_MODEL)
+    while tokens > budget and kept > MIN_PROMPT_COMPS:
+        kept -= 1
+        prompt = render()
+        tokens = count_tokens(prompt, REPORT_MODEL)
+
+    observe("prompt_tokens", tokens, model=REPORT_MODEL)
+    if tokens > budget:
+        logger.warning("report prompt is %d tokens, over the %d budget, with %d/%d comps in the table",
+                       tokens, budget, kept, len(comps))
+    elif kept < len(comps):
+        logger.info("report prompt trimmed to %d/%d comps (%d tokens, budget %d)", kept, len(comps), tokens, budget)
+    return prompt
+
+
+def _render_prompt(client: dict[str, Any], listing: dict[str, Any], comps_text: str, client_prefs: str,
+                   realtor_notes: str) -> str:
     # Handle the key mismatch robustly
     profile = client.get("profile", client.get("financial_profile", client))
 
@@ -61,15 +121,13 @@ def _build_prompt(client: dict[str, Any], listing: dict[str, Any], comps: list[d
     monthly_debt = float(profile.get("monthly_debt", 0))
     credit_score = profile.get("credit_score", "Unknown")
 
-    client_prefs = client.get("preferences", "No specific lifestyle preferences provided.")
-    realtor_notes = client.get("notes", "No additional realtor notes.")
-
     max_budget = _monthly_budget(profile)
     price = float(listing.get("price", 0))
     hoa = float(listing.get("hoa_monthly", 0))
 
     # Calculate total monthly including HOA
-    est_monthly = (price * 0.0065) + hoa
+    est_monthly = monthly_carrying_cost(price, hoa)
+    sensitivity = sensitivity_table_markdown(price, hoa)
 
     year_built = listing.get('year_built', 'Unknown')
     address = f"{listing.get('street')}, {listing.get('city')}, {listing.get('state')}"
@@ -86,6 +144,9 @@ CRITICAL: You must explicitly evaluate how the Credit Score ({credit_score}) aff
 - Specs: {listing.get('beds')} beds, {listing.get('baths')} baths, {listing.get('sqft', 0):,} sqft
 - Year Built: {year_built}
 
+Monthly total (PITI + HOA) by rate and down payment:
+{sensitivity}
+
 ### CLIENT PROFILE ###
 - Annual Income: ${income:,.0f}
 - Monthly Debt: ${monthly_debt:,.0f}
@@ -95,8 +156,8 @@ CRITICAL: You must explicitly evaluate how the Credit Score ({credit_score}) aff
 - Preferences: "{client_prefs}"
 - Realtor Notes: "{realtor_notes}"
 
-### MARKET CONTEXT (COMPS) ###
-{comps}
+### MARKET CONTEXT (COMPS, most similar first) ###
+{comps_text}
 
 ### REPORT INSTRUCTIONS ###
 Provide a structured report:
@@ -116,47 +177,13 @@ def _clean_report_markdown(text: str) -> str:
     return text
 
 
-def generate_listing_report(client: dict[str, Any], listing: dict[str, Any], comps: list[dict[str, Any]]) -> dict[
-    str, Any]:
-    # Robust profile retrieval
-    profile = client.get("profile", client.get("financial_profile", client))
-
-    fit_score = _fit_score(profile, listing)
-    monthly_budget = _monthly_budget(profile)
-
-    # Monthly cost for the return dict (PITI + HOA)
-    hoa = float(listing.get("hoa_monthly", 0))
-    est_monthly_cost = (float(listing.get("price", 0)) * 0.0065) + hoa
+def _fallback_report(address: str, profile: dict[str, Any], listing: dict[str, Any], comps: list[dict[str, Any]],
+                     fit_score: int, est_monthly_cost: float, monthly_budget: float) -> str:
+    comp_lines = "\n".join(
+        [f"- {c['street']}: ${c['price']:,.0f} ({c['beds']}bd/{c['baths']}ba)" for c in comps[:3]]
+    ) or "- No nearby comparable listings available."
 
-    address = f"{listing.get('street')}, {listing.get('city')}, {listing.get('state')}"
-
-    report_md: str | None = None
-    model_used = "rules-only"
-
-    api_key = st.secrets.get("OPENAI_API_KEY") if hasattr(st, "secrets") else None
-
-    if api_key:
-        try:
-            from openai import OpenAI
-            client_api = OpenAI(api_key=api_key)
-            prompt = _build_prompt(client, listing, comps)
-            response = client_api.chat.completions.create(
-                model="gpt-4o",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.7
-            )
-            report_md = _clean_report_markdown(response.choices[0].message.content)
-            model_used = "gpt-4o"
-        except Exception as e:
-            st.warning(f"AI generation failed: {e}")
-            report_md = None
-
-    if not report_md:
-        comp_lines = "\n".join(
-            [f"- {c['street']}: ${c['price']:,.0f} ({c['beds']}bd/{c['baths']}ba)" for c in comps[:3]]
-        ) or "- No nearby comparable listings available."
-
-        report_md = _clean_report_markdown(f"""
+    return _clean_report_markdown(f"""
 **Analysis for: {address}**
 
 ### Executive Summary
@@ -168,6 +195,9 @@ This listing has a **fit score of {fit_score}/100**.
 - **Credit Score Status:** {profile.get('credit_score', 'Unknown')}
 - {'The property fits well within budget.' if est_monthly_cost <= monthly_budget else 'The property exceeds recommended limits.'}
 
+### Rate Sensitivity (PITI + HOA)
+{sensitivity_table_markdown(float(listing.get('price', 0)), float(listing.get('hoa_monthly', 0)))}
+
 ### Property Risk Watchlist
 - **Age:** Built in {listing.get('year_built')}. {'Immediate inspection of HVAC/Roof recommended.' if listing.get('year_built', 0) < 1995 else 'Verify modern code compliance.'}
 
@@ -175,11 +205,291 @@ This listing has a **fit score of {fit_score}/100**.
 {comp_lines}
 """.strip())
 
-    return {
-        "fit_score": fit_score,
-        "estimated_monthly_cost": est_monthly_cost,
-        "max_recommended_monthly": monthly_budget,
-        "report_markdown": report_md,
-        "model_used": model_used,
-        "created_at": datetime.now(timezone.utc),
-    }
\ No newline at end of file
+
+class _LLMReportStream(abc.ABC):
+    """Iterates report text chunks as the LLM produces them, falling back to a rules-only report.
+
+    Once iteration finishes, .result holds the report fields plus time_to_first_token_s (the latency the user
+    actually waits) and generation_s. A report cached for identical prompt inputs is replayed instantly unless
+    regenerate=True. Subclasses supply the rules-based numbers, the prompt and the fallback text.
+    """
+
+    stage = "generate_report"
+
+    def __init__(self, regenerate: bool = False):
+        self.regenerate = regenerate
+        self.fields: dict[str, Any] = {}
+        self.result: dict[str, Any] | None = None
+
+    @abc.abstractmethod
+    def _fields(self) -> dict[str, Any]:
+        """The rules-based report fields (fit score, costs, ...), computed before any LLM call."""
+
+    @abc.abstractmethod
+    def _prompt(self) -> str:
+        """The LLM prompt for the report."""
+
+    @abc.abstractmethod
+    def _fallback(self) -> str:
+        """The rules-only report markdown, used without an API key or when the LLM call fails."""
+
+    def __iter__(self):
+        started = time.perf_counter()
+        time_to_first_token: float | None = None
+        self.fields = self._fields()
+
+        report_md: str | None = None
+        model_used = "rules-only"
+        cache_hit = False
+        usage: dict[str, int] = {}
+
+        if get_api_key():
+            prompt = self._prompt()
+            cache_key = report_cache_key(prompt, REPORT_MODEL)
+            cached = None if self.regenerate else get_report_cache().get(cache_key)
+            if not self.regenerate:
+                record_cache("report", cached is not None)
+            if cached:
+                report_md, model_used, cache_hit = cached["report_markdown"], cached["model_used"], True
+                time_to_first_token = time.perf_counter() - started
+                yield report_md
+            else:
+                parts: list[str] = []
+                try:
+                    client_api = get_openai_client()
+                    response = client_api.chat.completions.create(
+                        model=REPORT_MODEL,
+                        messages=[{"role": "user", "content": prompt}],
+                        temperature=0.7,
+                        stream=True,
+                        stream_options={"include_usage": True},
+                    )
+                    for chunk in response:
+                        if getattr(chunk, "usage", None):
+                            usage = {"prompt_tokens": chunk.usage.prompt_tokens,
+                                     "completion_tokens": chunk.usage.completion_tokens}
+                        delta = chunk.choices[0].delta.content if chunk.choices else None
+                        if not delta:
+                            continue
+                        if time_to_first_token is None:
+                            time_to_first_token = time.perf_counter() - started
+                        parts.append(delta)
+                        yield delta
+                    report_md = _clean_report_markdown("".join(parts))
+                    model_used = REPORT_MODEL
+                    observe("llm_time_to_first_token_seconds", time_to_first_token or 0.0, model=model_used)
+                    observe("llm_latency_seconds", time.perf_counter() - started, model=model_used)
+                    for kind, count in usage.items():
+                        increment("llm_tokens_total", count, model=model_used, kind=kind)
+                    get_report_cache().put(cache_key, {"report_markdown": report_md, "model_used": model_used})
+                except Exception as e:
+                    st.warning(f"AI generation failed: {e}")
+                    report_md = None
+                    if parts:
+                        # Part of a report was already shown; separate it from the fallback below
+                        yield "\n\n---\n\n"
+
+        if not report_md:
+            report_md = self._fallback()
+            if time_to_first_token is None:
+                time_to_first_token = time.perf_counter() - started
+            yield report_md
+
+        generation_s = time.perf_counter() - started
+        record_stage(self.stage, generation_s)
+
+        self.result = {
+            **self.fields,
+            "mortgage_assumptions": assumptions_dict(),
+            "report_markdown": report_md,
+            "model_used": model_used,
+            "report_cache_hit": cache_hit,
+            "time_to_first_token_s": round(time_to_first_token, 3),
+            "generation_s": round(generation_s, 3),
+            "usage": usage,
+            "created_at": datetime.now(timezone.utc),
+        }
+
+
+class ReportStream(_LLMReportStream):
+    """Report for one listing; .result is the dict generate_listing_report returns."""
+
+    def __init__(self, client: dict[str, Any], listing: dict[str, Any], comps: list[dict[str, Any]],
+                 regenerate: bool = False):
+        super().__init__(regenerate)
+        self.client = client
+        self.listing = listing
+        self.comps = comps
+
+    def _fields(self) -> dict[str, Any]:
+        # Robust profile retrieval
+        self.profile = self.client.get("profile", self.client.get("financial_profile", self.client))
+        hoa = float(self.listing.get("hoa_monthly", 0))
+        matches = preference_matches(self.client, [self.listing])
+        match = None if matches is None else round(float(matches[0]), 3)
+        # Monthly cost for the return dict (PITI + HOA)
+        return {
+            "fit_score": _fit_score(self.profile, self.listing, match),
+            "preference_match": match,
+            "estimated_monthly_cost": monthly_carrying_cost(float(self.listing.get("price", 0)), hoa),
+            "max_recommended_monthly": _monthly_budget(self.profile),
+        }
+
+    def _prompt(self) -> str:
+        return _build_prompt(self.client, self.listing, self.comps)
+
+    def _fallback(self) -> str:
+        address = f"{self.listing.get('street')}, {self.listing.get('city')}, {self.listing.get('state')}"
+        return _fallback_report(address, self.profile, self.listing, self.comps, self.fields["fit_score"],
+                                self.fields["estimated_monthly_cost"], self.fields["max_recommended_monthly"])
+
+
+def stream_listing_report(client: dict[str, Any], listing: dict[str, Any], comps: list[dict[str, Any]],
+                          regenerate: bool = False) -> ReportStream:
+    return ReportStream(client, listing, comps, regenerate=regenerate)
+
+
+def generate_listing_report(client: dict[str, Any], listing: dict[str, Any], comps: list[dict[str, Any]],
+                            regenerate: bool = False) -> dict[str, Any]:
+    stream = stream_listing_report(client, listing, comps, regenerate=regenerate)
+    for _ in stream:
+        pass
+    return stream.result
+
+
+# --- Multi-listing comparison ---
+
+MAX_COMPARE_LISTINGS = 8
+
+
+def _address(listing: dict[str, Any]) -> str:
+    return f"{listing.get('street')}, {listing.get('city')}, {listing.get('state')}"
+
+
+def _candidates_table(listings: list[dict[str, Any]], comps_by_listing: list[list[dict[str, Any]]],
+                      fields: dict[str, Any]) -> str:
+    rows = ["#|address|price|bd/ba|sqft|$/sqft|built|hoa|monthly|fit|area comps"]
+    for i, (listing, comps) in enumerate(zip(listings, comps_by_listing), start=1):
+        price, sqft = float(listing.get("price", 0)), float(listing.get("sqft", 0))
+        ppsf = f"{price / sqft:.0f}" if price and sqft else "n/a"
+        rows.append(
+            f"{i}|{_address(listing)}|${price:,.0f}|{listing.get('beds')}/{listing.get('baths', 0):g}|{sqft:.0f}|"
+            f"{ppsf}|{listing.get('year_built')}|{float(listing.get('hoa_monthly', 0)):.0f}|"
+            f"${fields['estimated_monthly_costs'][i - 1]:,.0f}|{fields['fit_scores'][i - 1]}|{comps_brief(comps)}"
+        )
+    return "\n".join(rows)
+
+
+def _build_comparison_prompt(client: dict[str, Any], listings: list[dict[str, Any]],
+                             comps_by_listing: list[list[dict[str, Any]]], fields: dict[str, Any]) -> str:
+    """One prompt for the whole shortlist: the client profile once, then one table row per listing."""
+    profile = client.get("profile", client.get("financial_profile", client))
+    prefs = client.get("preferences", "No specific lifestyle preferences provided.")
+    notes = client.get("notes", "No additional realtor notes.")
+    assumptions = assumptions_dict()
+    table = _candidates_table(listings, comps_by_listing, fields)
+
+    def render() -> str:
+        return f"""
+You are a High-End Real Estate Strategist & Financial Advisor. Compare these {len(listings)} properties for one client and rank them.
+CRITICAL: Weigh how the Credit Score ({profile.get('credit_score', 'Unknown')}) affects financing and how each home's HOA changes the total monthly carry.
+
+### CLIENT PROFILE ###
+- Annual Income: ${float(profile.get('income', 0)):,.0f}
+- Monthly Debt: ${float(profile.get('monthly_debt', 0)):,.0f}
+- Credit Score: {profile.get('credit_score', 'Unknown')}
+- Available Savings: ${float(profile.get('savings', 0)):,.0f}
+- Target Housing Budget: ${fields['max_recommended_monthly']:,.0f}/month
+- Preferences: "{prefs}"
+- Realtor Notes: "{notes}"
+
+### CANDIDATES ###
+monthly = PITI + HOA at {assumptions['annual_rate']:.2%}, {assumptions['down_payment_pct']:.0%} down; fit = rules-based score 1-100.
+{table}
+
+### REPORT INSTRUCTIONS ###
+Provide a structured report:
+1. **RANKING**: A table of all {len(listings)} homes, best first, with a one-line reason for each.
+2. **TOP PICK**: Why #1 wins for this client, and what would change that verdict.
+3. **FINANCIAL COMPARISON**: Monthly carry of each home against the budget. Address the credit score impact on financing.
+4. **LIFESTYLE FIT**: Evaluate each home against the preferences.
+5. **RISK WATCHLIST**: The main watch item per home (age, HOA, price vs. area comps).
+
+Refer to homes by # and street. Keep your tone professional, scannable, and direct.
+""".strip()
+
+    prompt = render()
+    tokens = count_tokens(prompt, REPORT_MODEL)
+    if tokens > prompt_token_budget():
+        prefs = truncate_tokens(str(prefs), FREE_TEXT_TOKEN_CAP, REPORT_MODEL)
+        notes = truncate_tokens(str(notes), FREE_TEXT_TOKEN_CAP, REPORT_MODEL)
+        prompt = render()
+        tokens = count_tokens(prompt, REPORT_MODEL)
+    observe("prompt_tokens", tokens, model=REPORT_MODEL)
+    return prompt
+
+
+def _fallback_comparison(listings: list[dict[str, Any]], fields: dict[str, Any]) -> str:
+    budget = fields["max_recommended_monthly"]
+    rows = [
+        f"| {rank} | {_address(listings[i])} | \\${float(listings[i].get('price', 0)):,.0f} "
+        f"| \\${fields['estimated_monthly_costs'][i]:,.0f} | {fields['fit_scores'][i]}/100 |"
+        for rank, i in enumerate(fields["ranking"], start=1)
+    ]
+    best = listings[fields["ranking"][0]]
+    best_cost = fields["estimated_monthly_costs"][fields["ranking"][0]]
+    return _clean_report_markdown(f"""
+### Ranking (best fit first)
+| Rank | Address | Price | Est. Monthly | Fit Score |
+|---|---|---|---|---|
+{chr(10).join(rows)}
+
+### Top Pick
+**{_address(best)}**: {'fits within' if best_cost <= budget else 'exceeds'} the client's \\${budget:,.0f}/mo budget
+at an estimated \\${best_cost:,.0f}/mo (PITI + HOA).
+""".strip())
+
+
+class ComparisonStream(_LLMReportStream):
+    """One ranked, comparative report for several listings, from a single LLM call.
+
+    Fit scores and monthly costs for the whole shortlist come from one vectorized pass (scoring.fit_score_matrix).
+    """
+
+    stage = "generate_comparison"
+
+    def __init__(self, client: dict[str, Any], listings: list[dict[str, Any]],
+                 comps_by_listing: list[list[dict[str, Any]]] | None = None, regenerate: bool = False):
+        super().__init__(regenerate)
+        self.client = client
+        self.listings = listings[:MAX_COMPARE_LISTINGS]
+        self.comps_by_listing = (comps_by_listing or [[] for _ in self.listings])[:MAX_COMPARE_LISTINGS]
+
+    def _fields(self) -> dict[str, Any]:
+        profile = client_profile(self.client)
+        matches = preference_matches(self.client, self.listings)
+        if matches is not None:
+            matches = np.round(matches, 3)
+        scores = fit_score_matrix([profile], self.listings,
+                                  preference_match=None if matches is None else matches[None, :])[0]
+        prices = np.array([float(l.get("price", 0)) for l in self.listings])
+        costs = carrying_costs(prices, [float(l.get("hoa_monthly", 0)) for l in self.listings])
+        return {
+            "fit_scores": scores.tolist(),
+            "preference_matches": None if matches is None else matches.tolist(),
+            "estimated_monthly_costs": costs.tolist(),
+            "ranking": np.argsort(-scores, kind="stable").tolist(),
+            "max_recommended_monthly": _monthly_budget(profile),
+        }
+
+    def _prompt(self) -> str:
+        return _build_comparison_prompt(self.client, self.listings, self.comps_by_listing, self.fields)
+
+    def _fallback(self) -> str:
+        return _fallback_comparison(self.listings, self.fields)
+
+
+def stream_comparison_report(client: dict[str, Any], listings: list[dict[str, Any]],
+                             comps_by_listing: list[list[dict[str, Any]]] | None = None,
+                             regenerate: bool = False) -> ComparisonStream:
+    return ComparisonStream(client, listings, comps_by_listing, regenerate=regenerate)
@@ -4,12 +4,20 @@ from pathlib import Path
 import streamlit as st
 from bson import ObjectId
 
-from agent import generate_listing_report
-from auth import authenticate_user, create_user
-from database import get_analyses_collection, get_clients_collection
-from ZillowScraper import get_area_comps, scrape_listing
+from agent import MAX_COMPARE_LISTINGS, stream_comparison_report, stream_listing_report
+from auth import authenticate_user, create_user, is_admin
+from batch import MAX_BATCH_SIZE, analyze_batch, parse_batch_urls
+from cache_sync import start_cache_sync
+from data_access import (delete_analysis, dismiss_suggestion, get_analysis_page, get_analysis_report, get_clients,
+                         get_data_cache, get_suggestions, insert_client, save_analysis, update_client)
+from jobs import enqueue_analysis, get_client_jobs
+from metrics import analysis_timings, render_prometheus, snapshot, start_metrics_server
+from text_index import preference_text
+from ZillowScraper import get_area_comps, preference_listings, scrape_listing
 
 st.set_page_config(page_title="Agent", layout="wide")
+start_cache_sync()
+start_metrics_server()
 
 if "authenticated" not in st.session_state:
     st.session_state.authenticated = False
@@ -110,7 +118,7 @@ def clients_page():
                             "created_at": datetime.now(timezone.utc),
                             "updated_at": datetime.now(timezone.utc),
                         }
-                        get_clients_collection().insert_one(new_doc)
+                        insert_client(user_id, new_doc)
 
                         st.session_state.reg_expanded = False
                         st.toast(f"Success! {name} added.", icon="✅")
@@ -120,7 +128,7 @@ def clients_page():
 
     st.divider()
 
-    clients = _get_clients_for_user(user_id)
+    clients = get_clients(user_id)
     if not clients:
         st.info("No clients found. Open the registration tool above to add your first one.")
         return
@@ -154,14 +162,14 @@ def clients_page():
 
             col_sub, col_can = st.columns([1, 5])
             if col_sub.form_submit_button("Submit"):
-                get_clients_collection().update_one(
-                    {"_id": client_id},
-                    {"$set": {
+                update_client(
+                    user_id, client_id,
+                    {
                         "name": u_name, "email": u_email, "phone": u_phone,
                         "profile": {"income": u_income, "monthly_debt": u_debt, "savings": u_savings,
                                     "credit_score": u_credit},
                         "preferences": u_prefs, "notes": u_notes, "updated_at": datetime.now(timezone.utc)
-                    }}
+                    }
                 )
                 st.session_state.edit_client_id = None
                 st.rerun()
@@ -221,33 +229,18 @@ def logout():
     st.rerun()
 
 
-def _get_clients_for_user(user_id: ObjectId):
-    clients = get_clients_collection()
-    return list(clients.find({"realtor_id": user_id}).sort("created_at", -1))
-
-
-def _save_analysis(realtor_id: ObjectId, client_id: ObjectId, url: str, listing: dict, report: dict):
-    analyses = get_analyses_collection()
-    analyses.insert_one(
-        {
-            "realtor_id": realtor_id,
-            "client_id": client_id,
-            "url": url,
-            "listing": listing,
-            "result": report,
-            "created_at": datetime.now(timezone.utc),
-        }
-    )
-
-
 def _render_analysis_history(realtor_id: ObjectId, client_id: ObjectId):
     st.subheader("Favorite Listings")
 
-    analyses = list(
-        get_analyses_collection()
-        .find({"realtor_id": realtor_id, "client_id": client_id})
-        .sort("created_at", -1)
-    )
+    # Stack of page cursors for this client; the last entry is the page being shown
+    cursor_key = f"history_cursors_{client_id}"
+    cursors = st.session_state.setdefault(cursor_key, [None])
+    analyses, has_more = get_analysis_page(realtor_id, client_id, after=cursors[-1])
+
+    if not analyses and len(cursors) > 1:
+        # The page emptied out (e.g. its last favorite was removed); step back
+        cursors.pop()
+        st.rerun()
 
     if not analyses:
         st.info("No favorites yet. Analyze a property and click 'Add to Favorites'.")
@@ -267,21 +260,200 @@ def _render_analysis_history(realtor_id: ObjectId, client_id: ObjectId):
                 st.markdown(f"**{street}, {city} {state}**")
 
                 score = result.get("fit_score", "N/A")
-                st.markdown(f"**Fit Score:** {score}/100")
+                line = f"**Fit Score:** {score}/100"
+                if result.get("estimated_monthly_cost"):
+                    line += f" · est. \\${result['estimated_monthly_cost']:,.0f}/mo"
+                st.markdown(line)
 
             with col_del:
                 if st.button("🗑️", key=f"del_{item['_id']}", use_container_width=True):
-                    get_analyses_collection().delete_one({"_id": item["_id"]})
+                    delete_analysis(realtor_id, client_id, item["_id"])
                     st.toast("Removed from favorites")
                     st.rerun()
 
+            if st.toggle("View Property Report", key=f"report_{item['_id']}"):
+                st.markdown(get_analysis_report(item["_id"]))
+
+    col_prev, col_page, col_next = st.columns([1, 2, 1])
+    if len(cursors) > 1 and col_prev.button("← Newer", key=f"history_prev_{client_id}", use_container_width=True):
+        cursors.pop()
+        st.rerun()
+    col_page.caption(f"Page {len(cursors)}")
+    if has_more and col_next.button("Older →", key=f"history_next_{client_id}", use_container_width=True):
+        last = analyses[-1]
+        cursors.append((last["created_at"], last["_id"]))
+        st.rerun()
+
+
+@st.fragment(run_every=3)
+def _render_background_jobs(realtor_id: ObjectId, client_id: ObjectId):
+    jobs = get_client_jobs(realtor_id, client_id)
+    if not jobs:
+        return
+    st.markdown("#### Background Analyses")
+    icons = {"queued": "⏳", "running": "🔄", "done": "✅", "failed": "❌"}
+    for job in jobs:
+        stages = " → ".join(
+            f"{name} {info.get('seconds', 0):.1f}s" if info["status"] == "done" else f"{name} ({info['status']})"
+            for name, info in job["stages"].items()
+        )
+        line = f"{icons.get(job['status'], '')} `{job['url'][:70]}` — {stages}"
+        if job.get("error"):
+            line += f"  \n_{job['error']}_"
+        st.markdown(line)
+
+    # When a job lands in favorites, refresh the whole page so the history shows it
+    seen = st.session_state.setdefault("finished_job_ids", set())
+    finished = {job["_id"] for job in jobs if job["status"] == "done"}
+    if finished - seen:
+        first_poll = not seen
+        seen.update(finished)
+        if not first_poll:
+            get_data_cache().invalidate("analyses", realtor_id, client_id)
+            st.rerun(scope="app")
+
+
+def _render_batch_analysis(user_id: ObjectId, active_client: dict):
+    st.subheader("Batch Analysis")
+    st.caption(f"Paste up to {MAX_BATCH_SIZE} Zillow/Realtor URLs (one per line) or upload a CSV with a 'url' column.")
+    urls_text = st.text_area("Listing URLs", key="batch_urls")
+    csv_file = st.file_uploader("Or upload a CSV", type=["csv"], key="batch_csv")
+
+    if st.button("Run Batch Analysis"):
+        urls = parse_batch_urls(urls_text, csv_file.getvalue() if csv_file else None)
+        if not urls:
+            st.error("No listing URLs found.")
+        else:
+            results = []
+            progress = st.progress(0.0, text=f"Analyzing {len(urls)} listings...")
+            live = st.container()
+            for item in analyze_batch(active_client, urls, force_refresh=st.session_state.get("force_refresh", False)):
+                results.append(item)
+                progress.progress(len(results) / len(urls), text=f"{len(results)}/{len(urls)} complete")
+                if item.error:
+                    live.error(f"{item.url}: {item.error}")
+                else:
+                    live.write(f"✅ {item.listing.get('street')}, {item.listing.get('city')} "
+                               f"— fit score {item.result['fit_score']}/100")
+            st.session_state.batch_results = {"client_id": str(active_client["_id"]), "items": results}
+
+    batch = st.session_state.get("batch_results")
+    if not batch or batch["client_id"] != str(active_client["_id"]):
+        return
+
+    done = sorted((i for i in batch["items"] if not i.error), key=lambda i: i.result["fit_score"], reverse=True)
+    if done:
+        st.markdown("#### Batch Results (best fit first)")
+        st.dataframe(
+            [{"Address": f"{i.listing.get('street')}, {i.listing.get('city')}",
+              "Price": i.listing.get("price"),
+              "Fit Score": i.result["fit_score"],
+              "Est. Monthly": round(i.result["estimated_monthly_cost"])} for i in done],
+            use_container_width=True,
+        )
+    for idx, item in enumerate(done):
+        with st.container(border=True):
+            st.markdown(f"**{item.listing.get('street')}, {item.listing.get('city')}** — "
+                        f"{item.result['fit_score']}/100")
+            if st.button("Add to Favorites", key=f"batch_fav_{idx}"):
+                save_analysis(user_id, active_client["_id"], item.url, item.listing, item.result)
+                st.toast("Listing added to favorites!", icon="⭐")
             with st.expander("View Property Report"):
-                st.markdown(result.get("report_markdown", "No report available."))
+                st.markdown(item.result["report_markdown"])
+
+
+def _render_comparison(active_client: dict):
+    st.subheader("Compare Listings")
+    st.caption(f"Paste 2-{MAX_COMPARE_LISTINGS} listing URLs to rank them for {active_client['name']} "
+               "in a single report.")
+    urls_text = st.text_area("Listing URLs to compare", key="compare_urls")
+
+    if st.button("Compare Listings"):
+        urls = parse_batch_urls(urls_text)[:MAX_COMPARE_LISTINGS]
+        if len(urls) < 2:
+            st.error("Paste at least two listing URLs.")
+        else:
+            with st.status(f"Fetching {len(urls)} listings...", expanded=True) as status:
+                gathered = list(analyze_batch(active_client, urls, report=False,
+                                              force_refresh=st.session_state.get("force_refresh", False)))
+                gathered.sort(key=lambda item: urls.index(item.url))  # keep the pasted order for the # column
+                for item in gathered:
+                    if item.error:
+                        st.error(f"{item.url}: {item.error}")
+                found = [item for item in gathered if not item.error]
+                if len(found) < 2:
+                    status.update(label="Need at least two listings to compare.", state="error")
+                else:
+                    status.update(label="Writing comparison...")
+                    stream = stream_comparison_report(active_client, [i.listing for i in found],
+                                                      [i.comps for i in found])
+                    st.write_stream(stream)
+                    st.session_state.comparison = {"client_id": str(active_client["_id"]),
+                                                   "listings": [i.listing for i in found], "result": stream.result}
+                    status.update(label="Comparison complete", state="complete", expanded=False)
+
+    comparison = st.session_state.get("comparison")
+    if not comparison or comparison["client_id"] != str(active_client["_id"]):
+        return
+    result, listings = comparison["result"], comparison["listings"]
+    st.dataframe(
+        [{"Rank": rank,
+          "Address": f"{listings[i].get('street')}, {listings[i].get('city')}",
+          "Price": listings[i].get("price"),
+          "Fit Score": result["fit_scores"][i],
+          "Est. Monthly": round(result["estimated_monthly_costs"][i])}
+         for rank, i in enumerate(result["ranking"], start=1)],
+        use_container_width=True, hide_index=True,
+    )
+    with st.expander("View Comparison Report"):
+        st.markdown(result["report_markdown"])
+
+
+def _render_preference_listings(active_client: dict, listing: dict):
+    if not preference_text(active_client):
+        return
+    city, state = listing.get("city"), listing.get("state")
+    try:
+        matches = [m for m in preference_listings(city, state, active_client, k=6)
+                   if m["property_url"] != listing.get("property_url")][:5]
+    except Exception:
+        return  # the market isn't loaded; nothing to suggest
+    if not matches:
+        return
+    with st.expander(f"Other {city} listings matching {active_client['name']}'s preferences"):
+        st.dataframe(
+            [{"Address": m["street"], "Price": m["price"], "Beds": m["beds"], "Baths": m["baths"],
+              "Match": f"{m['preference_match']:.0%}", "URL": m["property_url"]} for m in matches],
+            use_container_width=True, hide_index=True,
+            column_config={"URL": st.column_config.LinkColumn("URL")},
+        )
+
+
+def _render_suggestions(realtor_id: ObjectId, active_client: dict):
+    suggestions = get_suggestions(realtor_id, active_client["_id"])
+    if not suggestions:
+        return
+    st.subheader("Suggested Listings")
+    st.caption(f"New and updated listings that score well for {active_client['name']}, from the latest ingestion.")
+    for s in suggestions:
+        listing = s["listing"]
+        with st.container(border=True):
+            info_col, analyze_col, dismiss_col = st.columns([6, 1, 1])
+            info_col.markdown(f"**{listing.get('street')}, {listing.get('city')}** — {s['fit_score']}/100  \n"
+                              f"\\${listing.get('price') or 0:,.0f} · "
+                              f"est. \\${s['estimated_monthly_cost']:,.0f}/mo · "
+                              f"{listing.get('beds')} bd / {listing.get('baths')} ba")
+            # The URL box is filled from a callback, since a widget's key can't be set once it has rendered
+            analyze_col.button("Analyze", key=f"suggest_analyze_{s['_id']}", use_container_width=True,
+                               on_click=st.session_state.__setitem__, args=("listing_url", listing["property_url"]))
+            if dismiss_col.button("Dismiss", key=f"suggest_dismiss_{s['_id']}", use_container_width=True):
+                dismiss_suggestion(realtor_id, active_client["_id"], s["_id"])
+                st.rerun()
 
 
 def dashboard_page():
     user_id = st.session_state.user["_id"]
-    clients = _get_clients_for_user(user_id)
+    clients = get_clients(user_id)
 
     if not clients:
         st.title("Realtor Dashboard")
@@ -316,26 +488,47 @@ def dashboard_page():
     m4.metric("Credit Score", p.get('credit_score', 'N/A'))
 
     st.divider()
+    _render_suggestions(user_id, active_client)
+
     st.subheader("Analyze New Listing")
     url = st.text_input("Paste listing URL (Zillow/Realtor)", key="listing_url",
                         placeholder="https://www.zillow.com/homedetails/...")
+    force_refresh = st.checkbox("Force refresh listing data", key="force_refresh",
+                                help="Skip the local listing cache and re-scrape this property.")
 
-    if st.button("Run Property Analysis", type="primary"):
+    run_col, queue_col = st.columns([1, 1])
+    run_clicked = run_col.button("Run Property Analysis", type="primary", use_container_width=True)
+    if queue_col.button("Run in Background", use_container_width=True,
+                        help="Queue the analysis; it is saved to favorites when done, even if you leave this page."):
+        if not url.strip():
+            st.error("Please provide a listing URL.")
+        else:
+            enqueue_analysis(user_id, active_client["_id"], url.strip(), force_refresh=force_refresh)
+            st.toast("Analysis queued.", icon="⏳")
+
+    if run_clicked:
         if not url.strip():
             st.error("Please provide a listing URL.")
         else:
             with st.status("Analyzing...", expanded=True) as status:
                 try:
-                    listing = scrape_listing(url.strip())
-                    comps = get_area_comps(listing.get("city"), listing.get("state"), max_results=5)
-                    report = generate_listing_report(active_client, listing, comps)
+                    with analysis_timings() as timings:
+                        listing = scrape_listing(url.strip(), force_refresh=force_refresh)
+                        comps = get_area_comps(listing.get("city"), listing.get("state"), max_results=5,
+                                               subject=listing, preferences=preference_text(active_client))
+                        status.update(label="Writing report...")
+                        stream = stream_listing_report(active_client, listing, comps)
+                        st.write_stream(stream)
+                    report = {**stream.result, "timings": timings}
 
                     st.session_state.temp_analysis = {
                         "url": url.strip(),
                         "listing": listing,
+                        "comps": comps,
                         "result": report
                     }
-                    status.update(label="Analysis Complete!", state="complete")
+                    status.update(label=f"Analysis Complete! (first token in {report['time_to_first_token_s']:.1f}s)",
+                                  state="complete", expanded=False)
                 except Exception as exc:
                     st.error(f"Analysis failed: {exc}")
 
@@ -345,18 +538,42 @@ def dashboard_page():
         st.markdown("### New Analysis Preview")
         st.markdown(temp["result"]["report_markdown"])
 
-        btn_col1, btn_col2 = st.columns([1, 1])
+        if temp["result"].get("report_cache_hit"):
+            st.caption("Inputs unchanged since the last analysis — showing the saved report.")
+        _render_preference_listings(active_client, temp["listing"])
+
+        btn_col1, btn_col2, btn_col3 = st.columns([1, 1, 1])
         with btn_col1:
             if st.button("Add to Favorites", type="primary", use_container_width=True):
-                _save_analysis(user_id, active_client["_id"], temp["url"], temp["listing"], temp["result"])
+                save_analysis(user_id, active_client["_id"], temp["url"], temp["listing"], temp["result"])
                 del st.session_state.temp_analysis
                 st.toast("Listing added to favorites!", icon="⭐")
                 st.rerun()
         with btn_col2:
+            if st.button("Regenerate Report", use_container_width=True):
+                with st.status("Regenerating report...", expanded=True), analysis_timings() as regen_timings:
+                    stream = stream_listing_report(active_client, temp["listing"], temp.get("comps", []),
+                                                   regenerate=True)
+                    st.write_stream(stream)
+                # Scrape/comps times still come from the first run; the regeneration adds its own report time
+                timings = dict(temp["result"].get("timings") or {})
+                for stage, seconds in regen_timings.items():
+                    timings[stage] = round(timings.get(stage, 0.0) + seconds, 4)
+                temp["result"] = {**stream.result, "timings": timings}
+                st.rerun()
+        with btn_col3:
             if st.button("Discard Analysis", use_container_width=True):
                 del st.session_state.temp_analysis
                 st.rerun()
 
+    _render_background_jobs(user_id, active_client["_id"])
+
+    st.divider()
+    _render_comparison(active_client)
+
+    st.divider()
+    _render_batch_analysis(user_id, active_client)
+
     st.divider()
     _render_analysis_history(user_id, active_client["_id"])
 
@@ -392,17 +609,76 @@ def _sidebar_nav():
         st.session_state.current_page = "Manage Clients"
         st.rerun()
 
+    if is_admin(st.session_state.user) and st.sidebar.button(
+            "Metrics", use_container_width=True,
+            type="primary" if st.session_state.current_page == "Metrics" else "secondary"):
+        st.session_state.current_page = "Metrics"
+        st.rerun()
+
     st.sidebar.markdown("---")
     if st.sidebar.button("Logout", use_container_width=True):
         logout()
 
 
+def metrics_page():
+    st.title("Pipeline Metrics")
+    st.caption("This app process only. Worker processes export their own metrics (METRICS_PORT / METRICS_FILE).")
+    if st.button("Refresh"):
+        st.rerun()
+
+    snap = snapshot()
+    st.subheader("Stage latency")
+    stages = [h for h in snap["histograms"] if h["name"] == "stage_seconds"]
+    if stages:
+        st.dataframe(
+            [{"Stage": h["stage"], "Count": h["count"], "p50 (s)": round(h["p50"], 3), "p95 (s)": round(h["p95"], 3)}
+             for h in stages],
+            use_container_width=True,
+        )
+    else:
+        st.info("No analyses have run in this process yet.")
+
+    llm = [h for h in snap["histograms"] if h["name"].startswith("llm_")]
+    if llm:
+        st.subheader("LLM")
+        st.dataframe(
+            [{"Metric": h["name"], "Model": h.get("model", ""), "Count": h["count"],
+              "p50 (s)": round(h["p50"], 3), "p95 (s)": round(h["p95"], 3)} for h in llm],
+            use_container_width=True,
+        )
+        tokens = [c for c in snap["counters"] if c["name"] == "llm_tokens_total"]
+        cols = st.columns(max(len(tokens), 1))
+        for col, c in zip(cols, tokens):
+            col.metric(f"{c['kind'].replace('_', ' ').title()} ({c['model']})", f"{c['value']:,.0f}")
+
+    prompts = [h for h in snap["histograms"] if h["name"] == "prompt_tokens"]
+    for h in prompts:
+        st.caption(f"Prompt size ({h['model']}, local count): p50 {h['p50']:,.0f} / p95 {h['p95']:,.0f} tokens "
+                   f"over {h['count']} prompts")
+
+    if snap["cache_hit_ratio"]:
+        st.subheader("Cache hit ratio")
+        cols = st.columns(len(snap["cache_hit_ratio"]))
+        for col, (cache, ratio) in zip(cols, sorted(snap["cache_hit_ratio"].items())):
+            col.metric(cache, f"{ratio:.0%}")
+
+    with st.expander("Prometheus text"):
+        text = render_prometheus()
+        st.code(text, language="text")
+        st.download_button("Download metrics.prom", text, file_name="metrics.prom")
+
+
 def main_app():
     _sidebar_nav()
     if st.session_state.current_page == "Dashboard":
         dashboard_page()
     elif st.session_state.current_page == "Manage Clients":
         clients_page()
+    elif st.session_state.current_page == "Metrics" and is_admin(st.session_state.user):
+        metrics_page()
+    else:
+        st.session_state.current_page = "Dashboard"
+        dashboard_page()
 
 
 if not st.session_state.authenticated:
@@ -1,24 +1,75 @@
+import os
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache
+
 import bcrypt
 from database import get_users_collection
+from metrics import timed
+from settings import get_setting
+
+# bcrypt's own default. Each +1 doubles the time per hash (and halves peak logins/sec per core).
+DEFAULT_BCRYPT_ROUNDS = 12
+
+def bcrypt_rounds() -> int:
+    """Work factor for new hashes (BCRYPT_ROUNDS), clamped to what bcrypt accepts."""
+    return min(max(int(get_setting("BCRYPT_ROUNDS", DEFAULT_BCRYPT_ROUNDS)), 4), 31)
+
+@lru_cache(maxsize=None)
+def _executor(workers: int) -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+
+def _hash_executor() -> ThreadPoolExecutor:
+    """Shared pool for bcrypt work (AUTH_HASH_WORKERS, default one per core).
+
+    bcrypt releases the GIL, so a login burst runs at most this many hashes at once and the rest queue,
+    instead of every session's script thread competing for the CPU.
+    """
+    return _executor(int(get_setting("AUTH_HASH_WORKERS", os.cpu_count() or 1)))
 
-def hash_password(password: str) -> bytes:
-    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt())
+def _hash(password: str, rounds: int) -> bytes:
+    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(rounds))
+
+def hash_password(password: str, rounds: int | None = None) -> bytes:
+    with timed("auth_hash"):
+        return _hash_executor().submit(_hash, password, rounds or bcrypt_rounds()).result()
+
+def _as_bytes(hashed_password: str | bytes) -> bytes:
+    # Hashed password from DB might be a string OR bytes
+    if isinstance(hashed_password, str):
+        return hashed_password.encode('utf-8')
+    return hashed_password  # It's already bytes, don't re-encode!
 
 def verify_password(plain_password: str, hashed_password: str | bytes) -> bool:
     """
     Checks a plain-text password against a stored hash.
     Safely handles both string and bytes inputs from MongoDB.
     """
-    # 1. Plain password from user input is always a string, so encode it
+    # Plain password from user input is always a string, so encode it
     password_bytes = plain_password.encode('utf-8')
+    with timed("auth_verify"):
+        return _hash_executor().submit(bcrypt.checkpw, password_bytes, _as_bytes(hashed_password)).result()
 
-    # 2. Hashed password from DB might be a string OR bytes
-    if isinstance(hashed_password, str):
-        hash_bytes = hashed_password.encode('utf-8')
-    else:
-        hash_bytes = hashed_password  # It's already bytes, don't re-encode!
+def hash_rounds(hashed_password: str | bytes) -> int | None:
+    """The cost a stored hash was made with ("$2b$12$..." -> 12)."""
+    try:
+        return int(_as_bytes(hashed_password).split(b"$")[2])
+    except (IndexError, ValueError):
+        return None
 
-    return bcrypt.checkpw(password_bytes, hash_bytes)
+def needs_rehash(hashed_password: str | bytes) -> bool:
+    return hash_rounds(hashed_password) != bcrypt_rounds()
+
+def _rehash_in_background(user_id, old_hash: str | bytes, password: str) -> Future:
+    """Re-hashes at the configured cost without delaying the login that triggered it."""
+    def store(future: Future) -> None:
+        if future.exception() is None:
+            # Conditional on the old hash, so a password change in the meantime is never overwritten
+            get_users_collection().update_one({"_id": user_id, "password": old_hash},
+                                              {"$set": {"password": future.result()}})
+
+    future = _hash_executor().submit(_hash, password, bcrypt_rounds())
+    future.add_done_callback(store)
+    return future
 
 def create_user(email: str, password: str):
     users = get_users_collection()
@@ -43,12 +94,20 @@ def create_user(email: str, password: str):
 
 def authenticate_user(email: str, password: str):
     users = get_users_collection()
-    user = users.find_one({"email": email})
+    with timed("mongo_users_read"):
+        user = users.find_one({"email": email})
 
     if not user:
         return False, "User not found."
 
     if verify_password(password, user["password"]):
+        if needs_rehash(user["password"]):
+            _rehash_in_background(user["_id"], user["password"], password)
         return True, user
 
-    return False, "Incorrect password."
\ No newline at end of file
+    return False, "Incorrect password."
+
+def is_admin(user) -> bool:
+    """Whether the account is listed in ADMIN_EMAILS (comma-separated); only admins see the Metrics page."""
+    admins = {e.strip().lower() for e in str(get_setting("ADMIN_EMAILS", "")).split(",") if e.strip()}
+    return bool(user) and str(user.get("email", "")).strip().lower() in admins
@@ -0,0 +1,111 @@
+import io
+import re
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from typing import Any, Iterator
+
+import pandas as pd
+
+from agent import generate_listing_report
+from metrics import analysis_timings
+from text_index import preference_text
+from ZillowScraper import get_area_comps, get_comps_store, scrape_listing
+
+# Per-stage concurrency limits. Scraping and comps hit homeharvest, the report stage hits OpenAI.
+SCRAPE_CONCURRENCY = 4
+COMPS_CONCURRENCY = 2
+REPORT_CONCURRENCY = 4
+MAX_BATCH_SIZE = 50
+
+_URL_PATTERN = re.compile(r"https?://\S+")
+
+
+@dataclass
+class BatchResult:
+    url: str
+    listing: dict[str, Any] | None = None
+    result: dict[str, Any] | None = None
+    error: str | None = None
+    comps: list[dict[str, Any]] = field(default_factory=list)
+
+
+def parse_batch_urls(text: str = "", csv_file: bytes | io.IOBase | None = None) -> list[str]:
+    """Collects listing URLs from pasted text and/or a CSV (a 'url' column, else the first column)."""
+    urls = _URL_PATTERN.findall(text or "")
+    if csv_file is not None:
+        data = pd.read_csv(io.BytesIO(csv_file) if isinstance(csv_file, bytes) else csv_file)
+        column = next((c for c in data.columns if str(c).strip().lower() == "url"), data.columns[0])
+        urls += [u.strip() for u in data[column].dropna().astype(str) if _URL_PATTERN.match(u.strip())]
+    # De-duplicate while keeping the pasted order
+    return list(dict.fromkeys(urls))[:MAX_BATCH_SIZE]
+
+
+class _MarketLoader:
+    """Loads each city's comps market once per batch, however many listings share it."""
+
+    def __init__(self, limit: int):
+        self._sem = threading.Semaphore(limit)
+        self._lock = threading.Lock()
+        self._futures: dict[tuple[str, str], Future] = {}
+
+    def ensure(self, city: str, state: str) -> None:
+        key = (str(city).lower(), str(state).lower())
+        with self._lock:
+            future = self._futures.get(key)
+            owner = future is None
+            if owner:
+                future = self._futures[key] = Future()
+        if owner:
+            try:
+                with self._sem:
+                    get_comps_store().ensure_market(city, state)
+                future.set_result(None)
+            except Exception as exc:
+                future.set_exception(exc)
+        future.result()
+
+
+def analyze_batch(client: dict[str, Any], urls: list[str], force_refresh: bool = False,
+                  scrape_concurrency: int = SCRAPE_CONCURRENCY, comps_concurrency: int = COMPS_CONCURRENCY,
+                  report_concurrency: int = REPORT_CONCURRENCY, report: bool = True) -> Iterator[BatchResult]:
+    """Runs scrape -> comps -> report for every URL concurrently, yielding results as each one finishes.
+
+    With report=False only the listings and comps are gathered (e.g. to feed a single comparison report).
+    """
+    scrape_sem = threading.Semaphore(scrape_concurrency)
+    report_sem = threading.Semaphore(report_concurrency)
+    markets = _MarketLoader(comps_concurrency)
+    preferences = preference_text(client)
+
+    def run(url: str) -> BatchResult:
+        item = BatchResult(url=url)
+        try:
+            with analysis_timings() as timings:
+                with scrape_sem:
+                    item.listing = scrape_listing(url, force_refresh=force_refresh)
+                city, state = item.listing.get("city"), item.listing.get("state")
+                try:
+                    markets.ensure(city, state)
+                except Exception:
+                    pass  # get_area_comps degrades to no comps, same as the single-listing flow
+                item.comps = get_area_comps(city, state, max_results=5, subject=item.listing, preferences=preferences)
+                if report:
+                    with report_sem:
+                        item.result = generate_listing_report(client, item.listing, item.comps)
+            if item.result is not None:
+                item.result["timings"] = timings
+        except Exception as exc:
+            item.error = str(exc)
+        return item
+
+    workers = max(scrape_concurrency, report_concurrency) + comps_concurrency
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch")
+    try:
+        futures = [pool.submit(run, url) for url in urls]
+        for future in as_completed(futures):
+            yield future.result()
+    finally:
+        # Also runs when the caller abandons the generator (a Streamlit rerun or stop): drop the queued URLs
+        # instead of blocking the script thread until every one is scraped and reported
+        pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,147 @@
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Any
+
+import streamlit as st
+from pymongo.errors import OperationFailure, PyMongoError
+
+from data_access import KeyedCache, get_data_cache
+from database import get_database
+from settings import get_setting
+
+WATCHED_COLLECTIONS = ("clients", "analyses", "suggestions")
+POLL_INTERVAL_SECONDS = 5.0
+# Re-scan a little behind the watermark so small clock skew between replicas can't hide a write
+POLL_OVERLAP_SECONDS = 2.0
+# While a change stream pushes every write (deletes included) from other replicas, cached reads can live much
+# longer. Polling can miss a delete, so it keeps the cache's own TTL as the bound on staleness.
+SYNCED_CACHE_TTL_SECONDS = 300.0
+
+logger = logging.getLogger(__name__)
+
+
+class CacheSync:
+    """Pushes writes made by any replica into this process's caches.
+
+    mode "change_stream" follows a Mongo change stream (needs a replica set / Atlas); "poll" scans
+    updated_at on the watched collections and watches document counts to catch deletes; "auto" tries the
+    change stream and falls back to polling when the server doesn't support it. The cache TTL is raised to
+    SYNCED_CACHE_TTL_SECONDS only while a change stream is open.
+    """
+
+    def __init__(self, db, cache: KeyedCache, mode: str = "auto", poll_interval: float = POLL_INTERVAL_SECONDS):
+        self.db = db
+        self.cache = cache
+        self.mode = mode
+        self.poll_interval = poll_interval
+        self.active_mode: str | None = None
+        self.invalidations = 0
+        self._base_ttl = cache.ttl_seconds
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> "CacheSync":
+        self._thread = threading.Thread(target=self._run, name="cache-sync", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=self.poll_interval + 1)
+
+    # --- invalidation ---
+
+    def _invalidate(self, collection: str, doc: dict[str, Any] | None, doc_id: Any = None) -> None:
+        """Drops the cache entries a write to doc touched, or the whole collection's entries when doc is unknown."""
+        if collection == "clients":
+            known = doc is not None and "realtor_id" in doc
+            prefix = ("clients", doc["realtor_id"]) if known else ("clients",)
+        elif collection == "suggestions":
+            known = doc is not None and "realtor_id" in doc and "client_id" in doc
+            prefix = ("suggestions", doc["realtor_id"], doc["client_id"]) if known else ("suggestions",)
+        else:
+            known = doc is not None and "realtor_id" in doc and "client_id" in doc
+            prefix = ("analyses", doc["realtor_id"], doc["client_id"]) if known else ("analyses",)
+            if doc_id is not None:
+                self.invalidations += self.cache.invalidate("report", doc_id)
+        self.invalidations += self.cache.invalidate(*prefix)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                if self.mode in ("auto", "change_stream"):
+                    self._watch()
+                else:
+                    self._poll()
+            except OperationFailure as exc:
+                if self.mode == "auto":
+                    # Standalone servers can't open change streams; keep caches consistent by polling instead
+                    logger.info("change streams unavailable (%s); polling instead", exc)
+                    self.mode = "poll"
+                    continue
+                logger.warning("cache sync failed: %s", exc)
+            except PyMongoError as exc:
+                logger.warning("cache sync lost its connection (%s); retrying", exc)
+            # Nothing is pushed until the stream reopens
+            self.cache.ttl_seconds = self._base_ttl
+            # Anything we might have missed while disconnected must be reloaded
+            for collection in WATCHED_COLLECTIONS:
+                self._invalidate(collection, None)
+            self._stop.wait(self.poll_interval)
+
+    # --- change streams ---
+
+    def _watch(self) -> None:
+        pipeline = [{"$match": {"ns.coll": {"$in": list(WATCHED_COLLECTIONS)}}}]
+        with self.db.watch(pipeline, full_document="updateLookup", full_document_before_change="whenAvailable",
+                           max_await_time_ms=1000) as stream:
+            self.active_mode = "change_stream"
+            self.cache.ttl_seconds = SYNCED_CACHE_TTL_SECONDS
+            while not self._stop.is_set() and stream.alive:
+                change = stream.try_next()
+                if change is None:
+                    continue
+                doc = change.get("fullDocument") or change.get("fullDocumentBeforeChange")
+                # Deletes without pre-images carry only the _id, so the whole collection's entries are dropped
+                self._invalidate(change["ns"]["coll"], doc, change.get("documentKey", {}).get("_id"))
+
+    # --- polling fallback ---
+
+    def _poll(self) -> None:
+        self.active_mode = "poll"
+        # A delete and an insert in the same interval leave the count unchanged, so deletes can go unnoticed
+        self.cache.ttl_seconds = self._base_ttl
+        watermark = {c: datetime.now(timezone.utc) for c in WATCHED_COLLECTIONS}
+        counts = {c: self.db[c].estimated_document_count() for c in WATCHED_COLLECTIONS}
+        while not self._stop.wait(self.poll_interval):
+            for collection in WATCHED_COLLECTIONS:
+                since = watermark[collection] - timedelta(seconds=POLL_OVERLAP_SECONDS)
+                changed = self.db[collection].find(
+                    {"updated_at": {"$gt": since}}, {"realtor_id": 1, "client_id": 1, "updated_at": 1}
+                )
+                for doc in changed:
+                    self._invalidate(collection, doc, doc["_id"])
+                    updated_at = doc["updated_at"].replace(tzinfo=timezone.utc)
+                    watermark[collection] = max(watermark[collection], updated_at)
+
+                # Deletes leave nothing to find by updated_at; a shrinking count means drop that collection's entries
+                count = self.db[collection].estimated_document_count()
+                if count < counts[collection]:
+                    self._invalidate(collection, None)
+                counts[collection] = count
+
+
+@st.cache_resource
+def start_cache_sync() -> CacheSync | None:
+    """Starts the process-wide watcher once. CACHE_SYNC_MODE: auto (default), change_stream, poll or off."""
+    mode = str(get_setting("CACHE_SYNC_MODE", "auto")).lower()
+    if mode == "off":
+        return None
+    try:
+        db = get_database()
+    except Exception as exc:
+        logger.warning("cache sync disabled: %s", exc)
+        return None
+    return CacheSync(db, get_data_cache(), mode=mode).start()
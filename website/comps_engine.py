@@ -0,0 +1,73 @@
+from typing import Any
+
+import numpy as np
+import pandas as pd
+
+# Feature weights for the comp distance. Price and size dominate; HOA only nudges.
+DEFAULT_WEIGHTS = {
+    "price": 3.0,
+    "sqft": 2.0,
+    "beds": 1.5,
+    "baths": 1.0,
+    "year_built": 0.75,
+    "hoa_monthly": 0.5,
+}
+FEATURES = list(DEFAULT_WEIGHTS)
+
+# normalize_property_row maps missing values to 0; for these a 0 means "unknown", not a real value
+ZERO_MEANS_MISSING = np.array([f != "hoa_monthly" for f in FEATURES])
+# Distance (in std units) charged per feature when a candidate is missing a value the subject has
+MISSING_PENALTY = 1.0
+# Weight of the description match (text_index.py), an extra feature worth 0 for a full match and 1 for none
+TEXT_MATCH_WEIGHT = 1.0
+
+
+def feature_matrix(frame: pd.DataFrame) -> np.ndarray:
+    """Candidate features as an (n, len(FEATURES)) float array, NaN where unknown."""
+    X = frame.reindex(columns=FEATURES).apply(pd.to_numeric, errors="coerce").to_numpy(dtype=float)
+    X[(X == 0) & ZERO_MEANS_MISSING] = np.nan
+    return X
+
+
+def comp_distances(subject: dict[str, Any], X: np.ndarray,
+                   weights: dict[str, float] | None = None) -> np.ndarray:
+    """Weighted Euclidean distance from the subject to every candidate row, in per-feature std units."""
+    weights = {**DEFAULT_WEIGHTS, **(weights or {})}
+    s = np.array([float(subject.get(f) or 0) for f in FEATURES])
+    s[(s == 0) & ZERO_MEANS_MISSING] = np.nan
+
+    # Features the subject doesn't have can't contribute to similarity
+    w = np.array([weights[f] for f in FEATURES]) * ~np.isnan(s)
+
+    scale = np.nanstd(X, axis=0) if len(X) else np.ones(len(FEATURES))
+    scale = np.where(np.isnan(scale) | (scale == 0), 1.0, scale)
+
+    diff = (X - np.nan_to_num(s)) / scale
+    diff = np.where(np.isnan(diff), MISSING_PENALTY, diff)
+    return np.sqrt((diff * diff) @ w)
+
+
+def rank_comps(subject: dict[str, Any], frame: pd.DataFrame, k: int = 5,
+               weights: dict[str, float] | None = None, text_match: np.ndarray | None = None) -> pd.DataFrame:
+    """Returns the k candidates closest to the subject, nearest first, with a 'comp_distance' column.
+
+    text_match, when given, is each candidate's 0-1 description match and is added as one more feature.
+    """
+    if frame.empty or k <= 0:
+        return frame.head(0)
+
+    dist = comp_distances(subject, feature_matrix(frame), weights)
+    if text_match is not None:
+        dist = np.sqrt(dist * dist + TEXT_MATCH_WEIGHT * (1.0 - text_match) ** 2)
+
+    # Never return the subject as its own comp
+    url = subject.get("property_url")
+    if url and "property_url" in frame:
+        dist[(frame["property_url"] == url).to_numpy()] = np.inf
+
+    k = min(k, int(np.isfinite(dist).sum()))
+    if k == 0:
+        return frame.head(0)
+    top = np.argpartition(dist, k - 1)[:k] if k < len(dist) else np.arange(len(dist))
+    top = top[np.argsort(dist[top], kind="stable")]
+    return frame.iloc[top].assign(comp_distance=dist[top])
@@ -0,0 +1,172 @@
+import logging
+import threading
+import time
+from contextlib import closing
+from typing import Any, Callable
+
+import pandas as pd
+
+from local_store import connect
+from metrics import record_cache
+from scrape_gate import SingleFlight
+
+# A market is served straight from the store while younger than REFRESH_AFTER_SECONDS.
+# Between that and MAX_STALE_SECONDS the stored rows are still served, and a background
+# refresh is kicked off. Older than MAX_STALE_SECONDS (or never loaded) it is fetched inline.
+REFRESH_AFTER_SECONDS = 12 * 3600
+MAX_STALE_SECONDS = 7 * 24 * 3600
+PRICE_BAND_WIDTH = 50_000
+
+COMP_SCHEMA = {
+    "street": "TEXT", "city": "TEXT", "state": "TEXT", "price": "REAL", "beds": "INTEGER",
+    "baths": "REAL", "sqft": "INTEGER", "year_built": "INTEGER", "hoa_monthly": "REAL",
+    "status": "TEXT", "property_url": "TEXT", "description": "TEXT",
+}
+COMP_COLUMNS = list(COMP_SCHEMA)
+
+logger = logging.getLogger(__name__)
+
+
+def market_key(city: str, state: str) -> str:
+    return f"{str(city).strip().lower()}|{str(state).strip().lower()}"
+
+
+def price_band(price: float) -> int:
+    return int(max(price, 0) // PRICE_BAND_WIDTH)
+
+
+class CompsStore:
+    """Per-city comparable listings, indexed by market, price band, beds and sqft."""
+
+    def __init__(self, fetch_market: Callable[[str, str], list[dict[str, Any]]], filename: str = "cache.db",
+                 refresh_after: int = REFRESH_AFTER_SECONDS, max_stale: int = MAX_STALE_SECONDS):
+        self.fetch_market = fetch_market
+        self.filename = filename
+        self.refresh_after = refresh_after
+        self.max_stale = max_stale
+        self._refreshing: set[str] = set()
+        self._flight = SingleFlight()
+        self._frames: dict[str, tuple[float, pd.DataFrame]] = {}
+        self._lock = threading.Lock()
+        with closing(connect(self.filename)) as conn, conn:
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS comps_markets (
+                       market TEXT PRIMARY KEY,
+                       fetched_at REAL NOT NULL,
+                       row_count INTEGER NOT NULL
+                   )"""
+            )
+            conn.execute(
+                f"""CREATE TABLE IF NOT EXISTS comps (
+                       market TEXT NOT NULL,
+                       price_band INTEGER NOT NULL,
+                       {", ".join(f"{col} {sql_type}" for col, sql_type in COMP_SCHEMA.items())}
+                   )"""
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_comps_lookup ON comps (market, price_band, beds, sqft)")
+            # Tables created before a column was added get it empty; those markets fill it on their next refresh
+            existing = {row[1] for row in conn.execute("PRAGMA table_info(comps)")}
+            for col, sql_type in COMP_SCHEMA.items():
+                if col not in existing:
+                    conn.execute(f"ALTER TABLE comps ADD COLUMN {col} {sql_type}")
+
+    def _fetched_at(self, market: str) -> float | None:
+        with closing(connect(self.filename)) as conn:
+            row = conn.execute("SELECT fetched_at FROM comps_markets WHERE market = ?", (market,)).fetchone()
+        return row[0] if row else None
+
+    def refresh(self, city: str, state: str) -> int:
+        """Re-scrapes a whole market and atomically replaces its stored rows.
+
+        Concurrent refreshes of one market (e.g. two sessions hitting a cold city) share a single fetch.
+        """
+        market = market_key(city, state)
+        return self._flight.do(market, lambda: self._refresh(market, city, state))[0]
+
+    def _refresh(self, market: str, city: str, state: str) -> int:
+        rows = self.fetch_market(city, state)
+        with closing(connect(self.filename)) as conn, conn:
+            conn.execute("DELETE FROM comps WHERE market = ?", (market,))
+            conn.executemany(
+                f"INSERT INTO comps (market, price_band, {', '.join(COMP_COLUMNS)}) "
+                f"VALUES ({', '.join('?' * (len(COMP_COLUMNS) + 2))})",
+                [(market, price_band(r.get("price", 0)), *(r.get(c) for c in COMP_COLUMNS)) for r in rows],
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO comps_markets (market, fetched_at, row_count) VALUES (?, ?, ?)",
+                (market, time.time(), len(rows)),
+            )
+        return len(rows)
+
+    def _refresh_in_background(self, city: str, state: str) -> None:
+        market = market_key(city, state)
+        with self._lock:
+            if market in self._refreshing:
+                return
+            self._refreshing.add(market)
+
+        def run():
+            try:
+                self.refresh(city, state)
+            except Exception:
+                # Keep serving the stale rows; the next lookup will try again
+                logger.warning("background refresh of %s failed", market, exc_info=True)
+            finally:
+                with self._lock:
+                    self._refreshing.discard(market)
+
+        threading.Thread(target=run, name=f"comps-refresh-{market}", daemon=True).start()
+
+    def ensure_market(self, city: str, state: str) -> None:
+        """Applies the refresh policy: inline load when missing/too old, background refresh when stale."""
+        fetched_at = self._fetched_at(market_key(city, state))
+        age = time.time() - fetched_at if fetched_at is not None else None
+        record_cache("comps_market", age is not None and age <= self.max_stale)
+        if age is None or age > self.max_stale:
+            self.refresh(city, state)
+        elif age > self.refresh_after:
+            self._refresh_in_background(city, state)
+
+    def market_frame(self, city: str, state: str) -> pd.DataFrame:
+        """The whole stored market as a DataFrame, kept in memory until the market is refreshed."""
+        self.ensure_market(city, state)
+        market = market_key(city, state)
+        fetched_at = self._fetched_at(market)
+        cached = self._frames.get(market)
+        if cached and cached[0] == fetched_at:
+            return cached[1]
+        with closing(connect(self.filename)) as conn:
+            frame = pd.read_sql_query(
+                f"SELECT {', '.join(COMP_COLUMNS)} FROM comps WHERE market = ? ORDER BY rowid",
+                conn, params=(market,),
+            )
+        self._frames[market] = (fetched_at, frame)
+        return frame
+
+    def lookup(self, city: str, state: str, max_results: int = 5, price: float | None = None,
+               beds: int | None = None, sqft: int | None = None) -> list[dict[str, Any]]:
+        """Local comps lookup. Optional subject specs narrow the search to nearby bands via the index."""
+        self.ensure_market(city, state)
+
+        clauses, params = ["market = ?"], [market_key(city, state)]
+        if price:
+            band = price_band(price)
+            clauses.append("price_band BETWEEN ? AND ?")
+            params += [band - 2, band + 2]
+        if beds:
+            clauses.append("beds BETWEEN ? AND ?")
+            params += [beds - 1, beds + 1]
+        if sqft:
+            clauses.append("sqft BETWEEN ? AND ?")
+            params += [int(sqft * 0.7), int(sqft * 1.3)]
+
+        query = f"SELECT {', '.join(COMP_COLUMNS)} FROM comps WHERE {' AND '.join(clauses)} ORDER BY rowid LIMIT ?"
+        with closing(connect(self.filename)) as conn:
+            rows = conn.execute(query, (*params, max_results)).fetchall()
+            # Fall back to the whole market when the subject filters are too tight
+            if not rows and len(clauses) > 1:
+                rows = conn.execute(
+                    f"SELECT {', '.join(COMP_COLUMNS)} FROM comps WHERE market = ? ORDER BY rowid LIMIT ?",
+                    (params[0], max_results),
+                ).fetchall()
+        return [dict(zip(COMP_COLUMNS, r)) for r in rows]
@@ -0,0 +1,222 @@
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable
+
+from bson import ObjectId
+
+from database import get_analyses_collection, get_clients_collection, get_suggestions_collection
+from metrics import record_cache, timed
+from report_store import get_report, put_report, release_report, slim_analysis
+
+# Short enough that another tab's writes show up quickly, long enough to absorb a burst of reruns
+CACHE_TTL_SECONDS = 30.0
+HISTORY_PAGE_SIZE = 10
+# Only what the collapsed favorites cards display; the report body is fetched on demand
+HISTORY_PROJECTION = {
+    "listing.street": 1,
+    "listing.city": 1,
+    "listing.state": 1,
+    "listing.price": 1,
+    "result.fit_score": 1,
+    "result.estimated_monthly_cost": 1,
+    "created_at": 1,
+}
+
+
+class KeyedCache:
+    """Thread-safe TTL cache with tuple keys, prefix invalidation and hit/miss counters."""
+
+    def __init__(self, ttl_seconds: float = CACHE_TTL_SECONDS, name: str = "data"):
+        self.ttl_seconds = ttl_seconds
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self._entries: dict[tuple, tuple[float, Any]] = {}
+        # Bumped per prefix by invalidate() (() by clear()), so a load that raced an invalidation isn't stored
+        self._generations: dict[tuple, int] = {}
+        self._lock = threading.Lock()
+
+    def _generation(self, key: tuple) -> tuple[int, ...]:
+        return tuple(self._generations.get(key[:n], 0) for n in range(len(key) + 1))
+
+    def get_or_load(self, key: tuple, loader: Callable[[], Any]) -> Any:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > now:
+                self.hits += 1
+                record_cache(self.name, True)
+                return entry[1]
+            self.misses += 1
+            generation = self._generation(key)
+        record_cache(self.name, False)
+        with timed(f"mongo_{key[0]}_read"):
+            value = loader()
+        with self._lock:
+            # Invalidated while loading: the value may predate the write, so serve it once but don't keep it
+            if self._generation(key) == generation:
+                self._entries[key] = (now + self.ttl_seconds, value)
+        return value
+
+    def invalidate(self, *prefix: Any) -> int:
+        """Drops every entry whose key starts with prefix. Returns how many were dropped."""
+        n = len(prefix)
+        with self._lock:
+            self._generations[prefix] = self._generations.get(prefix, 0) + 1
+            stale = [k for k in self._entries if k[:n] == prefix]
+            for k in stale:
+                del self._entries[k]
+        return len(stale)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._generations[()] = self._generations.get((), 0) + 1
+            self._entries.clear()
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / total if total else 0.0,
+                "entries": len(self._entries),
+            }
+
+
+# Process-wide, keyed per realtor. Cached values are shared between reruns and sessions: treat them as read-only.
+_cache = KeyedCache()
+
+
+def cache_stats() -> dict[str, Any]:
+    return _cache.stats()
+
+
+def get_data_cache() -> KeyedCache:
+    return _cache
+
+
+# --- Clients ---
+
+def get_clients(realtor_id: ObjectId) -> list[dict[str, Any]]:
+    return _cache.get_or_load(
+        ("clients", realtor_id),
+        lambda: list(get_clients_collection().find({"realtor_id": realtor_id}).sort("created_at", -1)),
+    )
+
+
+def insert_client(realtor_id: ObjectId, doc: dict[str, Any]) -> ObjectId:
+    with timed("mongo_clients_write"):
+        inserted = get_clients_collection().insert_one({**doc, "realtor_id": realtor_id}).inserted_id
+    _cache.invalidate("clients", realtor_id)
+    return inserted
+
+
+def update_client(realtor_id: ObjectId, client_id: ObjectId, fields: dict[str, Any]) -> None:
+    with timed("mongo_clients_write"):
+        get_clients_collection().update_one({"_id": client_id}, {"$set": fields})
+    _cache.invalidate("clients", realtor_id)
+
+
+# --- Analyses (favorites) ---
+
+def save_analysis(realtor_id: ObjectId, client_id: ObjectId, url: str, listing: dict, report: dict,
+                  job_id: ObjectId | None = None) -> ObjectId:
+    """Saves a favorite in the compact format (see report_store.py).
+
+    With job_id (background jobs) the save happens once per job: a retried save returns the first one's id.
+    """
+    now = datetime.now(timezone.utc)
+    analyses = get_analyses_collection()
+    with timed("mongo_analyses_write"):
+        report_id = put_report(report.get("report_markdown", ""))
+        try:
+            doc = slim_analysis(realtor_id, client_id, url, listing, report, report_id, now)
+            if job_id is None:
+                inserted = analyses.insert_one(doc).inserted_id
+            else:
+                written = analyses.update_one({"job_id": job_id}, {"$setOnInsert": {**doc, "job_id": job_id}},
+                                              upsert=True)
+                inserted = written.upserted_id
+        except Exception:
+            # No analysis refers to the report, so the reference just taken would keep it forever
+            release_report(report_id)
+            raise
+        if inserted is None:
+            # Saved by an earlier attempt whose worker died before recording it; keep its report reference
+            release_report(report_id)
+            inserted = analyses.find_one({"job_id": job_id}, {"_id": 1})["_id"]
+    _cache.invalidate("analyses", realtor_id, client_id)
+    return inserted
+
+
+def delete_analysis(realtor_id: ObjectId, client_id: ObjectId, analysis_id: ObjectId) -> None:
+    with timed("mongo_analyses_write"):
+        doc = get_analyses_collection().find_one_and_delete({"_id": analysis_id}, {"report_id": 1})
+        if doc and doc.get("report_id"):
+            release_report(doc["report_id"])
+    _cache.invalidate("analyses", realtor_id, client_id)
+    _cache.invalidate("report", analysis_id)
+
+
+def get_analysis_page(realtor_id: ObjectId, client_id: ObjectId, after: tuple | None = None,
+                      page_size: int = HISTORY_PAGE_SIZE) -> tuple[list[dict], bool]:
+    """One page of favorites, newest first, continuing after the (created_at, _id) cursor. Returns (items, has_more)."""
+
+    def load():
+        query = {"realtor_id": realtor_id, "client_id": client_id}
+        if after:
+            created_at, last_id = after
+            query["$or"] = [
+                {"created_at": {"$lt": created_at}},
+                {"created_at": created_at, "_id": {"$lt": last_id}},
+            ]
+        items = list(
+            get_analyses_collection()
+            .find(query, HISTORY_PROJECTION)
+            .sort([("created_at", -1), ("_id", -1)])
+            .limit(page_size + 1)
+        )
+        return items[:page_size], len(items) > page_size
+
+    return _cache.get_or_load(("analyses", realtor_id, client_id, after, page_size), load)
+
+
+def get_analysis_report(analysis_id: ObjectId) -> str:
+    def load():
+        # Not-yet-migrated documents still carry the report inline
+        doc = get_analyses_collection().find_one({"_id": analysis_id}, {"report_id": 1, "result.report_markdown": 1})
+        if doc and doc.get("report_id"):
+            report = get_report(doc["report_id"])
+        else:
+            report = (doc or {}).get("result", {}).get("report_markdown")
+        return report or "No report available."
+
+    return _cache.get_or_load(("report", analysis_id), load)
+
+
+# --- Suggested listings (written by matcher.py during ingestion) ---
+
+SUGGESTIONS_PAGE_SIZE = 8
+
+
+def get_suggestions(realtor_id: ObjectId, client_id: ObjectId, limit: int = SUGGESTIONS_PAGE_SIZE) -> list[dict]:
+    """The client's best undismissed suggested listings."""
+    return _cache.get_or_load(
+        ("suggestions", realtor_id, client_id, limit),
+        lambda: list(
+            get_suggestions_collection()
+            .find({"realtor_id": realtor_id, "client_id": client_id, "dismissed": False})
+            .sort("fit_score", -1)
+            .limit(limit)
+        ),
+    )
+
+
+def dismiss_suggestion(realtor_id: ObjectId, client_id: ObjectId, suggestion_id: ObjectId) -> None:
+    with timed("mongo_suggestions_write"):
+        get_suggestions_collection().update_one(
+            {"_id": suggestion_id}, {"$set": {"dismissed": True, "updated_at": datetime.now(timezone.utc)}}
+        )
+    _cache.invalidate("suggestions", realtor_id, client_id)
@@ -1,13 +1,25 @@
 import os
+import threading
 
 from pymongo import MongoClient
 import streamlit as st
 
+from db_indexes import ensure_indexes
+
 
 @st.cache_resource
 def get_database():
-    client = MongoClient(st.secrets["MONGO_URI"], tlsAllowInvalidCertificates=True)
-    return client["realtor_db"]
+    try:
+        uri = st.secrets["MONGO_URI"]
+    except Exception:
+        # Worker processes and scripts run without Streamlit secrets
+        uri = os.environ["MONGO_URI"]
+    client = MongoClient(uri, tlsAllowInvalidCertificates=True)
+    db = client["realtor_db"]
+    # Once per process (cached resource) and off the page-load path: with Mongo unreachable the build would
+    # otherwise hold up the first render. A no-op when the indexes already exist.
+    threading.Thread(target=ensure_indexes, args=(db,), name="ensure-indexes", daemon=True).start()
+    return db
 
 
 def get_users_collection():
@@ -23,3 +35,18 @@ def get_clients_collection():
 def get_analyses_collection():
     db = get_database()
     return db["analyses"]
+
+
+def get_reports_collection():
+    db = get_database()
+    return db["reports"]
+
+
+def get_jobs_collection():
+    db = get_database()
+    return db["jobs"]
+
+
+def get_suggestions_collection():
+    db = get_database()
+    return db["suggestions"]
@@ -0,0 +1,175 @@
+"""Index bootstrap for the realtor_db collections, plus a query-plan check for the hot queries.
+
+Run the check against a local mongod (or mongomock for a static shape check):
+
+    python website/db_indexes.py --uri mongodb://localhost:27017
+    python website/db_indexes.py --mongomock
+"""
+import argparse
+import logging
+import sys
+from datetime import datetime, timezone
+from typing import Any
+
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import ConnectionFailure, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+# One entry per collection; each index matches a query shape in QUERY_SHAPES below.
+INDEXES = {
+    "users": [
+        IndexModel([("email", ASCENDING)], unique=True, name="email_unique"),
+    ],
+    "clients": [
+        IndexModel([("realtor_id", ASCENDING), ("created_at", DESCENDING)], name="realtor_created"),
+        IndexModel([("updated_at", ASCENDING)], name="updated_at"),
+    ],
+    "analyses": [
+        IndexModel([("realtor_id", ASCENDING), ("client_id", ASCENDING), ("created_at", DESCENDING),
+                    ("_id", DESCENDING)], name="realtor_client_created_id"),
+        IndexModel([("updated_at", ASCENDING)], name="updated_at"),
+        # Only favorites saved by a background job have job_id; one per job
+        IndexModel([("job_id", ASCENDING)], unique=True, name="job_unique",
+                   partialFilterExpression={"job_id": {"$exists": True}}),
+    ],
+    "jobs": [
+        # Present only while a job is queued/running, so one active job per (client, URL)
+        IndexModel([("active_key", ASCENDING)], unique=True, name="active_key_unique",
+                   partialFilterExpression={"active_key": {"$exists": True}}),
+        IndexModel([("status", ASCENDING), ("not_before", ASCENDING), ("created_at", ASCENDING)], name="claim"),
+        IndexModel([("realtor_id", ASCENDING), ("client_id", ASCENDING), ("created_at", DESCENDING)],
+                   name="realtor_client_created"),
+    ],
+    "suggestions": [
+        # One suggestion per (client, listing); the matcher upserts on it
+        IndexModel([("client_id", ASCENDING), ("property_url", ASCENDING)], unique=True, name="client_listing_unique"),
+        IndexModel([("realtor_id", ASCENDING), ("client_id", ASCENDING), ("dismissed", ASCENDING),
+                    ("fit_score", DESCENDING)], name="realtor_client_feed"),
+        IndexModel([("property_url", ASCENDING)], name="property_url"),
+        IndexModel([("updated_at", ASCENDING)], name="updated_at"),
+    ],
+}
+
+# (caller, collection, filter, sort) for every hot query in the app
+QUERY_SHAPES = [
+    ("auth.authenticate_user", "users", {"email": "probe@example.com"}, None),
+    ("data_access.get_clients", "clients", {"realtor_id": ObjectId()}, [("created_at", DESCENDING)]),
+    ("data_access.get_analysis_page", "analyses", {"realtor_id": ObjectId(), "client_id": ObjectId()},
+     [("created_at", DESCENDING), ("_id", DESCENDING)]),
+    ("cache_sync._poll", "clients", {"updated_at": {"$gt": datetime.now(timezone.utc)}}, None),
+    ("cache_sync._poll", "analyses", {"updated_at": {"$gt": datetime.now(timezone.utc)}}, None),
+    ("data_access.save_analysis", "analyses", {"job_id": ObjectId()}, None),
+    ("jobs.get_client_jobs", "jobs", {"realtor_id": ObjectId(), "client_id": ObjectId()},
+     [("created_at", DESCENDING)]),
+    ("data_access.get_suggestions", "suggestions", {"realtor_id": ObjectId(), "client_id": ObjectId(),
+                                                    "dismissed": False}, [("fit_score", DESCENDING)]),
+    ("matcher.update_suggestions", "suggestions", {"property_url": "https://example.com/probe"}, None),
+    ("cache_sync._poll", "suggestions", {"updated_at": {"$gt": datetime.now(timezone.utc)}}, None),
+]
+
+_INDEX_STAGES = {"IXSCAN", "EXPRESS_IXSCAN", "IDHACK"}
+
+
+def _for_backend(db, models: list[IndexModel]) -> list[IndexModel]:
+    """mongomock ignores partialFilterExpression, so a partial unique index there would reject every document
+    without the field; it gets the same keys without the uniqueness instead (query-shape checks still see it)."""
+    if not type(db).__module__.startswith("mongomock"):
+        return models
+    return [IndexModel(list(m.document["key"].items()), name=m.document["name"])
+            if "partialFilterExpression" in m.document else m for m in models]
+
+
+def ensure_indexes(db) -> list[str]:
+    """Creates any missing indexes (idempotent). Returns the index names that could not be built."""
+    failed = []
+    collections = list(INDEXES.items())
+    for i, (collection, models) in enumerate(collections):
+        try:
+            db[collection].create_indexes(_for_backend(db, models))
+        except ConnectionFailure as exc:
+            # Server unreachable: the remaining collections would each wait out the same timeout
+            logger.warning("could not reach MongoDB to build indexes: %s", exc)
+            return failed + [m.document["name"] for _, rest in collections[i:] for m in rest]
+        except PyMongoError as exc:
+            # e.g. duplicate emails already stored block the unique index; the app still works without it
+            logger.warning("could not build indexes on %s: %s", collection, exc)
+            failed += [m.document["name"] for m in models]
+    return failed
+
+
+def _plan_stages(plan: dict[str, Any]) -> list[str]:
+    stages = [plan["stage"]] if "stage" in plan else []
+    for key in ("inputStage", "queryPlan", "outerStage", "innerStage"):
+        if isinstance(plan.get(key), dict):
+            stages += _plan_stages(plan[key])
+    for child in plan.get("inputStages", []):
+        stages += _plan_stages(child)
+    return stages
+
+
+def _index_supports(index_key: list[tuple[str, Any]], filter_fields: set[str],
+                    sort: list[tuple[str, int]] | None) -> bool:
+    """Static check: equality fields form the index prefix and the sort follows it (either direction)."""
+    fields = [k for k, _ in index_key]
+    prefix = set(fields[:len(filter_fields)])
+    if prefix != filter_fields:
+        return False
+    if not sort:
+        return True
+    tail = index_key[len(filter_fields):len(filter_fields) + len(sort)]
+    if [k for k, _ in tail] != [k for k, _ in sort]:
+        return False
+    same = all(d == sd for (_, d), (_, sd) in zip(tail, sort))
+    flipped = all(d == -sd for (_, d), (_, sd) in zip(tail, sort))
+    return same or flipped
+
+
+def check_query_plans(db) -> list[dict[str, Any]]:
+    """Explains each hot query and reports whether it is served by an index without an in-memory sort.
+
+    Backends without explain() (mongomock) fall back to matching the query shape against the index keys.
+    """
+    results = []
+    for caller, collection, query, sort in QUERY_SHAPES:
+        cursor = db[collection].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        if hasattr(cursor, "explain"):
+            planner = cursor.explain().get("queryPlanner", {})
+            stages = _plan_stages(planner.get("winningPlan", {}))
+            ok = bool(_INDEX_STAGES & set(stages)) and "SORT" not in stages and "COLLSCAN" not in stages
+            detail = " <- ".join(stages)
+        else:
+            indexes = db[collection].index_information().values()
+            ok = any(_index_supports(list(info["key"]), set(query), sort) for info in indexes)
+            detail = "static index-shape check"
+        results.append({"query": caller, "collection": collection, "uses_index": ok, "plan": detail})
+    return results
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Create indexes and verify the hot query plans.")
+    parser.add_argument("--uri", default="mongodb://localhost:27017")
+    parser.add_argument("--db", default="realtor_db")
+    parser.add_argument("--mongomock", action="store_true", help="use an in-memory mongomock database")
+    args = parser.parse_args()
+
+    if args.mongomock:
+        import mongomock
+        client = mongomock.MongoClient()
+    else:
+        from pymongo import MongoClient
+        client = MongoClient(args.uri)
+    db = client[args.db]
+
+    ensure_indexes(db)
+    results = check_query_plans(db)
+    for r in results:
+        print(f"{'OK  ' if r['uses_index'] else 'FAIL'} {r['query']:<32} {r['collection']:<10} {r['plan']}")
+    return 0 if all(r["uses_index"] for r in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,153 @@
+"""Scheduled whole-metro listing ingestion into the local listing store (see listing_store.py).
+
+Pulls each market through homeharvest in price-band chunks, normalizes the rows the same way scrape_listing
+does, writes a deduplicated snapshot and reloads the market's comps from it. After the first full pull,
+runs are incremental (listings updated since the previous run). A full pull is repeated every
+--full-every-days to drop delisted homes. The rows each run writes are then matched against every client to refresh the
+suggested-listings feed (see matcher.py; --no-match skips it).
+
+    python website/ingest.py --market "Austin, TX" --market "Denver, CO"
+    python website/ingest.py --every 6          # keep running, every 6 hours (markets from INGEST_MARKETS)
+
+or from cron: 0 */6 * * * cd /path/to/repo && python website/ingest.py
+"""
+import argparse
+import logging
+import math
+import sys
+import time
+from typing import Any
+
+import pandas as pd
+from homeharvest import scrape_property
+
+from listing_store import address_key, get_listing_store
+from matcher import update_suggestions
+from metrics import timed, write_metrics_file
+from scrape_gate import get_scrape_gate
+from settings import get_setting
+from text_index import market_index
+from ZillowScraper import get_comps_store, normalize_frame
+
+LISTING_TYPES = ["for_sale", "pending"]
+# Each homeharvest query is capped at ~10k results, so a metro is pulled one price band at a time.
+# Bands are narrower where most listings are. Listings without a price fall outside every band.
+PRICE_BREAKS = [0, 200_000, 300_000, 400_000, 500_000, 650_000, 800_000, 1_000_000, 1_500_000, 2_500_000, None]
+CHUNK_LIMIT = 10_000
+FULL_EVERY_DAYS = 7
+
+logger = logging.getLogger(__name__)
+
+
+def configured_markets() -> list[tuple[str, str]]:
+    """INGEST_MARKETS, e.g. "Austin, TX; Denver, CO"."""
+    return [parse_market(m) for m in str(get_setting("INGEST_MARKETS", "")).split(";") if m.strip()]
+
+
+def parse_market(text: str) -> tuple[str, str]:
+    city, _, state = text.rpartition(",")
+    if not city.strip() or not state.strip():
+        raise ValueError(f"Market must look like 'City, ST': {text!r}")
+    return city.strip(), state.strip()
+
+
+def fetch_market(city: str, state: str, updated_in_past_hours: int | None = None) -> pd.DataFrame:
+    """All chunks for one market, normalized, plus the columns the store indexes on."""
+    chunks = []
+    for low, high in zip(PRICE_BREAKS, PRICE_BREAKS[1:]):
+        kwargs: dict[str, Any] = {"price_min": low, "limit": CHUNK_LIMIT}
+        if high is not None:
+            kwargs["price_max"] = high - 1
+        if updated_in_past_hours:
+            kwargs["updated_in_past_hours"] = updated_in_past_hours
+        with timed("ingest_chunk"):
+            data = get_scrape_gate().call(scrape_property, location=f"{city}, {state}", listing_type=LISTING_TYPES,
+                                          **kwargs)
+        if data is not None and not data.empty:
+            chunks.append(data)
+    if not chunks:
+        return pd.DataFrame()
+    raw = pd.concat(chunks, ignore_index=True)
+    frame = normalize_frame(raw, as_dicts=False)
+    frame["zip_code"] = raw["zip_code"].astype(str) if "zip_code" in raw else ""
+    frame["address_key"] = (frame["street"] + " " + frame["city"] + " " + frame["state"] + " " +
+                            frame["zip_code"]).map(address_key)
+    # Chunks can overlap at the band edges (and a relisted home can show up twice)
+    return frame[frame["property_url"] != ""].drop_duplicates("property_url", keep="last")
+
+
+def ingest_market(city: str, state: str, full: bool = False,
+                  full_every_days: float = FULL_EVERY_DAYS, match: bool = True) -> dict[str, Any]:
+    store = get_listing_store()
+    last_run = store.ingested_at(city, state)
+    last_full = store.last_full_at(city, state)
+    full = full or last_run is None or last_full is None or time.time() - last_full > full_every_days * 86400
+    # One hour of overlap, so nothing updated around the previous run is missed
+    hours = None if full else math.ceil((time.time() - last_run) / 3600) + 1
+
+    started = time.perf_counter()
+    frame = fetch_market(city, state, updated_in_past_hours=hours)
+    mode = "full" if full else f"incremental ({hours}h)"
+    if frame.empty:
+        # Nothing changed, or the pull was blocked: never replace a market with nothing
+        return {"market": f"{city}, {state}", "mode": mode, "rows": 0, "seconds": time.perf_counter() - started}
+    store.write_snapshot(city, state, frame, full=full)
+    # Comps now load from the snapshot just written instead of scraping inside a request
+    comps_rows = get_comps_store().refresh(city, state)
+    result = {"market": f"{city}, {state}", "mode": mode, "rows": len(frame),
+              "market_rows": comps_rows, "seconds": time.perf_counter() - started}
+    if match:
+        # Only the rows just written: new listings plus price/status changes since the previous run
+        try:
+            with timed("ingest_match"):
+                # Preferences are matched with the market's IDF, same as the dashboard's fit score
+                market = get_comps_store().market_frame(city, state)
+                text_index = market_index(city, state, market) if not market.empty else None
+                result["suggestions"] = update_suggestions(frame, market_text_index=text_index)
+        except Exception as exc:
+            logger.warning("%s, %s: matching skipped: %s", city, state, exc)
+    return result
+
+
+def run_once(markets: list[tuple[str, str]], full: bool, full_every_days: float = FULL_EVERY_DAYS,
+             match: bool = True) -> int:
+    failures = 0
+    for city, state in markets:
+        try:
+            result = ingest_market(city, state, full=full, full_every_days=full_every_days, match=match)
+            print(f"{result['market']}: {result['mode']}, {result['rows']} rows written, "
+                  f"{result.get('market_rows', 0)} in market, {result['seconds']:.1f}s")
+            if "suggestions" in result:
+                m = result["suggestions"]
+                print(f"  matched {m['listings']} listings x {m['clients']} clients ({m['pairs_scored']} pairs scored): "
+                      f"{m['matches']} suggestions, {m['removed']} removed, {m['seconds']:.1f}s")
+        except Exception as exc:
+            failures += 1
+            print(f"{city}, {state}: failed: {exc}", file=sys.stderr)
+    write_metrics_file()
+    return failures
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Ingest whole markets into the local listing store.")
+    parser.add_argument("--market", action="append", default=[], help='"City, ST" (repeatable)')
+    parser.add_argument("--full", action="store_true", help="full pull even if an incremental one would do")
+    parser.add_argument("--full-every-days", type=float, default=FULL_EVERY_DAYS,
+                        help="repeat a full pull this often, so delisted homes drop out")
+    parser.add_argument("--every", type=float, help="keep running, once every N hours")
+    parser.add_argument("--no-match", action="store_true", help="don't refresh clients' suggested listings")
+    args = parser.parse_args()
+
+    markets = [parse_market(m) for m in args.market] or configured_markets()
+    if not markets:
+        parser.error("no markets: pass --market or set INGEST_MARKETS")
+    while True:
+        failures = run_once(markets, args.full, args.full_every_days, match=not args.no_match)
+        if not args.every:
+            return 1 if failures else 0
+        args.full = False
+        time.sleep(args.every * 3600)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,225 @@
+"""Background analysis jobs: the dashboard enqueues, worker processes run scrape -> comps -> report -> save.
+
+Start a worker pool next to the app (needs MONGO_URI in the environment or .streamlit/secrets.toml):
+
+    python website/jobs.py --processes 4
+"""
+import argparse
+import hashlib
+import multiprocessing
+import os
+import socket
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any
+
+from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from database import get_clients_collection, get_jobs_collection
+from metrics import start_metrics_server, timed, write_metrics_file
+from settings import get_setting
+
+STAGES = ("scrape", "comps", "report", "save")
+MAX_ATTEMPTS = 3
+RETRY_BASE_SECONDS = 5
+# A running job whose worker stops renewing its lease (crash, kill) becomes claimable again, up to MAX_ATTEMPTS
+# lost workers in all
+LEASE_SECONDS = 300
+IDLE_SLEEP_SECONDS = 1.0
+ACTIVE_STATUSES = ("queued", "running")
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _dedupe_key(client_id: ObjectId, url: str) -> str:
+    return hashlib.sha256(f"{client_id}|{url.strip().rstrip('/').lower()}".encode("utf-8")).hexdigest()
+
+
+def enqueue_analysis(realtor_id: ObjectId, client_id: ObjectId, url: str, force_refresh: bool = False) -> ObjectId:
+    """Queues an analysis, or returns the already queued/running job for the same client and URL."""
+    key = _dedupe_key(client_id, url)
+    now = _now()
+    job = {
+        "realtor_id": realtor_id,
+        "client_id": client_id,
+        "url": url.strip(),
+        "force_refresh": force_refresh,
+        "status": "queued",
+        "stage": STAGES[0],
+        "stages": {name: {"status": "pending", "attempts": 0} for name in STAGES},
+        "lost_leases": 0,
+        "not_before": now,
+        "created_at": now,
+        "updated_at": now,
+    }
+    try:
+        # active_key only exists while the job is queued/running; a unique index on it does the dedup
+        found = get_jobs_collection().find_one_and_update(
+            {"active_key": key},
+            {"$setOnInsert": {**job, "active_key": key}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+    except DuplicateKeyError:
+        found = get_jobs_collection().find_one({"active_key": key})
+    return found["_id"]
+
+
+def get_client_jobs(realtor_id: ObjectId, client_id: ObjectId, limit: int = 5) -> list[dict[str, Any]]:
+    return list(
+        get_jobs_collection()
+        .find({"realtor_id": realtor_id, "client_id": client_id},
+              {"url": 1, "status": 1, "stage": 1, "stages": 1, "error": 1, "analysis_id": 1, "created_at": 1})
+        .sort("created_at", -1)
+        .limit(limit)
+    )
+
+
+# --- worker ---
+
+def claim_job(worker_id: str) -> dict[str, Any] | None:
+    jobs = get_jobs_collection()
+    now = _now()
+    claim = {"status": "running", "worker": worker_id, "lease_until": now + timedelta(seconds=LEASE_SECONDS),
+             "updated_at": now}
+    # A job that takes its worker down (OOM, SIGKILL) never reaches process_job's retry cap, so lapsed
+    # leases are counted here and the job fails once it has lost MAX_ATTEMPTS workers
+    expired = {"status": "running", "lease_until": {"$lt": now}}
+    jobs.update_many(
+        {**expired, "lost_leases": {"$gte": MAX_ATTEMPTS - 1}},
+        {"$set": {"status": "failed", "updated_at": now,
+                  "error": f"The worker running this job stopped {MAX_ATTEMPTS} times (out of memory or killed)."},
+         "$unset": {"active_key": ""}},
+    )
+    return jobs.find_one_and_update(
+        {**expired, "lost_leases": {"$not": {"$gte": MAX_ATTEMPTS - 1}}},  # $not: also jobs queued without the field
+        {"$set": claim, "$inc": {"lost_leases": 1}},
+        sort=[("created_at", 1)],
+        return_document=ReturnDocument.AFTER,
+    ) or jobs.find_one_and_update(
+        {"status": "queued", "not_before": {"$lte": now}},
+        {"$set": claim},
+        sort=[("created_at", 1)],
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+def _run_stage(job: dict[str, Any], stage: str) -> dict[str, Any]:
+    """Runs one stage and returns the fields to store on the job."""
+    # Imported here so the app process doesn't pay for homeharvest/OpenAI imports just to enqueue
+    from agent import generate_listing_report
+    from data_access import save_analysis
+    from text_index import preference_text
+    from ZillowScraper import get_area_comps, scrape_listing
+
+    if stage == "scrape":
+        return {"listing": scrape_listing(job["url"], force_refresh=job.get("force_refresh", False))}
+    if stage == "comps":
+        listing = job["listing"]
+        client = get_clients_collection().find_one({"_id": job["client_id"]}, {"preferences": 1, "notes": 1}) or {}
+        return {"comps": get_area_comps(listing.get("city"), listing.get("state"), max_results=5, subject=listing,
+                                        preferences=preference_text(client))}
+    if stage == "report":
+        client = get_clients_collection().find_one({"_id": job["client_id"]})
+        if client is None:
+            raise ValueError("Client no longer exists.")
+        return {"result": generate_listing_report(client, job["listing"], job.get("comps", []))}
+    if stage == "save":
+        # Per-analysis breakdown, same shape as the dashboard's: stage -> seconds of the successful attempt
+        timings = {name: info.get("seconds", 0.0) for name, info in job["stages"].items() if name != "save"}
+        result = {**job["result"], "timings": {**timings, "total": round(sum(timings.values()), 4)}}
+        # Keyed on the job, so a save repeated after a worker died mid-stage doesn't add a second favorite
+        return {"analysis_id": save_analysis(job["realtor_id"], job["client_id"], job["url"],
+                                             job["listing"], result, job_id=job["_id"])}
+    raise ValueError(f"Unknown stage {stage}")
+
+
+def process_job(job: dict[str, Any]) -> None:
+    """Runs the job's remaining stages, persisting each stage's output and timing as it completes."""
+    jobs = get_jobs_collection()
+    for stage in STAGES:
+        if job["stages"][stage]["status"] == "done":
+            continue  # finished on an earlier attempt
+        attempts = job["stages"][stage]["attempts"] + 1
+        jobs.update_one({"_id": job["_id"]}, {"$set": {
+            "stage": stage, f"stages.{stage}.status": "running", f"stages.{stage}.attempts": attempts,
+            f"stages.{stage}.started_at": _now(), "updated_at": _now(),
+            "lease_until": _now() + timedelta(seconds=LEASE_SECONDS),
+        }})
+        started = time.perf_counter()
+        try:
+            with timed(f"job_{stage}"):
+                output = _run_stage(job, stage)
+        except Exception as exc:
+            seconds = round(time.perf_counter() - started, 3)
+            retry = attempts < MAX_ATTEMPTS
+            update = {
+                f"stages.{stage}.status": "retrying" if retry else "failed",
+                f"stages.{stage}.seconds": seconds,
+                f"stages.{stage}.error": str(exc),
+                "status": "queued" if retry else "failed",
+                "error": str(exc),
+                "not_before": _now() + timedelta(seconds=RETRY_BASE_SECONDS * 2 ** (attempts - 1)),
+                "updated_at": _now(),
+            }
+            jobs.update_one({"_id": job["_id"]}, {"$set": update, **({} if retry else {"$unset": {"active_key": ""}})})
+            return
+        job.update(output)
+        job["stages"][stage]["status"] = "done"
+        job["stages"][stage]["seconds"] = round(time.perf_counter() - started, 3)
+        jobs.update_one({"_id": job["_id"]}, {"$set": {
+            **output,
+            f"stages.{stage}.status": "done",
+            f"stages.{stage}.seconds": job["stages"][stage]["seconds"],
+            "updated_at": _now(),
+        }})
+    jobs.update_one({"_id": job["_id"]},
+                    {"$set": {"status": "done", "stage": "done", "updated_at": _now()}, "$unset": {"active_key": "", "error": ""}})
+
+
+def worker_loop(worker_id: str, stop_after: int | None = None) -> None:
+    handled = 0
+    while stop_after is None or handled < stop_after:
+        job = claim_job(worker_id)
+        if job is None:
+            time.sleep(IDLE_SLEEP_SECONDS)
+            continue
+        process_job(job)
+        handled += 1
+        write_metrics_file()
+
+
+def _worker_main(index: int) -> None:
+    # METRICS_PORT is the first worker's port; the rest of the pool counts up from it
+    port = get_setting("METRICS_PORT")
+    if port:
+        start_metrics_server(int(port) + index)
+    worker_loop(f"{socket.gethostname()}:{os.getpid()}:{index}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Run background analysis workers.")
+    parser.add_argument("--processes", type=int, default=2)
+    args = parser.parse_args()
+
+    # spawn: MongoClient isn't fork-safe, so each worker builds its own connection pool
+    ctx = multiprocessing.get_context("spawn")
+    workers = [ctx.Process(target=_worker_main, args=(i,), name=f"analysis-worker-{i}") for i in range(args.processes)]
+    for w in workers:
+        w.start()
+    try:
+        for w in workers:
+            w.join()
+    except KeyboardInterrupt:
+        for w in workers:
+            w.terminate()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
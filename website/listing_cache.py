@@ -0,0 +1,97 @@
+import json
+import re
+import time
+from contextlib import closing
+from typing import Any
+
+from local_store import connect
+
+# How long a scraped listing stays fresh, by listing status (seconds).
+# Active listings change price/status often; closed ones barely move.
+STATUS_TTL_SECONDS = {
+    "for_sale": 6 * 3600,
+    "pending": 12 * 3600,
+    "sold": 7 * 24 * 3600,
+    "off_market": 7 * 24 * 3600,
+}
+DEFAULT_TTL_SECONDS = 6 * 3600
+MAX_ENTRIES = 2000
+
+
+def make_cache_key(zpid: str | None, address: str | None) -> str | None:
+    """Keys by zpid when the URL has one, otherwise by a whitespace/case-normalized address."""
+    if zpid:
+        return f"zpid:{zpid}"
+    if address:
+        return "addr:" + re.sub(r"\s+", " ", address).strip().lower()
+    return None
+
+
+def _ttl_for_status(status: str | None) -> int:
+    return STATUS_TTL_SECONDS.get(str(status or "").lower(), DEFAULT_TTL_SECONDS)
+
+
+class ListingCache:
+    """SQLite-backed listing cache with per-status TTL and size-bounded LRU eviction."""
+
+    def __init__(self, max_entries: int = MAX_ENTRIES, filename: str = "cache.db"):
+        self.max_entries = max_entries
+        self.filename = filename
+        with closing(connect(self.filename)) as conn, conn:
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS listing_cache (
+                       key TEXT PRIMARY KEY,
+                       payload TEXT NOT NULL,
+                       expires_at REAL NOT NULL,
+                       last_access REAL NOT NULL
+                   )"""
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_listing_cache_access ON listing_cache (last_access)")
+
+    def get(self, key: str) -> dict[str, Any] | None:
+        now = time.time()
+        with closing(connect(self.filename)) as conn, conn:
+            row = conn.execute(
+                "SELECT payload, expires_at FROM listing_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if not row:
+                return None
+            if row[1] <= now:
+                conn.execute("DELETE FROM listing_cache WHERE key = ?", (key,))
+                return None
+            conn.execute("UPDATE listing_cache SET last_access = ? WHERE key = ?", (now, key))
+        return json.loads(row[0])
+
+    def put(self, key: str, listing: dict[str, Any]) -> None:
+        now = time.time()
+        expires_at = now + _ttl_for_status(listing.get("status"))
+        with closing(connect(self.filename)) as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO listing_cache (key, payload, expires_at, last_access) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(listing), expires_at, now),
+            )
+            # LRU eviction: drop the least recently read rows beyond the size bound
+            conn.execute(
+                """DELETE FROM listing_cache WHERE key IN (
+                       SELECT key FROM listing_cache ORDER BY last_access DESC LIMIT -1 OFFSET ?
+                   )""",
+                (self.max_entries,),
+            )
+
+    def invalidate(self, key: str) -> None:
+        with closing(connect(self.filename)) as conn, conn:
+            conn.execute("DELETE FROM listing_cache WHERE key = ?", (key,))
+
+    def clear(self) -> None:
+        with closing(connect(self.filename)) as conn, conn:
+            conn.execute("DELETE FROM listing_cache")
+
+
+_default_cache: ListingCache | None = None
+
+
+def get_listing_cache() -> ListingCache:
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = ListingCache()
+    return _default_cache
@@ -0,0 +1,149 @@
+"""Local Parquet store of whole-metro listings, written by ingest.py and read by the interactive paths.
+
+Each market is a folder of snapshot files under CACHE_DIR/listings/<market>/:
+
+    <timestamp>-base.parquet   a full pull, or earlier files compacted together
+    <timestamp>-incr.parquet   listings changed since the previous run
+
+A market is read as its latest base plus the increments after it, keeping the newest row per property_url.
+"""
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Any
+
+import pandas as pd
+
+from comps_store import market_key
+from local_store import CACHE_DIR
+
+# Increments after the latest base before they are folded into a new base
+MAX_INCREMENTS = 12
+# Stored next to the normalized listing fields, not returned to callers
+EXTRA_COLUMNS = ["address_key", "zip_code", "ingested_at"]
+
+
+def address_key(text: str) -> str:
+    """Letters and digits only, lowercased: "123 Oak St, Austin, TX 78701" == "123-Oak-St-Austin-TX-78701"."""
+    return re.sub(r"[^a-z0-9]+", " ", str(text).lower()).strip()
+
+
+def _slug(city: str, state: str) -> str:
+    return re.sub(r"[^a-z0-9|]+", "-", market_key(city, state)).replace("|", "--")
+
+
+class ListingStore:
+    """Reads and writes per-market listing snapshots. Merged market frames are kept in memory per file set."""
+
+    def __init__(self, root: Path | None = None):
+        self.root = root or CACHE_DIR / "listings"
+        self._frames: dict[str, tuple[tuple[str, ...], pd.DataFrame]] = {}
+        self._lock = threading.Lock()
+
+    def _dir(self, city: str, state: str) -> Path:
+        return self.root / _slug(city, state)
+
+    def _live_files(self, directory: Path) -> list[Path]:
+        files = sorted(directory.glob("*.parquet")) if directory.exists() else []
+        bases = [i for i, f in enumerate(files) if f.stem.endswith("-base")]
+        return files[bases[-1]:] if bases else files
+
+    def write_snapshot(self, city: str, state: str, frame: pd.DataFrame, full: bool) -> Path:
+        """Writes one run's normalized rows. A full snapshot replaces everything before it."""
+        directory = self._dir(city, state)
+        directory.mkdir(parents=True, exist_ok=True)
+        frame = frame.assign(ingested_at=time.time()).drop_duplicates("property_url", keep="last")
+        path = directory / f"{time.time_ns()}-{'base' if full else 'incr'}.parquet"
+        tmp = path.with_suffix(".tmp")
+        frame.to_parquet(tmp, index=False)
+        tmp.replace(path)  # readers never see a half-written file
+        if full:
+            (directory / "last_full").write_text(str(time.time()))
+        elif len(self._live_files(directory)) > MAX_INCREMENTS + 1:
+            self.compact(city, state)
+        self._prune(directory)
+        return path
+
+    def compact(self, city: str, state: str) -> Path | None:
+        """Folds the live files into a single base snapshot."""
+        directory = self._dir(city, state)
+        merged = self._read(self._live_files(directory))
+        if merged.empty:
+            return None
+        path = directory / f"{time.time_ns()}-base.parquet"
+        tmp = path.with_suffix(".tmp")
+        merged.to_parquet(tmp, index=False)
+        tmp.replace(path)
+        self._prune(directory)
+        return path
+
+    def _prune(self, directory: Path) -> None:
+        live = set(self._live_files(directory))
+        for f in directory.glob("*.parquet"):
+            if f not in live:
+                f.unlink(missing_ok=True)
+
+    @staticmethod
+    def _read(files: list[Path]) -> pd.DataFrame:
+        if not files:
+            return pd.DataFrame()
+        frame = pd.concat([pd.read_parquet(f) for f in files], ignore_index=True)
+        # Files are in time order, so the last row per URL is the newest
+        return frame.drop_duplicates("property_url", keep="last").reset_index(drop=True)
+
+    def _frame(self, directory: Path) -> pd.DataFrame:
+        files = self._live_files(directory)
+        names = tuple(f.name for f in files)
+        with self._lock:
+            cached = self._frames.get(directory.name)
+            if cached and cached[0] == names:
+                return cached[1]
+        frame = self._read(files)
+        with self._lock:
+            self._frames[directory.name] = (names, frame)
+        return frame
+
+    def market_frame(self, city: str, state: str) -> pd.DataFrame:
+        """All known listings for a market, newest row per URL (empty when it has never been ingested)."""
+        frame = self._frame(self._dir(city, state))
+        return frame.drop(columns=EXTRA_COLUMNS, errors="ignore")
+
+    def ingested_at(self, city: str, state: str) -> float | None:
+        """When the market was last written (any snapshot)."""
+        files = self._live_files(self._dir(city, state))
+        return files[-1].stat().st_mtime if files else None
+
+    def last_full_at(self, city: str, state: str) -> float | None:
+        """When the market was last pulled in full (compaction doesn't count: it can't see delistings)."""
+        marker = self._dir(city, state) / "last_full"
+        return float(marker.read_text()) if marker.exists() else None
+
+    def find_listing(self, zpid: str | None, address: str | None,
+                     max_age: float | None = None) -> dict[str, Any] | None:
+        """A listing by zpid, else by URL address, from any market ingested within max_age seconds."""
+        key = address_key(address) if address else None
+        directories = sorted(p for p in self.root.iterdir() if p.is_dir()) if self.root.exists() else []
+        for directory in directories:
+            files = self._live_files(directory)
+            if not files or (max_age is not None and time.time() - files[-1].stat().st_mtime > max_age):
+                continue
+            frame = self._frame(directory)
+            hit = frame.iloc[0:0]
+            if zpid:
+                hit = frame[frame["property_url"].str.contains(f"/{zpid}_zpid", regex=False)]
+            if hit.empty and key:
+                hit = frame[frame["address_key"] == key]
+            if not hit.empty:
+                return hit.drop(columns=EXTRA_COLUMNS, errors="ignore").to_dict("records")[0]
+        return None
+
+
+_store: ListingStore | None = None
+
+
+def get_listing_store() -> ListingStore:
+    global _store
+    if _store is None:
+        _store = ListingStore()
+    return _store
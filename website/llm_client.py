@@ -0,0 +1,65 @@
+from functools import lru_cache
+from typing import Any
+
+from openai import DEFAULT_CONNECTION_LIMITS, DefaultHttpxClient, OpenAI, Timeout
+
+from settings import get_setting
+
+# Limits class of whichever httpx build the installed SDK uses
+_Limits = type(DEFAULT_CONNECTION_LIMITS)
+
+# Defaults; each can be overridden in .streamlit/secrets.toml or the environment.
+#   OPENAI_BASE_URL      point at a proxy or a local mock server
+#   OPENAI_TIMEOUT_S     total per-request timeout
+#   OPENAI_CONNECT_TIMEOUT_S
+#   OPENAI_MAX_RETRIES   retries on 408/409/429/5xx and connection errors, with exponential backoff
+DEFAULT_TIMEOUT_S = 60.0
+DEFAULT_CONNECT_TIMEOUT_S = 5.0
+DEFAULT_MAX_RETRIES = 3
+MAX_CONNECTIONS = 20
+MAX_KEEPALIVE_CONNECTIONS = 10
+KEEPALIVE_EXPIRY_S = 90.0
+
+
+def get_api_key() -> str | None:
+    return get_setting("OPENAI_API_KEY")
+
+
+def _client_options() -> dict[str, Any]:
+    return {
+        "api_key": get_api_key(),
+        "base_url": get_setting("OPENAI_BASE_URL"),
+        "timeout": float(get_setting("OPENAI_TIMEOUT_S", DEFAULT_TIMEOUT_S)),
+        "connect_timeout": float(get_setting("OPENAI_CONNECT_TIMEOUT_S", DEFAULT_CONNECT_TIMEOUT_S)),
+        "max_retries": int(get_setting("OPENAI_MAX_RETRIES", DEFAULT_MAX_RETRIES)),
+    }
+
+
+def _http_settings(timeout: float, connect_timeout: float) -> dict[str, Any]:
+    return {
+        "timeout": Timeout(timeout, connect=connect_timeout),
+        "limits": _Limits(max_connections=MAX_CONNECTIONS,
+                          max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+                          keepalive_expiry=KEEPALIVE_EXPIRY_S),
+    }
+
+
+@lru_cache(maxsize=4)
+def _build_client(api_key: str | None, base_url: str | None, timeout: float, connect_timeout: float,
+                  max_retries: int) -> OpenAI:
+    return OpenAI(
+        api_key=api_key,
+        base_url=base_url,
+        max_retries=max_retries,
+        http_client=DefaultHttpxClient(**_http_settings(timeout, connect_timeout)),
+    )
+
+
+def get_openai_client() -> OpenAI:
+    """Process-wide OpenAI client; its keep-alive pool is shared by every report."""
+    return _build_client(**_client_options())
+
+
+def reset_clients() -> None:
+    """Drops cached clients, e.g. after changing settings in tests or benchmarks."""
+    _build_client.cache_clear()
@@ -0,0 +1,14 @@
+import os
+import sqlite3
+from pathlib import Path
+
+# Local SQLite file shared by the on-disk caches. Override the folder with CLOSERAI_CACHE_DIR.
+CACHE_DIR = Path(os.environ.get("CLOSERAI_CACHE_DIR", Path(__file__).parent / ".cache"))
+
+
+def connect(filename: str = "cache.db") -> sqlite3.Connection:
+    """Opens a connection to the local cache database (one connection per call, safe across threads)."""
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(CACHE_DIR / filename, timeout=10, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    return conn
@@ -0,0 +1,155 @@
+"""Reverse matching: scores new or changed listings against every client and fills the suggested-listings feed.
+
+Run by ingest.py after each snapshot. Clients are indexed by monthly budget, so each listing is only scored
+against clients whose budget can still reach the threshold (see min_budget_for).
+"""
+import math
+import time
+from datetime import datetime, timezone
+from typing import Any
+
+import numpy as np
+import pandas as pd
+from pymongo import UpdateOne
+
+from affordability import carrying_costs
+from database import get_clients_collection, get_suggestions_collection
+from scoring import PREFERENCE_POINTS, client_profile, fit_score_matrix, monthly_budgets
+from settings import get_setting
+from text_index import TextIndex, build_index, descriptions, preference_text, to_match
+
+DEFAULT_MIN_SCORE = 75
+# Best score a listing can get outside the budget rule: base 50 + credit 15 + savings 15 + lifestyle
+# (see agent._fit_score)
+_BEST_WITHOUT_BUDGET = 80 + PREFERENCE_POINTS
+# Listings whose minimum feasible budgets are within this factor of each other share one candidate scan
+BUCKET_RATIO = 1.25
+
+
+def min_score() -> int:
+    return int(get_setting("SUGGESTION_MIN_SCORE", DEFAULT_MIN_SCORE))
+
+
+def min_budget_for(est_monthly: np.ndarray, threshold: int) -> np.ndarray:
+    """Smallest monthly budget that can still reach threshold, per listing (inf when nothing can).
+
+    The budget rule adds +25 at ratio <= 0.85, +10 at <= 1.0, 0 at <= 1.15 and -25 above (-30 with no budget),
+    so the points still needed after the best credit/savings outcome bound the cost/budget ratio.
+    """
+    need = threshold - _BEST_WITHOUT_BUDGET
+    if need <= -30:
+        floor = np.zeros_like(est_monthly)
+    elif need <= -25:
+        floor = np.where(est_monthly > 0, np.nextafter(0, 1), 0.0)
+    else:
+        max_ratio = 1.15 if need <= 0 else 1.0 if need <= 10 else 0.85 if need <= 25 else 0.0
+        with np.errstate(divide="ignore"):
+            floor = est_monthly / max_ratio if max_ratio else np.full_like(est_monthly, np.inf)
+    # The budget rule is skipped for listings without a price, so every client is feasible
+    return np.where(est_monthly > 0, floor, 0.0)
+
+
+class ClientBudgetIndex:
+    """Clients sorted by monthly budget; the feasible clients for a minimum budget are a suffix."""
+
+    def __init__(self, clients: list[dict[str, Any]]):
+        profiles = [client_profile(c) for c in clients]
+        budgets = monthly_budgets(profiles) if clients else np.zeros(0)
+        order = np.argsort(budgets, kind="stable")
+        self.clients = [clients[i] for i in order]
+        self.profiles = [profiles[i] for i in order]
+        self.preferences = [preference_text(c) for c in self.clients]
+        self.budgets = budgets[order]
+
+    def feasible_start(self, min_budget: float) -> int:
+        return int(np.searchsorted(self.budgets, min_budget, side="left"))
+
+
+def load_client_index() -> ClientBudgetIndex:
+    clients = list(get_clients_collection().find({}, {"realtor_id": 1, "profile": 1, "financial_profile": 1,
+                                                      "preferences": 1, "notes": 1}))
+    return ClientBudgetIndex(clients)
+
+
+def match_listings(listings: pd.DataFrame, index: ClientBudgetIndex | None = None,
+                   threshold: int | None = None,
+                   market_text_index: TextIndex | None = None) -> tuple[list[tuple[int, int, int]], int]:
+    """(listing position, client position in index, fit score) for every pair at or above threshold.
+
+    Also returns how many pairs were actually scored (vs. len(listings) * len(clients) for an all-pairs scan).
+    Preferences are matched against market_text_index (text_index.market_index over the listings' whole market,
+    as the dashboard does), else against an index over these listings alone.
+    """
+    index = index or load_client_index()
+    threshold = min_score() if threshold is None else threshold
+    if listings.empty or not index.clients:
+        return [], 0
+    prices = listings["price"].to_numpy(dtype=float)
+    est = np.where(prices != 0, carrying_costs(prices, listings["hoa_monthly"].to_numpy(dtype=float)), 0.0)
+    floors = min_budget_for(est, threshold)
+
+    # Bucket listings by their minimum budget; one matrix per bucket over the clients that can afford its cheapest
+    feasible = np.isfinite(floors)
+    buckets = np.where(floors[feasible] > 0,
+                       np.floor(np.log(np.maximum(floors[feasible], 1.0)) / math.log(BUCKET_RATIO)), -1)
+    positions = np.flatnonzero(feasible)
+    texts = descriptions(listings)
+    text_index = None
+    if any(index.preferences) and any(t.strip() for t in texts):
+        # A small incremental batch makes a poor vocabulary/IDF on its own and overstates the match
+        text_index = market_text_index if market_text_index is not None else build_index(texts)
+    matches, scored = [], 0
+    for bucket in np.unique(buckets):
+        members = positions[buckets == bucket]
+        start = index.feasible_start(floors[members].min())
+        if start >= len(index.clients):
+            continue
+        preference_match = None
+        if text_index is not None:
+            # Only clients with preference text get lifestyle points; the rest stay at 0
+            rows = [i for i in range(start, len(index.clients)) if index.preferences[i]]
+            preference_match = np.zeros((len(index.clients) - start, len(members)))
+            if rows:
+                sims = text_index.text_similarity([index.preferences[i] for i in rows], [texts[m] for m in members])
+                preference_match[np.array(rows) - start] = np.round(to_match(text_index, sims), 3)
+        scores = fit_score_matrix(index.profiles[start:], listings.iloc[members], preference_match=preference_match)
+        scored += scores.size
+        rows, cols = np.nonzero(scores >= threshold)
+        matches += [(int(members[c]), int(start + r), int(scores[r, c])) for r, c in zip(rows, cols)]
+    return matches, scored
+
+
+def update_suggestions(listings: pd.DataFrame, index: ClientBudgetIndex | None = None,
+                       threshold: int | None = None, market_text_index: TextIndex | None = None) -> dict[str, int]:
+    """Upserts suggestions for matched (client, listing) pairs and drops ones these listings no longer earn.
+
+    Only for-sale listings are suggested; a listing that went pending or changed price below the threshold
+    loses its old suggestions (unless the realtor already dismissed them).
+    """
+    run_started = datetime.now(timezone.utc)
+    started = time.perf_counter()
+    index = index or load_client_index()
+    for_sale = listings[listings["status"].astype(str).str.lower() == "for_sale"].reset_index(drop=True)
+    matches, scored = match_listings(for_sale, index, threshold, market_text_index)
+
+    est = carrying_costs(for_sale["price"].to_numpy(dtype=float), for_sale["hoa_monthly"].to_numpy(dtype=float))
+    records = for_sale.to_dict("records")
+    ops = []
+    for pos, client_pos, score in matches:
+        client = index.clients[client_pos]
+        listing = records[pos]
+        ops.append(UpdateOne(
+            {"client_id": client["_id"], "property_url": listing["property_url"]},
+            {"$set": {"realtor_id": client["realtor_id"], "listing": listing, "fit_score": score,
+                      "estimated_monthly_cost": float(est[pos]), "updated_at": run_started},
+             "$setOnInsert": {"created_at": run_started, "dismissed": False}},
+            upsert=True,
+        ))
+    suggestions = get_suggestions_collection()
+    if ops:
+        suggestions.bulk_write(ops, ordered=False)
+    urls = listings["property_url"].tolist()
+    removed = suggestions.delete_many({"property_url": {"$in": urls}, "updated_at": {"$lt": run_started},
+                                       "dismissed": False}).deleted_count if urls else 0
+    return {"listings": len(for_sale), "clients": len(index.clients), "pairs_scored": scored, "matches": len(matches),
+            "removed": removed, "seconds": round(time.perf_counter() - started, 3)}
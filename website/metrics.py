@@ -0,0 +1,192 @@
+"""In-process latency/cache/token metrics for the analysis pipeline, exportable in Prometheus text format.
+
+Set METRICS_PORT to serve /metrics over HTTP from each process (on loopback unless METRICS_HOST says
+otherwise), or METRICS_FILE to have write_metrics_file() dump the same text to disk (the worker pool does
+this after every job).
+"""
+import contextvars
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Iterator
+
+import numpy as np
+
+from settings import get_setting
+
+# Quantiles are computed over the most recent samples of each series
+SAMPLE_WINDOW = 2048
+QUANTILES = (0.5, 0.95)
+
+_lock = threading.Lock()
+_samples: dict[tuple[str, tuple], deque] = defaultdict(lambda: deque(maxlen=SAMPLE_WINDOW))
+_sums: dict[tuple[str, tuple], float] = defaultdict(float)
+_counts: dict[tuple[str, tuple], int] = defaultdict(int)
+_counters: dict[tuple[str, tuple], float] = defaultdict(float)
+
+# Stage -> seconds for the analysis currently running on this thread/context (see analysis_timings)
+_current_timings: contextvars.ContextVar[dict[str, float] | None] = contextvars.ContextVar("analysis_timings",
+                                                                                          default=None)
+
+
+def _key(name: str, labels: dict[str, str] | None) -> tuple[str, tuple]:
+    return name, tuple(sorted((labels or {}).items()))
+
+
+def observe(name: str, value: float, **labels: str) -> None:
+    key = _key(name, labels)
+    with _lock:
+        _samples[key].append(value)
+        _sums[key] += value
+        _counts[key] += 1
+
+
+def increment(name: str, amount: float = 1, **labels: str) -> None:
+    with _lock:
+        _counters[_key(name, labels)] += amount
+
+
+def record_cache(cache: str, hit: bool) -> None:
+    increment("cache_requests_total", cache=cache, result="hit" if hit else "miss")
+
+
+@contextmanager
+def timed(stage: str) -> Iterator[None]:
+    """Times a pipeline stage into the stage_seconds histogram and the current analysis breakdown."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - started)
+
+
+def record_stage(stage: str, seconds: float) -> None:
+    """Same as timed(), for durations measured by hand (e.g. across a generator's lifetime)."""
+    observe("stage_seconds", seconds, stage=stage)
+    timings = _current_timings.get()
+    if timings is not None:
+        timings[stage] = round(timings.get(stage, 0.0) + seconds, 4)
+
+
+@contextmanager
+def analysis_timings() -> Iterator[dict[str, float]]:
+    """Collects every timed() stage run inside the block into the yielded dict (stored with the analysis)."""
+    timings: dict[str, float] = {}
+    token = _current_timings.set(timings)
+    started = time.perf_counter()
+    try:
+        yield timings
+    finally:
+        timings["total"] = round(time.perf_counter() - started, 4)
+        _current_timings.reset(token)
+
+
+# --- reading ---
+
+def _read() -> tuple[dict, dict, dict, dict]:
+    with _lock:
+        samples = {k: np.fromiter(v, dtype=float) for k, v in _samples.items()}
+        return samples, dict(_sums), dict(_counts), dict(_counters)
+
+
+def _quantiles(values: np.ndarray) -> list[float]:
+    return [float(q) for q in np.quantile(values, QUANTILES)] if len(values) else [0.0] * len(QUANTILES)
+
+
+def snapshot() -> dict[str, Any]:
+    """Histograms with p50/p95, raw counters and per-cache hit ratios."""
+    samples, sums, counts, counters = _read()
+
+    histograms = []
+    for (name, labels), values in sorted(samples.items()):
+        p50, p95 = _quantiles(values)
+        histograms.append({"name": name, **dict(labels), "count": counts[(name, labels)],
+                           "p50": p50, "p95": p95, "sum": sums[(name, labels)]})
+
+    caches: dict[str, dict[str, float]] = defaultdict(lambda: {"hit": 0.0, "miss": 0.0})
+    for (name, labels), value in counters.items():
+        if name == "cache_requests_total":
+            lbl = dict(labels)
+            caches[lbl["cache"]][lbl["result"]] += value
+    hit_ratios = {c: v["hit"] / (v["hit"] + v["miss"]) if v["hit"] + v["miss"] else 0.0 for c, v in caches.items()}
+
+    return {
+        "histograms": histograms,
+        "counters": [{"name": n, **dict(l), "value": v} for (n, l), v in sorted(counters.items())],
+        "cache_hit_ratio": hit_ratios,
+    }
+
+
+def _labels_text(labels: tuple, extra: dict[str, str] | None = None) -> str:
+    items = list(labels) + list((extra or {}).items())
+    return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}" if items else ""
+
+
+def render_prometheus() -> str:
+    """Prometheus text exposition: histograms as summaries (quantiles over the recent window), counters as-is."""
+    samples, sums, counts, counters = _read()
+
+    lines = []
+    for name in sorted({n for n, _ in samples}):
+        lines.append(f"# TYPE closerai_{name} summary")
+        for (n, labels), values in sorted(samples.items()):
+            if n != name:
+                continue
+            for q, v in zip(QUANTILES, _quantiles(values)):
+                lines.append(f"closerai_{name}{_labels_text(labels, {'quantile': str(q)})} {v:.6f}")
+            lines.append(f"closerai_{name}_sum{_labels_text(labels)} {sums[(n, labels)]:.6f}")
+            lines.append(f"closerai_{name}_count{_labels_text(labels)} {counts[(n, labels)]}")
+    for name in sorted({n for n, _ in counters}):
+        lines.append(f"# TYPE closerai_{name} counter")
+        for (n, labels), value in sorted(counters.items()):
+            if n == name:
+                lines.append(f"closerai_{name}{_labels_text(labels)} {value:g}")
+    return "\n".join(lines) + "\n"
+
+
+def write_metrics_file(path: str | None = None) -> Path | None:
+    path = path or get_setting("METRICS_FILE")
+    if not path:
+        return None
+    target = Path(path)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp = target.with_suffix(target.suffix + ".tmp")
+    tmp.write_text(render_prometheus())
+    tmp.replace(target)  # atomic, so a scraper never reads half a file
+    return target
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip("/") != "/metrics":
+            self.send_error(404)
+            return
+        body = render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+_server: ThreadingHTTPServer | None = None
+
+
+def start_metrics_server(port: int | None = None) -> ThreadingHTTPServer | None:
+    """Serves /metrics on METRICS_HOST:METRICS_PORT (once per process). Returns None when no port is configured.
+
+    METRICS_HOST defaults to loopback; set it to 0.0.0.0 (or an interface address) for a remote scraper.
+    """
+    global _server
+    port = port or get_setting("METRICS_PORT")
+    if _server is not None or not port:
+        return _server
+    _server = ThreadingHTTPServer((str(get_setting("METRICS_HOST", "127.0.0.1")), int(port)), _MetricsHandler)
+    threading.Thread(target=_server.serve_forever, name="metrics-http", daemon=True).start()
+    return _server
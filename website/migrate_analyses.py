@@ -0,0 +1,84 @@
+"""Migrates saved analyses to the compact format (see report_store.py).
+
+Moves each report body into the reports collection (compressed, deduplicated) and rewrites the analysis as a
+slim summary plus a compressed details blob. Safe to interrupt and re-run: only documents still in the
+original format are read, and each is replaced only if it is still in that format.
+
+    python website/migrate_analyses.py --dry-run     # sizes before/after, writes nothing
+    python website/migrate_analyses.py --verify      # migrate, checking every document reads back the same
+"""
+import argparse
+import sys
+import time
+from typing import Any
+
+import bson
+
+from database import get_analyses_collection
+from report_store import expand_analysis, put_report, release_report, report_hash, slim_analysis
+
+BATCH_SIZE = 500
+
+
+def migrate(batch_size: int = BATCH_SIZE, dry_run: bool = False, verify: bool = False) -> dict[str, Any]:
+    analyses = get_analyses_collection()
+    stats = {"documents": 0, "bytes_before": 0, "bytes_after": 0, "mismatches": 0, "skipped": 0}
+    report_ids: set[str] = set()
+    last_id = None
+    while True:
+        query: dict[str, Any] = {"format": {"$exists": False}}
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        batch = list(analyses.find(query).sort("_id", 1).limit(batch_size))
+        if not batch:
+            break
+        for doc in batch:
+            last_id = doc["_id"]
+            listing, result = doc.get("listing") or {}, doc.get("result") or {}
+            markdown = result.get("report_markdown") or ""
+            report_id = report_hash(markdown) if dry_run else put_report(markdown)
+            slim = {"_id": doc["_id"], **slim_analysis(
+                doc["realtor_id"], doc["client_id"], doc.get("url", ""), listing, result, report_id,
+                doc.get("created_at") or doc["_id"].generation_time, doc.get("updated_at"),
+            )}
+            stats["documents"] += 1
+            stats["bytes_before"] += len(bson.encode(doc))
+            stats["bytes_after"] += len(bson.encode(slim))
+            report_ids.add(report_id)
+            if dry_run:
+                continue
+            # updated_at is left alone: nothing the app shows has changed, so other replicas' caches stay valid
+            if not analyses.replace_one({"_id": doc["_id"], "format": {"$exists": False}}, slim).modified_count:
+                release_report(report_id)  # deleted (or migrated by another run) meanwhile
+                stats["skipped"] += 1
+            elif verify:
+                expanded = expand_analysis(slim)
+                if expanded["listing"] != listing or expanded["result"] != {**result, "report_markdown": markdown}:
+                    stats["mismatches"] += 1
+                    print(f"[migrate] {doc['_id']} does not read back the same", file=sys.stderr)
+    stats["distinct_reports"] = len(report_ids)
+    return stats
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Migrate saved analyses to the compact storage format.")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--dry-run", action="store_true", help="report the size change without writing")
+    parser.add_argument("--verify", action="store_true", help="read every migrated document back and compare")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    stats = migrate(args.batch_size, dry_run=args.dry_run, verify=args.verify)
+    before, after = stats["bytes_before"], stats["bytes_after"]
+    print(f"{'would migrate' if args.dry_run else 'migrated'} {stats['documents']} analyses "
+          f"({stats['distinct_reports']} distinct reports) in {time.perf_counter() - started:.1f}s")
+    if stats["documents"]:
+        print(f"analyses documents: {before / 1024:.0f} KiB -> {after / 1024:.0f} KiB "
+              f"({after / before:.0%} of the original size; report bodies now in the reports collection)")
+    if stats["skipped"]:
+        print(f"{stats['skipped']} changed while migrating and were left as they are")
+    return 1 if stats["mismatches"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,94 @@
+"""Token counting and compact encodings for the report prompt.
+
+Counts use tiktoken when it is installed (and its encoding files are available); otherwise a ~4 chars/token
+estimate, which is close enough for budgeting English prompts.
+"""
+import math
+from functools import lru_cache
+from typing import Any
+
+import numpy as np
+
+from settings import get_setting
+
+DEFAULT_PROMPT_TOKEN_BUDGET = 1200
+# Free-text client fields are capped before any comps are dropped
+FREE_TEXT_TOKEN_CAP = 120
+MIN_PROMPT_COMPS = 2
+
+
+def prompt_token_budget() -> int:
+    return int(get_setting("PROMPT_TOKEN_BUDGET", DEFAULT_PROMPT_TOKEN_BUDGET))
+
+
+@lru_cache(maxsize=4)
+def _encoding(model: str):
+    try:
+        import tiktoken
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception:
+        # Not installed, or the encoding file can't be downloaded (offline)
+        return None
+
+
+def count_tokens(text: str, model: str = "gpt-4o") -> int:
+    enc = _encoding(model)
+    if enc is None:
+        return math.ceil(len(text) / 4)
+    return len(enc.encode(text, disallowed_special=()))
+
+
+def truncate_tokens(text: str, max_tokens: int, model: str = "gpt-4o") -> str:
+    """Cuts text to about max_tokens, at a word boundary, marking the cut with an ellipsis."""
+    if count_tokens(text, model) <= max_tokens:
+        return text
+    enc = _encoding(model)
+    cut = enc.decode(enc.encode(text, disallowed_special=())[:max_tokens]) if enc else text[:max_tokens * 4]
+    return cut.rsplit(" ", 1)[0].rstrip(" ,.;:") + "…"
+
+
+def _money(value: float) -> str:
+    if not value:
+        return "n/a"
+    return f"${value / 1e6:.2f}M" if value >= 1e6 else f"${value / 1e3:.0f}k"
+
+
+def comps_table(comps: list[dict[str, Any]]) -> str:
+    """Comps as a pipe table with only the fields the report compares (no URLs, no repeated city/state)."""
+    if not comps:
+        return "No comparable listings available."
+    rows = ["street|price|bd/ba|sqft|$/sqft|built|hoa|status"]
+    for c in comps:
+        price, sqft = float(c.get("price") or 0), float(c.get("sqft") or 0)
+        ppsf = f"{price / sqft:.0f}" if price and sqft else "n/a"
+        hoa = float(c.get("hoa_monthly") or 0)
+        rows.append(f"{c.get('street')}|{_money(price)}|{c.get('beds')}/{c.get('baths', 0):g}|{sqft:.0f}|{ppsf}|"
+                    f"{c.get('year_built')}|{f'{hoa:.0f}' if hoa else '-'}|{str(c.get('status', '')).lower()}")
+    return "\n".join(rows)
+
+
+def _comp_medians(comps: list[dict[str, Any]]) -> tuple[str, str]:
+    prices = np.array([float(c.get("price") or 0) for c in comps])
+    sqft = np.array([float(c.get("sqft") or 0) for c in comps])
+    priced = prices > 0
+    both = priced & (sqft > 0)
+    median_price = _money(float(np.median(prices[priced]))) if priced.any() else "n/a"
+    median_ppsf = f"${np.median(prices[both] / sqft[both]):.0f}" if both.any() else "n/a"
+    return median_price, median_ppsf
+
+
+def comps_summary(comps: list[dict[str, Any]]) -> str:
+    """One line standing in for comps that were cut from the table."""
+    median_price, median_ppsf = _comp_medians(comps)
+    return f"+{len(comps)} more comps (less similar): median price {median_price}, median $/sqft {median_ppsf}"
+
+
+def comps_brief(comps: list[dict[str, Any]]) -> str:
+    """A listing's comps as one table cell, for prompts that compare several listings."""
+    if not comps:
+        return "no comps"
+    median_price, median_ppsf = _comp_medians(comps)
+    return f"{len(comps)} comps: median {median_price}, {median_ppsf}/sqft"
@@ -0,0 +1,62 @@
+import hashlib
+import json
+import time
+from contextlib import closing
+from typing import Any
+
+from local_store import connect
+
+DEFAULT_TTL_SECONDS = 7 * 24 * 3600
+
+
+def report_cache_key(prompt: str, model: str) -> str:
+    """Content address for an LLM report.
+
+    The prompt is a deterministic rendering of the normalized client profile, listing and comps, so
+    hashing it (with the model name) changes exactly when an input or the prompt template changes.
+    """
+    return hashlib.sha256(f"{model}\n{prompt}".encode("utf-8")).hexdigest()
+
+
+class ReportCache:
+    """Local disk cache of generated report markdown, keyed by report_cache_key, with a TTL."""
+
+    def __init__(self, ttl_seconds: int = DEFAULT_TTL_SECONDS, filename: str = "cache.db"):
+        self.ttl_seconds = ttl_seconds
+        self.filename = filename
+        with closing(connect(self.filename)) as conn, conn:
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS report_cache (
+                       key TEXT PRIMARY KEY,
+                       payload TEXT NOT NULL,
+                       expires_at REAL NOT NULL
+                   )"""
+            )
+
+    def get(self, key: str) -> dict[str, Any] | None:
+        with closing(connect(self.filename)) as conn, conn:
+            row = conn.execute("SELECT payload, expires_at FROM report_cache WHERE key = ?", (key,)).fetchone()
+            if not row:
+                return None
+            if row[1] <= time.time():
+                conn.execute("DELETE FROM report_cache WHERE key = ?", (key,))
+                return None
+        return json.loads(row[0])
+
+    def put(self, key: str, report: dict[str, Any]) -> None:
+        with closing(connect(self.filename)) as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO report_cache (key, payload, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(report), time.time() + self.ttl_seconds),
+            )
+            conn.execute("DELETE FROM report_cache WHERE expires_at <= ?", (time.time(),))
+
+
+_default_cache: ReportCache | None = None
+
+
+def get_report_cache() -> ReportCache:
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = ReportCache()
+    return _default_cache
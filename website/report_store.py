@@ -0,0 +1,106 @@
+"""Compact storage format for saved analyses.
+
+An analyses document keeps only what the favorites list shows (address, price, fit score, monthly cost) plus
+a compressed BSON blob with the rest of the listing and result. The report body lives in the reports
+collection, compressed and keyed by its SHA-256, so identical reports (e.g. a cached report saved for
+several clients) are stored once. Reports are reference-counted and removed with their last analysis.
+
+Compression is zstd when the zstandard package is installed, else gzip; each blob records which.
+"""
+import gzip
+import hashlib
+from datetime import datetime, timezone
+from typing import Any
+
+import bson
+from bson import Binary, ObjectId
+
+from database import get_reports_collection
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Bumped when the analyses document layout changes; documents without it are the original, unsplit format
+ANALYSIS_FORMAT = 2
+SUMMARY_LISTING_FIELDS = ("street", "city", "state", "price")
+SUMMARY_RESULT_FIELDS = ("fit_score", "estimated_monthly_cost")
+
+
+def compress(data: bytes) -> dict[str, Any]:
+    if zstandard is not None:
+        return {"encoding": "zstd", "data": Binary(zstandard.ZstdCompressor(level=9).compress(data))}
+    return {"encoding": "gzip", "data": Binary(gzip.compress(data, compresslevel=6))}
+
+
+def decompress(blob: dict[str, Any]) -> bytes:
+    if blob["encoding"] == "zstd":
+        if zstandard is None:
+            raise RuntimeError("This report is zstd-compressed; pip install zstandard to read it.")
+        return zstandard.ZstdDecompressor().decompress(bytes(blob["data"]))
+    return gzip.decompress(bytes(blob["data"]))
+
+
+def report_hash(markdown: str) -> str:
+    return hashlib.sha256(markdown.encode("utf-8")).hexdigest()
+
+
+def report_document(markdown: str) -> dict[str, Any]:
+    """The reports-collection fields for a body, minus the reference count."""
+    raw = markdown.encode("utf-8")
+    return {**compress(raw), "size": len(raw), "created_at": datetime.now(timezone.utc)}
+
+
+def put_report(markdown: str) -> str:
+    """Stores a report body once per distinct content and takes a reference to it; returns its id."""
+    report_id = report_hash(markdown)
+    get_reports_collection().update_one(
+        {"_id": report_id},
+        {"$setOnInsert": report_document(markdown), "$inc": {"refs": 1}},
+        upsert=True,
+    )
+    return report_id
+
+
+def get_report(report_id: str) -> str | None:
+    doc = get_reports_collection().find_one({"_id": report_id}, {"encoding": 1, "data": 1})
+    return decompress(doc).decode("utf-8") if doc else None
+
+
+def release_report(report_id: str) -> None:
+    """Drops one reference; the body is deleted with its last one (a concurrent put_report re-creates it)."""
+    reports = get_reports_collection()
+    reports.update_one({"_id": report_id}, {"$inc": {"refs": -1}})
+    reports.delete_one({"_id": report_id, "refs": {"$lte": 0}})
+
+
+def slim_analysis(realtor_id: ObjectId, client_id: ObjectId, url: str, listing: dict[str, Any],
+                  result: dict[str, Any], report_id: str, created_at: datetime,
+                  updated_at: datetime | None = None) -> dict[str, Any]:
+    """An analyses document in the compact format (the report itself must already be stored under report_id)."""
+    details = {"listing": listing, "result": {k: v for k, v in result.items() if k != "report_markdown"}}
+    return {
+        "realtor_id": realtor_id,
+        "client_id": client_id,
+        "url": url,
+        "listing": {k: listing.get(k) for k in SUMMARY_LISTING_FIELDS},
+        "result": {k: result.get(k) for k in SUMMARY_RESULT_FIELDS},
+        "report_id": report_id,
+        "details": compress(bson.encode(details)),
+        "format": ANALYSIS_FORMAT,
+        "created_at": created_at,
+        "updated_at": updated_at or created_at,
+    }
+
+
+def expand_analysis(doc: dict[str, Any]) -> dict[str, Any]:
+    """Any analyses document in the original shape: full listing and result, report_markdown included."""
+    if doc.get("format", 1) < ANALYSIS_FORMAT:
+        return doc
+    details = bson.decode(decompress(doc["details"]))
+    expanded = {k: v for k, v in doc.items() if k not in ("details", "report_id", "format")}
+    report = get_report(doc["report_id"])
+    expanded["listing"] = details["listing"]
+    expanded["result"] = {**details["result"], "report_markdown": report if report is not None else ""}
+    return expanded
@@ -0,0 +1,97 @@
+from typing import Any
+
+import numpy as np
+import pandas as pd
+
+from affordability import MortgageAssumptions, carrying_costs
+
+# Input columns and the defaults _fit_score/_monthly_budget use when a key is missing
+PROFILE_DEFAULTS = {"income": 0.0, "monthly_debt": 0.0, "savings": 0.0, "credit_score": 700}
+LISTING_DEFAULTS = {"price": 0.0, "hoa_monthly": 0.0}
+# Most points a listing can earn for matching the client's preference text (see text_index.py)
+PREFERENCE_POINTS = 10
+
+
+def client_profile(client: dict[str, Any]) -> dict[str, Any]:
+    """The financial profile of a client document, tolerating the older key names."""
+    return client.get("profile", client.get("financial_profile", client))
+
+
+def _columns(rows: list[dict[str, Any]] | pd.DataFrame, defaults: dict[str, Any]) -> dict[str, np.ndarray]:
+    frame = rows if isinstance(rows, pd.DataFrame) else pd.DataFrame(list(rows))
+    out = {}
+    for column, default in defaults.items():
+        values = frame[column] if column in frame else pd.Series(default, index=frame.index)
+        out[column] = pd.to_numeric(values, errors="coerce").fillna(default).to_numpy(dtype=float)
+    return out
+
+
+def monthly_budgets(profiles: list[dict[str, Any]] | pd.DataFrame) -> np.ndarray:
+    """Vectorized _monthly_budget: one max monthly housing budget per profile."""
+    p = _columns(profiles, PROFILE_DEFAULTS)
+    return np.maximum((p["income"] / 12 * 0.45) - p["monthly_debt"], 0)
+
+
+def fit_score_matrix(profiles: list[dict[str, Any]] | pd.DataFrame,
+                     listings: list[dict[str, Any]] | pd.DataFrame,
+                     assumptions: MortgageAssumptions | None = None,
+                     preference_match: np.ndarray | None = None) -> np.ndarray:
+    """Fit scores for every (profile, listing) pair, shape (n_profiles, n_listings).
+
+    Mirrors agent._fit_score rule for rule, with the same float operations, so each cell equals the scalar result.
+    preference_match, when given, is the (n_profiles, n_listings) 0-1 match of each listing to each client's
+    preference text.
+    """
+    p = _columns(profiles, PROFILE_DEFAULTS)
+    l = _columns(listings, LISTING_DEFAULTS)
+
+    budget = monthly_budgets(profiles)[:, None]          # (n, 1)
+    price = l["price"][None, :]                          # (1, m)
+    est_monthly = np.where(price != 0, carrying_costs(price, l["hoa_monthly"][None, :], assumptions), 0.0)
+
+    score = np.full((len(budget), price.shape[1]), 50, dtype=np.int64)
+
+    # Budget fit
+    both = (est_monthly > 0) & (budget > 0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio = np.where(both, est_monthly / np.where(budget > 0, budget, 1.0), 0.0)
+    score += np.where(both & (ratio <= 0.85), 25, 0)
+    score += np.where(both & (ratio > 0.85) & (ratio <= 1.0), 10, 0)
+    score -= np.where(both & (ratio > 1.15), 25, 0)
+    score -= np.where((est_monthly > 0) & (budget == 0), 30, 0)
+
+    # Credit score (per profile, broadcast across listings)
+    credit = np.trunc(p["credit_score"])[:, None]
+    score += np.where(credit >= 740, 15, 0)
+    score -= np.where(credit < 620, 30, np.where((credit >= 620) & (credit < 680), 10, 0))
+
+    # Savings cover a 10% down payment
+    score += np.where((price > 0) & (p["savings"][:, None] >= price * 0.1), 15, 0)
+
+    # Lifestyle match
+    if preference_match is not None:
+        score += np.rint(PREFERENCE_POINTS * np.clip(preference_match, 0.0, 1.0)).astype(np.int64)
+
+    return np.clip(score, 1, 100)
+
+
+def top_k(scores: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+    """Column indices and scores of the k best entries in each row, best first (ties keep input order)."""
+    k = min(k, scores.shape[1])
+    order = np.argsort(-scores, axis=1, kind="stable")[:, :k]
+    return order, np.take_along_axis(scores, order, axis=1)
+
+
+def rank_listings_for_client(client: dict[str, Any], listings: list[dict[str, Any]] | pd.DataFrame,
+                             k: int = 10) -> list[tuple[int, int]]:
+    """(listing index, fit score) for the client's k best listings."""
+    idx, vals = top_k(fit_score_matrix([client_profile(client)], listings), k)
+    return list(zip(idx[0].tolist(), vals[0].tolist()))
+
+
+def rank_clients_for_listing(clients: list[dict[str, Any]], listing: dict[str, Any],
+                             k: int = 10) -> list[tuple[int, int]]:
+    """(client index, fit score) for the k clients the listing suits best."""
+    scores = fit_score_matrix([client_profile(c) for c in clients], [listing]).T
+    idx, vals = top_k(scores, k)
+    return list(zip(idx[0].tolist(), vals[0].tolist()))
@@ -0,0 +1,136 @@
+"""Thread-safe gate in front of every homeharvest call.
+
+- Single-flight: identical calls already in flight are joined instead of repeated, so two sessions
+  analyzing the same city (or URL) at once cost one scrape.
+- A process-wide limit on concurrent scrapes (SCRAPE_MAX_CONCURRENCY).
+- A per-host token bucket (SCRAPE_RATE_PER_MINUTE, bursts of SCRAPE_BURST), so load from many users
+  is spread out instead of tripping upstream throttling.
+
+homeharvest pages through results with its own HTTP requests, so the rate applies per scrape call. Limits
+are per process; each job worker has its own.
+"""
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Hashable
+
+import pandas as pd
+
+from metrics import increment, observe
+from settings import get_setting
+
+DEFAULT_MAX_CONCURRENCY = 4
+DEFAULT_RATE_PER_MINUTE = 30
+DEFAULT_BURST = 5
+# Every homeharvest query goes to realtor.com
+UPSTREAM_HOST = "realtor.com"
+
+
+class SingleFlight:
+    """Runs one call per key at a time; callers arriving while it runs wait for and share its result."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: dict[Hashable, Future] = {}
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> tuple[Any, bool]:
+        """(result, shared): shared is True when the result came from another caller's call."""
+        with self._lock:
+            future = self._calls.get(key)
+            owner = future is None
+            if owner:
+                future = self._calls[key] = Future()
+        if not owner:
+            return future.result(), True
+        try:
+            future.set_result(fn())
+        except BaseException as exc:
+            future.set_exception(exc)
+        finally:
+            with self._lock:
+                del self._calls[key]
+        return future.result(), False
+
+
+class RateLimiter:
+    """Token bucket. acquire() reserves the next token and sleeps until it is due, so waiters keep their order."""
+
+    def __init__(self, rate_per_second: float, burst: int):
+        self.rate = rate_per_second
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """Blocks until a request may go out; returns the seconds waited."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait:
+            time.sleep(wait)
+        return wait
+
+
+def _freeze(value: Any) -> Hashable:
+    if isinstance(value, (list, tuple, set)):
+        return tuple(_freeze(v) for v in value)
+    if isinstance(value, str):
+        return value.strip().lower()
+    return value
+
+
+class ScrapeGate:
+    """Single-flight, concurrency limit and per-host rate limit around scrape calls (see call())."""
+
+    def __init__(self, max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+                 rate_per_minute: float = DEFAULT_RATE_PER_MINUTE, burst: int = DEFAULT_BURST):
+        self.max_concurrency = max_concurrency
+        self.rate_per_minute = rate_per_minute
+        self.burst = burst
+        self.flight = SingleFlight()
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._limiters: dict[str, RateLimiter] = {}
+        self._lock = threading.Lock()
+
+    def _limiter(self, host: str) -> RateLimiter:
+        with self._lock:
+            if host not in self._limiters:
+                self._limiters[host] = RateLimiter(self.rate_per_minute / 60, self.burst)
+            return self._limiters[host]
+
+    def _run(self, fn: Callable[..., Any], host: str, kwargs: dict[str, Any]) -> Any:
+        started = time.perf_counter()
+        with self._slots:
+            self._limiter(host).acquire()
+            # Time spent queued for a slot or a token, i.e. what the limits cost this call
+            observe("scrape_gate_wait_seconds", time.perf_counter() - started, host=host)
+            return fn(**kwargs)
+
+    def call(self, fn: Callable[..., Any], host: str = UPSTREAM_HOST, **kwargs: Any) -> Any:
+        """fn(**kwargs) through the gate. Callers that joined an in-flight call get their own copy of a frame."""
+        key = (getattr(fn, "__qualname__", repr(fn)), host,
+               tuple(sorted((k, _freeze(v)) for k, v in kwargs.items())))
+        result, shared = self.flight.do(key, lambda: self._run(fn, host, kwargs))
+        increment("scrape_calls_total", host=host, result="coalesced" if shared else "fetched")
+        return result.copy() if shared and isinstance(result, pd.DataFrame) else result
+
+
+_gate: ScrapeGate | None = None
+_gate_lock = threading.Lock()
+
+
+def get_scrape_gate() -> ScrapeGate:
+    global _gate
+    # Locked: two gates would each let identical calls through
+    with _gate_lock:
+        if _gate is None:
+            _gate = ScrapeGate(
+                max_concurrency=int(get_setting("SCRAPE_MAX_CONCURRENCY", DEFAULT_MAX_CONCURRENCY)),
+                rate_per_minute=float(get_setting("SCRAPE_RATE_PER_MINUTE", DEFAULT_RATE_PER_MINUTE)),
+                burst=int(get_setting("SCRAPE_BURST", DEFAULT_BURST)),
+            )
+        return _gate
@@ -0,0 +1,13 @@
+import os
+from typing import Any
+
+import streamlit as st
+
+
+def get_setting(name: str, default: Any = None) -> Any:
+    """Reads a setting from .streamlit/secrets.toml, falling back to the environment."""
+    try:
+        value = st.secrets.get(name)
+    except Exception:
+        value = None  # no secrets file, e.g. in the worker or benchmark processes
+    return value if value is not None else os.environ.get(name, default)
@@ -0,0 +1,245 @@
+"""In-process similarity between client preference text and listing descriptions.
+
+Uses sentence-transformers embeddings when the package is installed and PREFERENCE_EMBEDDING_MODEL names a
+model already in the local Hugging Face cache; otherwise TF-IDF (unigrams + bigrams) searched through
+per-term postings lists. Neither needs the network.
+
+Similarities are turned into a 0-1 "match" (full marks at the backend's full_match cosine), which feeds the
+fit score (scoring.PREFERENCE_POINTS) and comps ranking (comps_engine.TEXT_MATCH_WEIGHT).
+"""
+import logging
+import re
+import threading
+from collections import Counter
+from functools import lru_cache
+from typing import Any
+
+import numpy as np
+import pandas as pd
+
+from comps_store import market_key
+from settings import get_setting
+
+# Cosine similarity that counts as a full match; short preference text vs. a long description rarely goes higher
+TFIDF_FULL_MATCH = 0.3
+EMBEDDING_FULL_MATCH = 0.6
+
+_WORD = re.compile(r"[a-z]+")
+STOP_WORDS = frozenset("""
+a about all also an and any are as at be been but by can could for from has have in into is it its more most
+near no not of on or our over so such than that the their there these this to too up very was we what when
+where which while will with within would you your
+""".split())
+
+logger = logging.getLogger(__name__)
+
+
+def tokenize(text: str) -> list[str]:
+    """Lowercased words minus stop words (plurals folded), plus adjacent-word bigrams ("open floor")."""
+    words = [w[:-1] if len(w) > 3 and w.endswith("s") and not w.endswith("ss") else w
+             for w in _WORD.findall(str(text).lower()) if w not in STOP_WORDS and len(w) > 1]
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+def _postings(rows: np.ndarray, terms: np.ndarray, weights: np.ndarray, n_terms: int,
+              n_docs: int) -> tuple[np.ndarray, np.ndarray, np.ndarray, int]:
+    """Term-major (indptr, doc rows, weights, n_docs): the docs containing term t are indptr[t]:indptr[t + 1]."""
+    order = np.lexsort((rows, terms))
+    indptr = np.searchsorted(terms[order], np.arange(n_terms + 1))
+    return indptr, rows[order], weights[order], n_docs
+
+
+def _product(queries: tuple[np.ndarray, np.ndarray, np.ndarray], n_queries: int,
+             postings: tuple[np.ndarray, np.ndarray, np.ndarray, int], cols: np.ndarray) -> np.ndarray:
+    """Dot products of sparse query vectors with the docs in cols, shape (n_queries, len(cols))."""
+    q_rows, q_terms, q_weights = queries
+    indptr, d_rows, d_weights, n_docs = postings
+    out = np.zeros((n_queries, len(cols)))
+    col_of = np.full(n_docs, -1)
+    col_of[cols] = np.arange(len(cols))
+    order = np.argsort(q_terms, kind="stable")
+    terms, starts = np.unique(q_terms[order], return_index=True)
+    # One outer product per distinct query term, over the queries and docs that share it
+    for term, start, end in zip(terms, starts, [*starts[1:], len(order)]):
+        docs = col_of[d_rows[indptr[term]:indptr[term + 1]]]
+        keep = docs >= 0
+        if keep.any():
+            q = order[start:end]
+            out[np.ix_(q_rows[q], docs[keep])] += np.outer(q_weights[q], d_weights[indptr[term]:indptr[term + 1]][keep])
+    return out
+
+
+class TfidfIndex:
+    """Sublinear TF-IDF vectors, L2-normalized, so dot products are cosine similarities."""
+
+    full_match = TFIDF_FULL_MATCH
+
+    def __init__(self, texts: list[str]):
+        self.vocab: dict[str, int] = {}
+        self.size = len(texts)
+        rows, terms, counts, _ = self._count(texts, grow=True)
+        df = np.bincount(terms, minlength=len(self.vocab))
+        self.idf = np.log((1 + self.size) / (1 + df)) + 1
+        # What a term no indexed text has would get
+        self.unseen_idf = np.log(1 + self.size) + 1
+        self._postings = _postings(rows, terms, self._weights(rows, terms, counts), len(self.vocab), self.size)
+
+    def _count(self, texts: list[str],
+               grow: bool = False) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """(rows, terms, counts) of the known terms, plus each text's squared sublinear TF of unknown ones."""
+        rows, terms, counts = [], [], []
+        unseen = np.zeros(len(texts))
+        for i, text in enumerate(texts):
+            for token, count in Counter(tokenize(text)).items():
+                term = self.vocab.get(token)
+                if term is None:
+                    if not grow:
+                        # A word no indexed text has can't add to any similarity, but it is still part of the text
+                        unseen[i] += (1 + np.log(count)) ** 2
+                        continue
+                    term = self.vocab[token] = len(self.vocab)
+                rows.append(i)
+                terms.append(term)
+                counts.append(count)
+        return (np.array(rows, dtype=np.int64), np.array(terms, dtype=np.int64), np.array(counts, dtype=float),
+                unseen)
+
+    def _weights(self, rows: np.ndarray, terms: np.ndarray, counts: np.ndarray,
+                 unseen: np.ndarray | None = None) -> np.ndarray:
+        weights = (1 + np.log(counts)) * self.idf[terms]
+        squares = np.bincount(rows, weights * weights, minlength=0 if unseen is None else len(unseen))
+        if unseen is not None:
+            squares += unseen * self.unseen_idf ** 2
+        return weights / np.sqrt(squares[rows]) if len(rows) else weights
+
+    def _vectors(self, texts: list[str], full_norm: bool = False) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Sparse unit vectors over the index vocabulary. Unknown words are dropped (as for a query), or with
+        full_norm still count towards the text's length, so a text the index has barely seen isn't inflated."""
+        rows, terms, counts, unseen = self._count(texts)
+        return rows, terms, self._weights(rows, terms, counts, unseen if full_norm else None)
+
+    def similarity(self, queries: list[str], docs: np.ndarray | None = None) -> np.ndarray:
+        """Cosine similarity of each query to the indexed texts (or just the positions in docs)."""
+        cols = np.arange(self.size) if docs is None else np.asarray(docs, dtype=np.int64)
+        return _product(self._vectors(queries), len(queries), self._postings, cols)
+
+    def text_similarity(self, queries: list[str], texts: list[str]) -> np.ndarray:
+        """Cosine similarity of each query to texts that aren't in the index, weighted by the index's IDF."""
+        rows, terms, weights = self._vectors(texts, full_norm=True)
+        postings = _postings(rows, terms, weights, len(self.vocab), len(texts))
+        return _product(self._vectors(queries), len(queries), postings, np.arange(len(texts)))
+
+
+class EmbeddingIndex:
+    """Normalized sentence embeddings held as one matrix; similarity is a matrix product."""
+
+    full_match = EMBEDDING_FULL_MATCH
+
+    def __init__(self, texts: list[str], model: Any):
+        self._model = model
+        self.size = len(texts)
+        self._vectors = self._encode(texts)
+
+    def _encode(self, texts: list[str]) -> np.ndarray:
+        vectors = np.asarray(self._model.encode(list(texts), normalize_embeddings=True), dtype=float)
+        vectors = vectors.reshape(len(texts), -1)
+        # An empty text embeds to something; it shouldn't match anything
+        vectors[[not str(t).strip() for t in texts]] = 0.0
+        return vectors
+
+    def similarity(self, queries: list[str], docs: np.ndarray | None = None) -> np.ndarray:
+        vectors = self._vectors if docs is None else self._vectors[np.asarray(docs, dtype=np.int64)]
+        return self._encode(queries) @ vectors.T
+
+    def text_similarity(self, queries: list[str], texts: list[str]) -> np.ndarray:
+        return self._encode(queries) @ self._encode(texts).T
+
+
+TextIndex = TfidfIndex | EmbeddingIndex
+
+
+@lru_cache(maxsize=1)
+def _embedding_model():
+    name = str(get_setting("PREFERENCE_EMBEDDING_MODEL", "")).strip()
+    if not name:
+        return None
+    try:
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer(name, local_files_only=True)
+    except Exception as exc:
+        # Not installed, or the model isn't in the local cache: TF-IDF needs neither
+        logger.warning("embeddings unavailable (%s); using TF-IDF", exc)
+        return None
+
+
+def build_index(texts: list[str]) -> TextIndex:
+    model = _embedding_model()
+    return EmbeddingIndex(texts, model) if model is not None else TfidfIndex(texts)
+
+
+def to_match(index: TextIndex, similarity: np.ndarray) -> np.ndarray:
+    """Cosine similarity -> 0-1 match, saturating at the backend's full_match."""
+    return np.clip(similarity / index.full_match, 0.0, 1.0)
+
+
+def top_matches(index: TextIndex, query: str, k: int) -> tuple[np.ndarray, np.ndarray]:
+    """Positions and matches of the k indexed texts closest to query, best first (only ones sharing something)."""
+    match = to_match(index, index.similarity([query])[0])
+    k = min(k, int((match > 0).sum()))
+    top = np.argpartition(-match, k - 1)[:k] if 0 < k < len(match) else np.flatnonzero(match > 0)
+    top = top[np.argsort(-match[top], kind="stable")]
+    return top, match[top]
+
+
+def preference_text(client: dict[str, Any]) -> str:
+    """What the client is looking for, in their (and their realtor's) words."""
+    return " ".join(str(client.get(field) or "") for field in ("preferences", "notes")).strip()
+
+
+def descriptions(listings: list[dict[str, Any]] | pd.DataFrame) -> list[str]:
+    if isinstance(listings, pd.DataFrame):
+        column = listings["description"] if "description" in listings else pd.Series("", index=listings.index)
+        return column.fillna("").astype(str).tolist()
+    return [str(l.get("description") or "") for l in listings]
+
+
+_market_indexes: dict[str, tuple[pd.DataFrame, TextIndex]] = {}
+_lock = threading.Lock()
+
+
+def market_index(city: str, state: str, frame: pd.DataFrame) -> TextIndex:
+    """Index over a market frame's descriptions, rebuilt only when the frame is replaced (a market refresh)."""
+    market = market_key(city, state)
+    with _lock:
+        cached = _market_indexes.get(market)
+        if cached and cached[0] is frame:
+            return cached[1]
+    index = build_index(descriptions(frame))
+    with _lock:
+        _market_indexes[market] = (frame, index)
+    return index
+
+
+def preference_matches(client: dict[str, Any], listings: list[dict[str, Any]]) -> np.ndarray | None:
+    """0-1 match of each listing's description to the client's preferences (None without preference text).
+
+    Each listing is weighted by its own market's IDF when that market has been indexed; listings from markets
+    that haven't been share an index built over their own descriptions.
+    """
+    query = preference_text(client)
+    texts = descriptions(listings)
+    if not query or not any(t.strip() for t in texts):
+        return None
+    by_market: dict[str, list[int]] = {}
+    for i, listing in enumerate(listings):
+        by_market.setdefault(market_key(listing.get("city", ""), listing.get("state", "")), []).append(i)
+    with _lock:
+        indexed = {m: _market_indexes[m][1] for m in by_market if m in _market_indexes}
+    groups = [(indexed[m], rows) for m, rows in by_market.items() if m in indexed]
+    rest = [i for m, rows in by_market.items() if m not in indexed for i in rows]
+    if rest:
+        groups.append((build_index([texts[i] for i in rest]), rest))
+    matches = np.zeros(len(texts))
+    for index, rows in groups:
+        matches[rows] = to_match(index, index.text_similarity([query], [texts[i] for i in rows])[0])
+    return matches